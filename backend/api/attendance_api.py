@@ -8,12 +8,32 @@ from flask import Blueprint, request, jsonify, current_app
 from services.attendance_service import AttendanceService
 from models.building import Building
 from models.course_schedule import Course, CourseSchedule, StudentCourse
+from services.building_index import reload_building_cache
+from services.response_cache import cached_response, query_params, schedule_tags, invalidate_attendance
 from app import db
+from datetime import datetime
+from functools import wraps
+import hmac
 import time
+import pytz
 
 # 创建蓝图
 attendance_api = Blueprint('attendance_api', __name__)
 
+def admin_token_required(f):
+    """管理接口令牌校验装饰器，令牌通过请求头 X-Admin-Token 传递"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        expected = current_app.config.get('ADMIN_API_TOKEN')
+        provided = request.headers.get('X-Admin-Token', '')
+        if not expected or not hmac.compare_digest(provided, expected):
+            return jsonify({
+                'success': False,
+                'message': '无权访问管理接口'
+            }), 403
+        return f(*args, **kwargs)
+    return decorated_function
+
 @attendance_api.route('/check-in', methods=['POST'])
 def check_in():
     """
@@ -137,6 +157,16 @@ def get_location_info():
 
 
 @attendance_api.route('/student-schedule', methods=['GET'])
+@cached_response(
+    query_params(
+        'student_id', 'date', 'days',
+        student_id='2023280108',
+        date=lambda: datetime.now(pytz.timezone('Asia/Shanghai')).strftime('%Y-%m-%d'),
+        days='7'
+    ),
+    lambda params: schedule_tags(params['student_id']),
+    timeout_config='CACHE_SCHEDULE_TIMEOUT'
+)
 def get_student_schedule():
     """
     获取学生课程表信息
@@ -178,4 +208,141 @@ def get_student_schedule():
         return jsonify({
             'success': False,
             'message': f'获取学生课程表失败: {str(e)}'
-        }), 500
\ No newline at end of file
+        }), 500
+
+
+@attendance_api.route('/admin/buildings/reload', methods=['POST'])
+@admin_token_required
+def reload_buildings():
+    """
+    重新加载建筑缓存，修正建筑坐标或围栏后无需重启即可在所有工作进程生效
+    
+    请求头:
+        X-Admin-Token: 管理接口令牌
+    
+    返回:
+        重新加载后的建筑缓存信息
+    """
+    try:
+        cache_info = reload_building_cache()
+        current_app.logger.info(f"建筑缓存已重新加载: {cache_info}")
+        
+        return jsonify({
+            'success': True,
+            'message': '建筑缓存已重新加载',
+            'data': cache_info
+        }), 200
+        
+    except Exception as e:
+        current_app.logger.error(f"重新加载建筑缓存失败: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': f'重新加载建筑缓存失败: {str(e)}'
+        }), 500
+
+
+@attendance_api.route('/admin/attendance/<int:attendance_id>/status', methods=['POST'])
+@admin_token_required
+def correct_attendance_status(attendance_id):
+    """
+    更正签到记录的状态（每日签到汇总在同一事务中随之更新）
+    
+    请求头:
+        X-Admin-Token: 管理接口令牌
+    
+    请求体:
+        {"status": "attended" | "late" | "absent"}
+    
+    返回:
+        更正后的签到记录
+    """
+    from app import Attendance
+    from services.statistics_service import STATUSES
+    
+    data = request.get_json(silent=True) or {}
+    status = data.get('status')
+    if status not in STATUSES:
+        return jsonify({
+            'success': False,
+            'message': f"状态必须为 {', '.join(STATUSES)} 之一"
+        }), 400
+    
+    attendance = db.session.get(Attendance, attendance_id)
+    if attendance is None:
+        return jsonify({
+            'success': False,
+            'message': '签到记录不存在'
+        }), 404
+    
+    try:
+        previous = attendance.status
+        attendance.status = status
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"更正签到状态失败: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': f'更正签到状态失败: {str(e)}'
+        }), 500
+    
+    invalidate_attendance([(attendance.user.student_id if attendance.user else None, attendance.signed_at)])
+    current_app.logger.info(f"签到记录 {attendance_id} 状态已更正: {previous} -> {status}")
+    return jsonify({
+        'success': True,
+        'message': '签到状态已更正',
+        'data': attendance.to_dict()
+    }), 200
+
+
+@attendance_api.route('/admin/admission', methods=['GET'])
+@admin_token_required
+def admission_stats():
+    """
+    获取本工作进程的请求准入控制计数
+    
+    请求头:
+        X-Admin-Token: 管理接口令牌
+    
+    返回:
+        各接口类别的准入、限速、排队已满、排队超时次数，以及当前并发与排队数
+    """
+    from services import admission
+    
+    if admission.admission_controller is None:
+        return jsonify({
+            'success': False,
+            'message': '未开启请求准入控制'
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        'data': admission.admission_controller.stats()
+    }), 200
+
+
+@attendance_api.route('/admin/cache', methods=['GET'])
+@admin_token_required
+def response_cache_stats():
+    """
+    获取读接口响应缓存的命中统计（计数为本工作进程的）
+    
+    请求头:
+        X-Admin-Token: 管理接口令牌
+    
+    返回:
+        缓存类型、条目数，以及各接口的命中、未命中、过期次数与命中率
+    """
+    from services.response_cache import get_response_cache
+    
+    cache = get_response_cache()
+    if cache is None:
+        return jsonify({
+            'success': False,
+            'message': '未开启响应缓存'
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        'data': cache.stats()
+    }), 200
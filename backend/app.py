@@ -5,7 +5,7 @@
 使用Flask框架构建RESTful API
 """
 
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.utils import secure_filename
@@ -16,7 +16,8 @@ import json
 import logging
 from functools import wraps
 from wechat_api import get_wechat_api
-from config import get_config
+from config import get_config, UPLOAD_CONFIG
+from services.response_cache import cached_response, query_params, attendance_tags, months_between
 
 # 创建Flask应用
 app = Flask(__name__)
@@ -27,6 +28,19 @@ app.config.from_object(config_class)
 
 # 初始化扩展
 db = SQLAlchemy(app)
+
+# pysqlite不把SAVEPOINT视为事务开始，事务首条语句为SAVEPOINT时RELEASE会直接提交，
+# 外层回滚失效（签到日志批量落库依赖外层回滚）；此时先显式BEGIN。
+# 其他语句仍由pysqlite按需开启事务，只读查询不会一直持有共享锁
+with app.app_context():
+    if db.engine.dialect.name == 'sqlite':
+        from sqlalchemy import event
+
+        @event.listens_for(db.engine, 'savepoint')
+        def _sqlite_savepoint(connection, name):
+            if not connection.connection.dbapi_connection.in_transaction:
+                connection.exec_driver_sql('BEGIN')
+
 # 配置CORS以支持ngrok等穿透工具
 CORS(app, origins=['*'], allow_headers=['*'], methods=['*'])
 
@@ -40,6 +54,14 @@ app.register_blueprint(cas_api, url_prefix='/cas')
 from cas_auth import init_cas_client
 init_cas_client(app)
 
+# 请求准入控制
+from services.admission import init_admission_control
+init_admission_control(app)
+
+# JSON序列化（已安装orjson时使用orjson）
+from utils.json_provider import init_json_provider
+init_json_provider(app)
+
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -99,10 +121,21 @@ class Attendance(db.Model):
     longitude = db.Column(db.Float, nullable=True)
     location_address = db.Column(db.String(200), nullable=True)
     photo_path = db.Column(db.String(200), nullable=True)
+    thumbnail_path = db.Column(db.String(200), nullable=True)
+    photo_status = db.Column(db.String(20), nullable=True)  # pending, ready, failed，为空表示没有照片
+    photo_source = db.Column(db.String(200), nullable=True)  # 待处理照片的来源（上传的照片引用或企业微信serverId），处理完成后清空
     status = db.Column(db.String(20), default='attended')  # attended, late, absent
+    request_key = db.Column(db.String(64), unique=True, nullable=True)  # 签到请求键，用于识别重复提交
     signed_at = db.Column(db.DateTime, default=datetime.utcnow)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # 签到记录列表按 (signed_at, id) 倒序游标分页
+    __table_args__ = (
+        db.Index('idx_attendance_signed_at_id', 'signed_at', 'id'),
+        db.Index('idx_attendance_user_signed_at', 'user_id', 'signed_at', 'id'),
+        db.Index('idx_attendance_photo_status', 'photo_status'),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -115,6 +148,9 @@ class Attendance(db.Model):
             'longitude': self.longitude,
             'location_address': self.location_address,
             'photo_path': self.photo_path,
+            'photo_url': f'/api/uploads/{self.photo_path}' if self.photo_path else None,
+            'thumbnail_url': f'/api/uploads/{self.thumbnail_path}' if self.thumbnail_path else None,
+            'photo_status': self.photo_status,
             'status': self.status,
             'signed_at': self.signed_at.isoformat() if self.signed_at else None,
             'created_at': self.created_at.isoformat() if self.created_at else None
@@ -252,18 +288,79 @@ def get_wechat_userinfo():
             'message': f'获取用户信息失败: {str(e)}'
         }), 500
 
+def _signin_replay(data):
+    """重放已完成签到的响应"""
+    logger.info(f"重复签到请求，重放签到记录 {data['attendance_id']} 的响应")
+    response = jsonify({
+        'success': True,
+        'message': '签到成功',
+        'data': data
+    })
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+def _recent_natural_signin(student_id, course_name, signed_at):
+    """
+    没有幂等键时，自然请求键按固定时间窗口划分；跨窗口边界的重试按上一窗口内的签到去重
+    （两次签到相隔不超过 SIGNIN_DEDUP_WINDOW_SECONDS 时视为重复）
+
+    签到日志模式下不访问主数据库，上一窗口的签到已由其他进程写入主数据库时无法识别，
+    此时只有幂等键（Idempotency-Key 或 request_key）能保证去重
+    """
+    from services.signin_idempotency import previous_window_key, get_replay_cache
+    from services.signin_journal import get_signin_journal
+    
+    key = previous_window_key(student_id, course_name, signed_at)
+    replay_cache = get_replay_cache()
+    data = replay_cache.get(key)
+    if data is None:
+        signin_journal = get_signin_journal()
+        if signin_journal is not None:
+            data = signin_journal.find_response(key)
+        else:
+            data = replay_cache.find_existing(key)
+    if data is None:
+        return None
+    window = app.config.get('SIGNIN_DEDUP_WINDOW_SECONDS', 600)
+    if (signed_at - datetime.fromisoformat(data['signed_at'])).total_seconds() > window:
+        return None
+    return data
+
 @app.route('/signin', methods=['POST'])
 @handle_errors
 def signin():
-    """签到接口 - 兼容前端调用"""
+    """签到接口 - 兼容前端调用（JSON，或照片以文件上传的multipart/form-data）"""
+    from services.signin_upload import (
+        parse_signin_upload, is_upload_reference, discard_incoming_photo, UnsupportedPhoto
+    )
+    from services.photo_store import PhotoTooLarge
+    from werkzeug.exceptions import RequestEntityTooLarge
+    photo = None
+    photo_accepted = False
     try:
         # 获取请求参数
-        data = request.get_json()
+        if request.mimetype == 'multipart/form-data':
+            # 照片部分在解析时直接写入incoming目录
+            try:
+                data, photo = parse_signin_upload()
+            except PhotoTooLarge as e:
+                return jsonify({'success': False, 'message': str(e)}), 413
+            except RequestEntityTooLarge:
+                return jsonify({'success': False, 'message': '上传数据超过大小上限'}), 413
+            except UnsupportedPhoto as e:
+                return jsonify({'success': False, 'message': str(e)}), 415
+        else:
+            data = request.get_json()
+        if photo is None:
+            photo = data.get('photo')
+            if is_upload_reference(photo):
+                # 照片引用只能由本次上传产生，不能引用（或删除）其他请求上传的照片
+                photo = None
+                return jsonify({'success': False, 'message': '照片数据无效'}), 400
         student_id = data.get('student_id')
         name = data.get('name')
         course_name = data.get('course_name')
         classroom = data.get('classroom')
-        photo = data.get('photo')
         latitude = data.get('latitude')
         longitude = data.get('longitude')
         location_address = data.get('location_address')
@@ -284,70 +381,38 @@ def signin():
                 'message': '缺少位置信息'
             }), 400
         
-        # 查找或创建用户
-        user = User.query.filter_by(student_id=student_id).first()
-        if not user:
-            user = User(
-                student_id=student_id,
-                name=name,
-                wechat_userid=wechat_userid
-            )
-            db.session.add(user)
-            db.session.commit()
+        # 重复提交（网络重试等）直接重放第一次签到的响应
+        from services.signin_idempotency import make_request_key, response_data, get_replay_cache
+        signed_at = datetime.now()
+        idempotency_key = request.headers.get('Idempotency-Key') or data.get('request_key')
+        request_key = make_request_key(student_id, idempotency_key, course_name, signed_at)
+        replay_cache = get_replay_cache()
+        replayed = replay_cache.get(request_key)
+        if replayed is None and not idempotency_key:
+            replayed = _recent_natural_signin(student_id, course_name, signed_at)
+        if replayed is not None:
+            return _signin_replay(replayed)
         
-        # 处理照片上传
-        photo_path = None
-        if photo:
+        # 查找或创建用户（缓存命中时不访问数据库，并发首次签到不会冲突）
+        # 签到日志模式下不访问主数据库，由日志写入线程补全用户ID
+        from services.user_service import UserService, UserConflict
+        from services.signin_journal import get_signin_journal, JournalFull
+        signin_journal = get_signin_journal()
+        if signin_journal is not None:
+            user_id = UserService.cached_user_id(student_id)
+        else:
             try:
-                # 如果是base64数据
-                if photo.startswith('data:image/'):
-                    import base64
-                    import io
-                    from PIL import Image
-                    
-                    # 解析base64数据
-                    header, data = photo.split(',', 1)
-                    image_data = base64.b64decode(data)
-                    
-                    # 生成文件名
-                    filename = f"signin_{student_id}_{int(datetime.now().timestamp())}.jpg"
-                    # 使用正斜杠分隔符，确保URL路径正确
-                    photo_path = f"photos/{filename}"
-                    full_path = os.path.join(app.config['UPLOAD_FOLDER'], photo_path)
-                    
-                    # 保存图片
-                    with open(full_path, 'wb') as f:
-                        f.write(image_data)
-                        
-                    logger.info(f"照片已保存: {full_path}")
-                elif len(photo) > 10 and not photo.startswith('http'):
-                    # 企业微信serverId格式，通过企业微信API下载
-                    try:
-                        wechat_api = get_wechat_api()
-                        image_data = wechat_api.download_media(photo)
-                        
-                        if image_data:
-                            # 生成文件名
-                            filename = f"signin_{student_id}_{int(datetime.now().timestamp())}.jpg"
-                            # 使用正斜杠分隔符，确保URL路径正确
-                            photo_path = f"photos/{filename}"
-                            full_path = os.path.join(app.config['UPLOAD_FOLDER'], photo_path)
-                            
-                            # 保存图片
-                            with open(full_path, 'wb') as f:
-                                f.write(image_data)
-                                
-                            logger.info(f"企业微信照片已保存: {full_path}")
-                        else:
-                            logger.warning(f"无法从企业微信下载照片: {photo}")
-                    except Exception as wechat_error:
-                        logger.error(f"企业微信照片下载失败: {wechat_error}")
-                else:
-                    # 其他格式的照片数据，暂时记录但不处理
-                    logger.info(f"收到照片数据: {photo[:50]}...")
-            except Exception as e:
-                logger.error(f"照片处理失败: {e}")
-                # 继续签到流程，不因照片失败而中断
+                user_id = UserService.get_or_create_user_id(student_id, name, wechat_userid)
+            except UserConflict as e:
+                logger.warning(f"签到用户冲突: {e}")
+                return jsonify({'success': False, 'message': str(e)}), 409
+        
+        # 照片由后台线程处理，签到记录先以待处理状态提交
+        from services.photo_pipeline import is_supported_photo, photo_source, PHOTO_PENDING
+        has_photo = is_supported_photo(photo)
+        if photo and not has_photo:
+            # 其他格式的照片数据，暂时记录但不处理
+            logger.info(f"收到照片数据: {photo[:50]}...")
         
         # 计算详细的位置信息
         from utils.language_utils import format_location_info, format_unknown_location
@@ -375,31 +440,90 @@ def signin():
                 detailed_location_address = location_address or format_unknown_location(language)
 
         # 创建签到记录
-        attendance = Attendance(
-            user_id=user.id,
+        values = dict(
+            user_id=user_id,
             course_name=course_name,
             classroom=classroom,
             latitude=float(latitude),
             longitude=float(longitude),
             location_address=detailed_location_address,
-            photo_path=photo_path,
+            photo_status=PHOTO_PENDING if has_photo else None,
+            photo_source=photo_source(photo),
             status='attended',  # 默认为出席
-            signed_at=datetime.now()
+            signed_at=signed_at,
+            request_key=request_key
         )
         
-        db.session.add(attendance)
-        db.session.commit()
+        if signin_journal is not None:
+            # 写入本地日志即返回，签到记录ID在写入主数据库后才有
+            student = {'student_id': student_id, 'name': name, 'wechat_userid': wechat_userid}
+            try:
+                journal_id, original = signin_journal.append(
+                    request_key, values, student, photo if has_photo else None
+                )
+            except JournalFull as e:
+                logger.warning(f"签到日志积压，拒绝签到: {e}")
+                response = jsonify({'success': False, 'message': '服务繁忙，请稍后重试'})
+                response.status_code = 503
+                response.headers['Retry-After'] = str(app.config.get('ADMISSION_RETRY_AFTER', 1))
+                return response
+            
+            if original is not None:
+                # 重复提交：重放第一次签到的响应，不用本次请求的时间、位置覆盖
+                replay_cache.remember(request_key, original)
+                return _signin_replay(original)
+            
+            values['id'] = None
+            result = dict(response_data(values), journal_id=journal_id)
+            replay_cache.remember(request_key, result)
+            photo_accepted = has_photo
+            
+            logger.info(f"用户 {name}({student_id}) 签到已写入日志: {course_name} - {classroom}")
+            return jsonify({
+                'success': True,
+                'message': '签到成功',
+                'data': result
+            })
+        
+        from sqlalchemy.exc import IntegrityError
+        from services.attendance_writer import get_attendance_writer
+        attendance_writer = get_attendance_writer()
+        try:
+            if attendance_writer is not None:
+                # 组提交模式：与同一时间窗口内的其他签到合并为一个事务写入
+                # 等待前先归还本请求的数据库连接，避免高峰时请求线程占满连接池而写入线程取不到连接
+                db.session.close()
+                attendance_id = attendance_writer.write(values, app.config.get('ATTENDANCE_GROUP_COMMIT_TIMEOUT'))
+            else:
+                attendance = Attendance(**values)
+                db.session.add(attendance)
+                db.session.commit()
+                attendance_id = attendance.id
+        except IntegrityError:
+            # 请求键唯一索引冲突：其他进程或并发请求已完成同一签到
+            db.session.rollback()
+            replayed = replay_cache.find_existing(request_key)
+            if replayed is None:
+                raise
+            return _signin_replay(replayed)
+        
+        values['id'] = attendance_id
+        replay_cache.remember(request_key, response_data(values))
+        
+        from services.response_cache import invalidate_attendance
+        invalidate_attendance([(student_id, signed_at)])
+        
+        if has_photo:
+            from services.photo_pipeline import get_photo_pipeline
+            photo_accepted = True
+            get_photo_pipeline().submit(attendance_id, student_id, photo)
         
         logger.info(f"用户 {name}({student_id}) 签到成功: {course_name} - {classroom}")
         
         return jsonify({
             'success': True,
             'message': '签到成功',
-            'data': {
-                'attendance_id': attendance.id,
-                'status': attendance.status,
-                'signed_at': attendance.signed_at.isoformat()
-            }
+            'data': response_data(values)
         })
         
     except Exception as e:
@@ -409,6 +533,10 @@ def signin():
             'success': False,
             'message': f'签到失败: {str(e)}'
         }), 500
+    finally:
+        # 未被签到记录引用的上传照片（参数错误、重复提交、写入失败等）不再需要
+        if is_upload_reference(photo) and not photo_accepted:
+            discard_incoming_photo(photo)
 
 
 
@@ -418,119 +546,80 @@ def signin():
 
 @app.route('/api/attendance/records', methods=['GET'])
 @handle_errors
+@cached_response(
+    query_params('student_id', 'status', 'start_date', 'end_date', 'cursor', 'page', 'per_page', 'exact_total'),
+    lambda params: attendance_tags(
+        params.get('student_id'), months_between(params.get('start_date'), params.get('end_date'))
+    )
+)
 def get_attendance_records():
-    """获取签到记录"""
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 10, type=int)
-    student_id = request.args.get('student_id')
-    status = request.args.get('status')
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
-    
-    # 构建查询
-    query = Attendance.query.join(User)
-    
-    if student_id:
-        query = query.filter(User.student_id == student_id)
-    
-    if status and status != 'all':
-        query = query.filter(Attendance.status == status)
-    
-    if start_date:
-        try:
-            start_date = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
-            query = query.filter(Attendance.signed_at >= start_date)
-        except ValueError:
-            pass
-    
-    if end_date:
-        try:
-            end_date = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
-            query = query.filter(Attendance.signed_at <= end_date)
-        except ValueError:
-            pass
-    
-    # 按时间倒序排列
-    query = query.order_by(Attendance.signed_at.desc())
+    """获取签到记录（游标分页：传入上一页返回的 cursor 取下一页；exact_total=true 时返回精确总数）"""
+    from services.record_service import RecordService, InvalidCursor
     
-    # 分页
-    pagination = query.paginate(
-        page=page, per_page=per_page, error_out=False
+    page = request.args.get('page', 1, type=int)
+    per_page = request.args.get('per_page', app.config['DEFAULT_PAGE_SIZE'], type=int)
+    cursor = request.args.get('cursor')
+    exact_total = request.args.get('exact_total', 'false').lower() == 'true'
+    
+    filters, join_user = RecordService.build_filters(
+        student_id=request.args.get('student_id'),
+        status=request.args.get('status'),
+        start_date=request.args.get('start_date'),
+        end_date=request.args.get('end_date')
     )
     
-    records = [record.to_dict() for record in pagination.items]
+    try:
+        records, pagination = RecordService.list_records(
+            filters, join_user, per_page, cursor=cursor, page=page, exact_total=exact_total
+        )
+    except InvalidCursor as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     
     return jsonify({
         'success': True,
         'data': {
             'records': records,
-            'pagination': {
-                'page': page,
-                'per_page': per_page,
-                'total': pagination.total,
-                'pages': pagination.pages,
-                'has_prev': pagination.has_prev,
-                'has_next': pagination.has_next
-            }
+            'pagination': pagination
         }
     })
 
+def _statistics_cache_params(args):
+    """统计接口的缓存参数，流式附带每日记录的响应不缓存"""
+    if args.get('include_records', 'false').lower() == 'true':
+        return None
+    return {
+        'student_id': args.get('student_id') or '',
+        'year': args.get('year', datetime.utcnow().year, type=int),
+        'month': args.get('month', datetime.utcnow().month, type=int)
+    }
+
 @app.route('/api/attendance/statistics', methods=['GET'])
 @handle_errors
+@cached_response(
+    _statistics_cache_params,
+    lambda params: attendance_tags(params['student_id'], [f"{params['year']:04d}-{params['month']:02d}"])
+)
 def get_attendance_statistics():
-    """获取签到统计"""
+    """获取签到统计（include_records=true 时以流式响应附带每日签到记录 daily_records）"""
+    from services.statistics_service import StatisticsService
+    
     student_id = request.args.get('student_id')
     year = request.args.get('year', datetime.utcnow().year, type=int)
     month = request.args.get('month', datetime.utcnow().month, type=int)
+    include_records = request.args.get('include_records', 'false').lower() == 'true'
     
-    # 构建查询
-    query = Attendance.query.join(User)
+    # 一条按 (日期, 状态) 分组的聚合查询
+    summary = StatisticsService.month_summary(year, month, student_id)
     
-    if student_id:
-        query = query.filter(User.student_id == student_id)
-    
-    # 按年月筛选
-    start_date = datetime(year, month, 1)
-    if month == 12:
-        end_date = datetime(year + 1, 1, 1)
-    else:
-        end_date = datetime(year, month + 1, 1)
-    
-    query = query.filter(
-        Attendance.signed_at >= start_date,
-        Attendance.signed_at < end_date
-    )
-    
-    # 统计各种状态的数量
-    total_count = query.count()
-    attended_count = query.filter(Attendance.status == 'attended').count()
-    late_count = query.filter(Attendance.status == 'late').count()
-    absent_count = query.filter(Attendance.status == 'absent').count()
-    
-    # 计算出勤率
-    attendance_rate = (attended_count / total_count * 100) if total_count > 0 else 0
-    
-    # 获取每日签到情况
-    daily_records = {}
-    records = query.all()
-    for record in records:
-        day = record.signed_at.day
-        if day not in daily_records:
-            daily_records[day] = []
-        daily_records[day].append(record.to_dict())
+    if include_records:
+        return Response(
+            stream_with_context(StatisticsService.stream_with_daily_records(summary, student_id)),
+            mimetype='application/json'
+        )
     
     return jsonify({
         'success': True,
-        'data': {
-            'year': year,
-            'month': month,
-            'total_count': total_count,
-            'attended_count': attended_count,
-            'late_count': late_count,
-            'absent_count': absent_count,
-            'attendance_rate': round(attendance_rate, 1),
-            'daily_records': daily_records
-        }
+        'data': summary
     })
 
 @app.route('/api/feedback/upload', methods=['POST'])
@@ -551,15 +640,24 @@ def upload_feedback_image():
         }), 400
     
     if file and allowed_file(file.filename):
-        # 生成唯一文件名
         filename = secure_filename(file.filename)
-        file_ext = filename.rsplit('.', 1)[1].lower()
-        unique_filename = f"{uuid.uuid4().hex}.{file_ext}"
+        # secure_filename会去掉中文等字符，扩展名以原始文件名为准
+        file_ext = file.filename.rsplit('.', 1)[1].lower()
         
-        # 保存到 uploads/feedback 目录
-        feedback_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'feedback')
-        file_path = os.path.join(feedback_dir, unique_filename)
-        file.save(file_path)
+        # 按内容哈希存入 uploads/feedback，相同图片只保存一份
+        from services.photo_store import get_photo_store, PhotoTooLarge
+        store = get_photo_store('feedback')
+        writer = store.open_writer(file_ext, UPLOAD_CONFIG['max_file_size'])
+        try:
+            with writer:
+                for chunk in iter(lambda: file.stream.read(64 * 1024), b''):
+                    writer.write(chunk)
+        except PhotoTooLarge:
+            return jsonify({
+                'success': False,
+                'message': '文件过大'
+            }), 413
+        unique_filename = writer.key
         
         return jsonify({
             'success': True,
@@ -640,6 +738,18 @@ def create_tables():
         db.create_all()
         logger.info("数据库表创建完成")
 
+# 每日签到汇总随签到记录的ORM写入在同一事务中维护
+from services.attendance_rollup import init_attendance_rollup
+init_attendance_rollup(app)
+
+# 签到本地日志（开启时启动后台写入线程，并重放上次未写入主数据库的签到）
+from services.signin_journal import init_signin_journal
+init_signin_journal(app)
+
+# 待处理照片恢复（重新提交进程退出时未处理完的照片，清理incoming目录中的孤立文件）
+from services.photo_pipeline import init_photo_recovery
+init_photo_recovery(app)
+
 # 注意：请使用 run.py 启动应用
 # 开发环境: python run.py
 # 生产环境: python run.py --production
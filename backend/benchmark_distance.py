@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+距离算法基准测试与精度报告
+以深大真实建筑坐标为基准，比较 geodesic / haversine / equirectangular 三种算法的
+耗时与误差（以geodesic为真值），用于选择 DISTANCE_STRATEGY
+
+使用方法:
+    python benchmark_distance.py [每栋建筑的采样点数] [随机种子]
+"""
+
+import sys
+import os
+import time
+import random
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from geopy.distance import geodesic
+from app import app
+from models.building import SZU_BUILDINGS
+from utils.geo_utils import DISTANCE_STRATEGIES
+
+# 采样点到建筑的最大距离（米），覆盖签到判定所用的阈值
+MAX_OFFSET_METERS = 300
+# 统计有效性判定差异时使用的阈值（米），与签到逻辑一致
+VALIDITY_THRESHOLDS = (100, 200)
+
+
+def generate_samples(samples_per_building, seed):
+    """在每栋建筑周围按随机方位和距离生成采样点，返回 [(lat, lon), ...]"""
+    rng = random.Random(seed)
+    points = []
+    for building in SZU_BUILDINGS:
+        origin = (building['latitude'], building['longitude'])
+        for _ in range(samples_per_building):
+            destination = geodesic(meters=rng.uniform(0, MAX_OFFSET_METERS)).destination(
+                origin, rng.uniform(0, 360)
+            )
+            points.append((destination.latitude, destination.longitude))
+    return points
+
+
+def nearest(distance, lat, lon):
+    """线性扫描求最近建筑，返回 (建筑序号, 距离)"""
+    best_index, best_distance = None, float('inf')
+    for index, building in enumerate(SZU_BUILDINGS):
+        d = distance(lat, lon, building['latitude'], building['longitude'])
+        if d < best_distance:
+            best_index, best_distance = index, d
+    return best_index, best_distance
+
+
+def percentile(sorted_values, fraction):
+    """已排序列表的分位数"""
+    if not sorted_values:
+        return 0.0
+    position = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[position]
+
+
+def run_benchmark(samples_per_building=200, seed=20251017):
+    """运行基准测试并打印Markdown格式的报告"""
+    points = generate_samples(samples_per_building, seed)
+    pairs = [
+        (lat, lon, building['latitude'], building['longitude'])
+        for lat, lon in points
+        for building in SZU_BUILDINGS
+    ]
+
+    print(f"建筑数: {len(SZU_BUILDINGS)}，采样点数: {len(points)}，距离计算对数: {len(pairs)}")
+    print(f"采样范围: 建筑中心 0-{MAX_OFFSET_METERS} 米，随机种子: {seed}")
+    print()
+
+    # 以测地线距离为真值
+    reference = DISTANCE_STRATEGIES['geodesic']
+    truth = [reference(*pair) for pair in pairs]
+    truth_nearest = [nearest(reference, lat, lon) for lat, lon in points]
+
+    print("| 算法 | 单次耗时(μs) | 相对geodesic加速 | 最大绝对误差(m) | P99绝对误差(m) "
+          "| 最大相对误差 | ≤200m最大误差(m) | 最近建筑不一致 | 100m判定翻转 | 200m判定翻转 |")
+    print("|---|---|---|---|---|---|---|---|---|---|")
+
+    baseline_us = None
+    for name, distance in DISTANCE_STRATEGIES.items():
+        started = time.perf_counter()
+        values = [distance(*pair) for pair in pairs]
+        elapsed_us = (time.perf_counter() - started) / len(pairs) * 1e6
+        if baseline_us is None:
+            baseline_us = elapsed_us
+
+        errors = sorted(abs(value - expected) for value, expected in zip(values, truth))
+        relative = max(
+            (abs(value - expected) / expected for value, expected in zip(values, truth) if expected > 0),
+            default=0.0
+        )
+        near_errors = [
+            abs(value - expected) for value, expected in zip(values, truth) if expected <= 200
+        ]
+
+        mismatched = 0
+        flipped = {threshold: 0 for threshold in VALIDITY_THRESHOLDS}
+        for (lat, lon), (true_index, true_distance) in zip(points, truth_nearest):
+            index, d = nearest(distance, lat, lon)
+            if index != true_index:
+                mismatched += 1
+            for threshold in VALIDITY_THRESHOLDS:
+                if (d <= threshold) != (true_distance <= threshold):
+                    flipped[threshold] += 1
+
+        print(f"| {name} | {elapsed_us:.2f} | {baseline_us / elapsed_us:.0f}x | {errors[-1]:.4f} "
+              f"| {percentile(errors, 0.99):.4f} | {relative:.4%} | {max(near_errors, default=0.0):.4f} "
+              f"| {mismatched}/{len(points)} | {flipped[100]}/{len(points)} | {flipped[200]}/{len(points)} |")
+
+
+if __name__ == '__main__':
+    samples = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 20251017
+    run_benchmark(samples, seed)
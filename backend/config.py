@@ -51,18 +51,110 @@ class Config:
     # 分页配置
     DEFAULT_PAGE_SIZE = 10
     MAX_PAGE_SIZE = 100
+    RECORDS_COUNT_CACHE_SECONDS = 60  # 签到记录列表总数的缓存时间（秒），exact_total=true 时重新计数
+    RECORDS_COUNT_CACHE_SIZE = 1024   # 缓存的查询条件数
+    FAST_JSON_ENABLED = True          # 已安装orjson时用orjson序列化响应
+    # 统计读取每日签到汇总表；已有签到记录的部署需先执行 schema_upgrade.sql 中的回填或 python run.py rebuild-rollup 再开启
+    STATISTICS_FROM_ROLLUP = os.environ.get('STATISTICS_FROM_ROLLUP', 'false').lower() == 'true'
     
     # 签到配置
     SIGN_IN_START_TIME = '07:00'  # 签到开始时间
     SIGN_IN_END_TIME = '18:00'    # 签到结束时间
     LATE_THRESHOLD_MINUTES = 15   # 迟到阈值（分钟）
     
+    # 学期校历配置，未配置学期时不按周次过滤课程
+    SEMESTER_CALENDAR = {
+        # 学期：start_date为第1周的周一，weeks为教学周数
+        'semesters': [
+            # {'name': '2025-2026-1', 'start_date': '2025-09-08', 'weeks': 20},
+        ],
+        # 调整日期：follows为空表示当天停课，否则当天按follows日期的课表上课（调休补课）
+        'overrides': [
+            # {'date': '2025-10-01', 'follows': None},
+            # {'date': '2025-09-28', 'follows': '2025-10-03'},
+        ]
+    }
+    
     # 地理位置配置
     LOCATION_RADIUS_METERS = 50000  # 签到有效范围（米）
+    # 距离算法：geodesic（椭球测地线）、haversine（球面）、equirectangular（局部投影）
+    # 各算法的误差与耗时对比见 DISTANCE_BENCHMARK.md
+    DISTANCE_STRATEGY = os.environ.get('DISTANCE_STRATEGY') or 'geodesic'
+    # 建筑未设置围栏（radius/polygon）时使用的默认半径（米）
+    GEOFENCE_DEFAULT_RADIUS_METERS = 200  # 最近建筑的位置有效性判断
+    CHECK_IN_RADIUS_METERS = 100          # 课程签到的位置判断
+    
+    # 建筑缓存配置
+    # 重新加载时写入版本戳文件，各工作进程检查到变化后刷新缓存
+    BUILDING_CACHE_STAMP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'building_cache.stamp')
+    BUILDING_CACHE_CHECK_INTERVAL = 1.0  # 检查版本戳的最小间隔（秒）
+    
+    # 学生课表缓存配置
+    TIMETABLE_CACHE_SIZE = 20000  # 最多缓存的学生课表数
+    TIMETABLE_CACHE_STAMP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'timetable_cache.stamp')
+    TIMETABLE_CACHE_CHECK_INTERVAL = 1.0  # 检查版本戳的最小间隔（秒）
+    
+    # 学号到用户ID的进程内缓存
+    USER_CACHE_SIZE = 50000
+    
+    # 签到幂等：没有幂等键时，同一学生同一课程在同一时间窗口内的签到视为重复提交
+    SIGNIN_DEDUP_WINDOW_SECONDS = 600
+    SIGNIN_REPLAY_CACHE_SIZE = 10000  # 缓存的近期签到响应数
+    
+    # 签到照片后台处理配置
+    PHOTO_WORKERS = int(os.environ.get('PHOTO_WORKERS', 4))  # 处理线程数，为0时在请求线程中处理
+    PHOTO_QUEUE_SIZE = 200  # 最多排队的照片数，超出时在请求线程中处理
+    PHOTO_RECOVERY_INTERVAL = 600  # 恢复未处理完的照片、清理孤立上传文件的间隔（秒），为0时不启动
+    PHOTO_RECOVERY_MIN_AGE = 900   # 超过该时间（秒）仍待处理的签到记录与incoming文件才会被恢复或清理
+    
+    # 签到记录组提交：把几毫秒内的签到合并为一个事务写入，默认关闭
+    ATTENDANCE_GROUP_COMMIT = os.environ.get('ATTENDANCE_GROUP_COMMIT', 'false').lower() == 'true'
+    ATTENDANCE_GROUP_COMMIT_WINDOW_MS = 5     # 收集同一批记录的时间窗口（毫秒）
+    ATTENDANCE_GROUP_COMMIT_MAX_BATCH = 200   # 每批最多记录数
+    ATTENDANCE_GROUP_COMMIT_TIMEOUT = 10      # 请求等待写入结果的最长时间（秒）
+    
+    # 签到本地日志：签到先写入本地SQLite日志即返回，由后台线程写入主数据库，默认关闭
+    SIGNIN_JOURNAL_ENABLED = os.environ.get('SIGNIN_JOURNAL_ENABLED', 'false').lower() == 'true'
+    SIGNIN_JOURNAL_PATH = os.environ.get('SIGNIN_JOURNAL_PATH') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'signin_journal.db')
+    SIGNIN_JOURNAL_MAX_PENDING = 10000       # 待写入主数据库的签到数上限，超出时返回503
+    SIGNIN_JOURNAL_BATCH_SIZE = 200          # 每个事务写入的签到数
+    SIGNIN_JOURNAL_RETRY_MAX_SECONDS = 30    # 主数据库不可用时重试间隔的上限（秒）
+    SIGNIN_JOURNAL_MAX_ATTEMPTS = 5          # 单条记录写入失败达到该次数后移入死信表（约束冲突等数据错误直接移入）
+    
+    # 请求准入控制（每个工作进程独立计数）
+    ADMISSION_CONTROL_ENABLED = os.environ.get('ADMISSION_CONTROL_ENABLED', 'true').lower() == 'true'
+    ADMISSION_MAX_CONCURRENCY = 32  # 同时处理的受控请求数
+    ADMISSION_QUEUE_DEPTH = 64      # 等待名额的请求数上限，超出时返回503
+    ADMISSION_QUEUE_TIMEOUT = 2.0   # 排队最长等待时间（秒）
+    ADMISSION_RETRY_AFTER = 1       # 队列已满时的 Retry-After（秒）
+    # 接口类别：priority越小越优先；rate/burst为令牌桶（每秒请求数/突发容量），超出时返回429；
+    # queue_share为该类别最多可占用的队列比例，高峰时低优先级请求先被拒绝
+    ADMISSION_CLASSES = {
+        'signin': {
+            'endpoints': ['signin', 'attendance_api.check_in', 'attendance_api.get_location_info'],
+            'priority': 0, 'rate': 200, 'burst': 400, 'queue_share': 1.0
+        },
+        'schedule': {
+            'endpoints': ['attendance_api.get_student_schedule'],
+            'priority': 1, 'rate': 50, 'burst': 100, 'queue_share': 0.5
+        },
+        'analytics': {
+            'endpoints': ['get_attendance_records', 'get_attendance_statistics'],
+            'priority': 2, 'rate': 20, 'burst': 40, 'queue_share': 0.25
+        }
+    }
+    
+    # 管理接口令牌（请求头 X-Admin-Token），未设置时管理接口不可用
+    ADMIN_API_TOKEN = os.environ.get('ADMIN_API_TOKEN')
     
-    # 缓存配置
-    CACHE_TYPE = 'simple'
-    CACHE_DEFAULT_TIMEOUT = 300
+    # 读接口响应缓存（签到记录、统计、课表）：按学号和月份打标签，签到、状态更正等写入后只失效受影响的标签
+    # 标签失效时间保存在 CACHE_SQLITE_PATH 中，各工作进程共享，一个进程的写入只使其他进程中带相同标签的条目过期
+    # CACHE_TYPE：simple 为进程内LRU，sqlite 为各工作进程共用的本地SQLite文件，null 为不缓存
+    CACHE_TYPE = os.environ.get('CACHE_TYPE', 'simple')
+    CACHE_DEFAULT_TIMEOUT = 300    # 缓存时间上限（秒）
+    CACHE_SCHEDULE_TIMEOUT = 60    # 课表中的课程状态随当前时间变化，缓存时间较短
+    CACHE_MAX_ENTRIES = 10000      # 每个进程（sqlite为所有进程）最多缓存的响应数
+    CACHE_SQLITE_PATH = os.environ.get('CACHE_SQLITE_PATH') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'response_cache.db')
     
     @staticmethod
     def init_app(app):
@@ -164,7 +256,10 @@ WECHAT_API_CONFIG = {
     'upload_media_url': '/media/upload',
     'send_message_url': '/message/send',
     'jsapi_ticket_url': '/get_jsapi_ticket',
-    'timeout': 30  # 请求超时时间（秒）
+    'timeout': 30,  # 请求超时时间（秒）
+    'media_deadline': 60,  # 下载一个媒体文件的总时长上限（秒）
+    'media_chunk_size': 64 * 1024,  # 媒体文件流式下载的分块大小
+    'pool_maxsize': 16  # 连接池中保持的连接数（照片处理线程并发下载时复用）
 }
 
 # 地理位置配置
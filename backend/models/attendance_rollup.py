@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+每日签到汇总数据模型
+"""
+
+from app import db
+
+
+class AttendanceDailyRollup(db.Model):
+    """每日签到汇总：按 (用户, 当地日期, 课程, 状态) 计数，与签到记录在同一事务中增量维护"""
+    __tablename__ = 'attendance_daily_rollup'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    local_date = db.Column(db.Date, nullable=False)  # 签到当地日期（signed_at为学校当地时间）
+    course_name = db.Column(db.String(100), nullable=False)
+    status = db.Column(db.String(20), nullable=False)  # attended, late, absent
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'local_date', 'course_name', 'status', name='uix_attendance_rollup_key'),
+        db.Index('ix_attendance_rollup_date', 'local_date'),
+    )
+    
+    def __repr__(self):
+        return f'<AttendanceDailyRollup {self.user_id} {self.local_date} {self.course_name} {self.status}: {self.count}>'
+    
+    def to_dict(self):
+        return {
+            'user_id': self.user_id,
+            'local_date': self.local_date.isoformat(),
+            'course_name': self.course_name,
+            'status': self.status,
+            'count': self.count
+        }
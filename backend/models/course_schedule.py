@@ -4,8 +4,61 @@
 留学生课表数据模型
 """
 
+import re
+import logging
 from app import db
 from datetime import datetime, time
+from sqlalchemy.orm import validates
+
+logger = logging.getLogger(__name__)
+
+# 周次位图最多支持的周数（BIGINT有符号，最高位不用）
+MAX_WEEKS = 63
+
+
+def parse_week_numbers(week_numbers):
+    """
+    将上课周次文本编译为位图，第n周对应第n-1位
+    
+    支持格式：1,2,3,5-10、1-16单、2-16双（中英文逗号、顿号、空格均可作分隔符）
+    
+    Args:
+        week_numbers: 周次文本
+        
+    Returns:
+        int: 周次位图
+        
+    Raises:
+        ValueError: 周次格式无法识别或超出范围
+    """
+    mask = 0
+    for part in re.split(r'[,，、\s]+', (week_numbers or '').strip()):
+        if not part:
+            continue
+        
+        match = re.fullmatch(r'(\d+)(?:-(\d+))?(单|双)?周?', part)
+        if not match:
+            raise ValueError(f"无法识别的周次: {part}")
+        
+        start = int(match.group(1))
+        end = int(match.group(2) or start)
+        parity = match.group(3)
+        if not 1 <= start <= end <= MAX_WEEKS:
+            raise ValueError(f"周次超出范围: {part}")
+        
+        for week in range(start, end + 1):
+            if parity == '单' and week % 2 == 0:
+                continue
+            if parity == '双' and week % 2 == 1:
+                continue
+            mask |= 1 << (week - 1)
+    
+    return mask
+
+
+def week_bit(week):
+    """第week周对应的位"""
+    return 1 << (week - 1)
 
 class Course(db.Model):
     """课程信息表"""
@@ -29,6 +82,19 @@ class Course(db.Model):
     
     def __repr__(self):
         return f'<Course {self.course_code}: {self.course_name}>'
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'course_code': self.course_code,
+            'course_name': self.course_name,
+            'course_name_en': self.course_name_en,
+            'credit': self.credit,
+            'teacher_name': self.teacher_name,
+            'teacher_id': self.teacher_id,
+            'department': self.department,
+            'semester': self.semester
+        }
 
 
 class CourseSchedule(db.Model):
@@ -43,6 +109,7 @@ class CourseSchedule(db.Model):
     start_time = db.Column(db.Time, nullable=False)  # 上课时间
     end_time = db.Column(db.Time, nullable=False)  # 下课时间
     week_numbers = db.Column(db.String(100), nullable=False)  # 上课周次，如：1,2,3,5-10
+    week_mask = db.Column(db.BigInteger, nullable=True)  # 由week_numbers编译的周次位图，为空表示每周上课
     created_at = db.Column(db.DateTime, default=datetime.now)
     updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
     
@@ -51,6 +118,22 @@ class CourseSchedule(db.Model):
     
     def __repr__(self):
         return f'<CourseSchedule {self.course_id}: {self.day_of_week} {self.start_time}-{self.end_time}>'
+    
+    @validates('week_numbers')
+    def _compile_week_numbers(self, key, value):
+        """设置周次文本时同步编译周次位图"""
+        try:
+            self.week_mask = parse_week_numbers(value)
+        except ValueError as e:
+            logger.warning(f"课程安排周次无法解析，按每周上课处理: {e}")
+            self.week_mask = None
+        return value
+    
+    def meets_in_week(self, week):
+        """是否在第week周上课，week为空（无校历）或位图为空时视为上课"""
+        if week is None or self.week_mask is None:
+            return True
+        return bool(self.week_mask & week_bit(week))
 
 
 class StudentCourse(db.Model):
@@ -79,6 +162,50 @@ class StudentCourse(db.Model):
         return f'<StudentCourse {self.student_id}: {self.course_id}>'
 
 
+class ClassSession(db.Model):
+    """课堂表：由课程安排按校历展开的每一次具体上课（时间为学校当地时间）"""
+    __tablename__ = 'class_sessions'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    course_schedule_id = db.Column(db.Integer, db.ForeignKey('course_schedules.id', ondelete='CASCADE'), nullable=False)
+    course_id = db.Column(db.Integer, db.ForeignKey('courses.id', ondelete='CASCADE'), nullable=False)
+    session_date = db.Column(db.Date, nullable=False)  # 上课日期
+    week = db.Column(db.Integer, nullable=True)  # 教学周，未配置校历时为空
+    start_at = db.Column(db.DateTime, nullable=False)  # 上课时间
+    end_at = db.Column(db.DateTime, nullable=False)  # 下课时间
+    late_cutoff = db.Column(db.DateTime, nullable=False)  # 晚于此时间签到记为迟到
+    building_id = db.Column(db.Integer, db.ForeignKey('buildings.id'), nullable=False)
+    classroom = db.Column(db.String(20), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    
+    # 关联
+    course = db.relationship('Course')
+    course_schedule = db.relationship('CourseSchedule')
+    
+    __table_args__ = (
+        db.UniqueConstraint('course_schedule_id', 'session_date', name='uix_class_session_schedule_date'),
+        db.Index('ix_class_sessions_date_start', 'session_date', 'start_at'),
+        db.Index('ix_class_sessions_building_date', 'building_id', 'session_date'),
+    )
+    
+    def __repr__(self):
+        return f'<ClassSession {self.course_schedule_id}: {self.start_at}-{self.end_at}>'
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'course_schedule_id': self.course_schedule_id,
+            'course_id': self.course_id,
+            'session_date': self.session_date.isoformat(),
+            'week': self.week,
+            'start_at': self.start_at.isoformat(),
+            'end_at': self.end_at.isoformat(),
+            'late_cutoff': self.late_cutoff.isoformat(),
+            'building_id': self.building_id,
+            'classroom': self.classroom
+        }
+
+
 # 预设的上课时间段
 class TimeSlot:
     """课程时间段定义"""
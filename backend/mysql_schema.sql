@@ -28,7 +28,8 @@ CREATE TABLE buildings (
     campus VARCHAR(50),
     longitude DECIMAL(10,7),
     latitude DECIMAL(10,7),
-    radius INT DEFAULT 50,
+    radius INT DEFAULT NULL,
+    polygon TEXT,
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     UNIQUE KEY uix_building_name_campus (name, campus)
@@ -66,6 +67,7 @@ CREATE TABLE course_schedules (
     start_time TIME NOT NULL,
     end_time TIME NOT NULL,
     week_numbers VARCHAR(100) NOT NULL,
+    week_mask BIGINT,
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     FOREIGN KEY (course_id) REFERENCES courses(id) ON DELETE CASCADE,
@@ -82,10 +84,15 @@ CREATE TABLE attendance (
     longitude FLOAT,
     location_address VARCHAR(200),
     photo_path VARCHAR(200),
+    thumbnail_path VARCHAR(200),
+    photo_status VARCHAR(20),
+    photo_source VARCHAR(200),
     status VARCHAR(20) DEFAULT 'attended',
+    request_key VARCHAR(64),
     signed_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (user_id) REFERENCES user(id) ON DELETE CASCADE
+    FOREIGN KEY (user_id) REFERENCES user(id) ON DELETE CASCADE,
+    UNIQUE KEY uix_attendance_request_key (request_key)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- 学生课程关联表
@@ -104,8 +111,44 @@ CREATE TABLE student_courses (
     INDEX ix_student_courses_student_id (student_id)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
+-- 课堂表（由 python run.py generate-sessions 按校历生成）
+CREATE TABLE class_sessions (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    course_schedule_id INT NOT NULL,
+    course_id INT NOT NULL,
+    session_date DATE NOT NULL,
+    week INT,
+    start_at DATETIME NOT NULL,
+    end_at DATETIME NOT NULL,
+    late_cutoff DATETIME NOT NULL,
+    building_id INT NOT NULL,
+    classroom VARCHAR(20) NOT NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (course_schedule_id) REFERENCES course_schedules(id) ON DELETE CASCADE,
+    FOREIGN KEY (course_id) REFERENCES courses(id) ON DELETE CASCADE,
+    FOREIGN KEY (building_id) REFERENCES buildings(id),
+    UNIQUE KEY uix_class_session_schedule_date (course_schedule_id, session_date),
+    INDEX ix_class_sessions_date_start (session_date, start_at),
+    INDEX ix_class_sessions_building_date (building_id, session_date)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- 每日签到汇总表（随签到记录增量维护，可由 python run.py rebuild-rollup 重建）
+CREATE TABLE attendance_daily_rollup (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    user_id INT NOT NULL,
+    local_date DATE NOT NULL,
+    course_name VARCHAR(100) NOT NULL,
+    status VARCHAR(20) NOT NULL,
+    count INT NOT NULL DEFAULT 0,
+    FOREIGN KEY (user_id) REFERENCES user(id) ON DELETE CASCADE,
+    UNIQUE KEY uix_attendance_rollup_key (user_id, local_date, course_name, status),
+    INDEX ix_attendance_rollup_date (local_date)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
 -- 创建索引以提高查询性能
 CREATE INDEX idx_attendance_user_id ON attendance(user_id);
-CREATE INDEX idx_attendance_signed_at ON attendance(signed_at);
+CREATE INDEX idx_attendance_signed_at_id ON attendance(signed_at, id);
+CREATE INDEX idx_attendance_user_signed_at ON attendance(user_id, signed_at, id);
+CREATE INDEX idx_attendance_photo_status ON attendance(photo_status);
 CREATE INDEX idx_course_schedules_course_id ON course_schedules(course_id);
 CREATE INDEX idx_course_schedules_building_id ON course_schedules(building_id);
@@ -135,6 +135,237 @@ def create_sample_data():
     db.session.commit()
     print(f"示例数据创建完成：{len(users)}个用户，{Attendance.query.count()}条签到记录，{Feedback.query.count()}条反馈")
 
+def revalidate_locations(chunk_size=1000, dry_run=False):
+    """按批流式扫描签到记录，批量重新计算最近建筑并改写位置信息"""
+    import time
+    from sqlalchemy import select, update
+    from app import Attendance
+    from services.attendance_service import AttendanceService
+    from utils.language_utils import format_location_info, format_unknown_location, detect_location_language
+    
+    print(f"开始重新校验签到位置（每批 {chunk_size} 条{'，仅预览不写入' if dry_run else ''}）...")
+    
+    started = time.time()
+    last_id = 0
+    scanned = 0
+    changed = 0
+    
+    while True:
+        # 按主键分批读取，只取计算所需的列
+        rows = db.session.execute(
+            select(
+                Attendance.id, Attendance.longitude, Attendance.latitude, Attendance.location_address
+            ).where(
+                Attendance.id > last_id,
+                Attendance.latitude.isnot(None),
+                Attendance.longitude.isnot(None)
+            ).order_by(Attendance.id).limit(chunk_size)
+        ).all()
+        
+        if not rows:
+            break
+        
+        result = AttendanceService.find_nearest_buildings(
+            [[row.longitude, row.latitude] for row in rows]
+        )
+        
+        changes = []
+        for row, building, distance, is_valid in zip(
+                rows, result['buildings'], result['distances'], result['is_valid']):
+            # 保持原记录的语言
+            language = detect_location_language(row.location_address)
+            if building:
+                location_address = format_location_info(
+                    building['name'], building.get('name_en', building['name']),
+                    round(float(distance), 0), bool(is_valid), language
+                )
+            else:
+                location_address = format_unknown_location(language)
+            
+            if location_address != row.location_address:
+                changes.append({'id': row.id, 'location_address': location_address})
+        
+        if changes and not dry_run:
+            db.session.execute(update(Attendance), changes)
+            db.session.commit()
+        
+        scanned += len(rows)
+        changed += len(changes)
+        last_id = rows[-1].id
+        
+        elapsed = time.time() - started
+        print(f"已处理 {scanned} 条，需更新 {changed} 条，{scanned / elapsed if elapsed else 0:.0f} 条/秒")
+    
+    if changed and not dry_run:
+        # 签到记录列表中的位置信息已变化
+        from services.response_cache import clear_response_cache
+        clear_response_cache()
+    print(f"位置校验完成：共处理 {scanned} 条签到记录，{'需' if dry_run else '已'}更新 {changed} 条")
+
+def compile_week_masks():
+    """为已有的课程安排编译周次位图"""
+    from sqlalchemy import select, update
+    from models.course_schedule import CourseSchedule, parse_week_numbers
+    
+    rows = db.session.execute(select(CourseSchedule.id, CourseSchedule.week_numbers)).all()
+    
+    changes = []
+    invalid = 0
+    for row in rows:
+        try:
+            week_mask = parse_week_numbers(row.week_numbers)
+        except ValueError as e:
+            print(f"课程安排 {row.id} 周次无法解析，按每周上课处理: {e}")
+            week_mask = None
+            invalid += 1
+        changes.append({'id': row.id, 'week_mask': week_mask})
+    
+    if changes:
+        db.session.execute(update(CourseSchedule), changes)
+        db.session.commit()
+    
+    # 批量更新不经过ORM事件，需要手动通知课表缓存
+    from services.timetable_cache import timetable_cache
+    timetable_cache.invalidate()
+    
+    print(f"周次位图编译完成：共 {len(changes)} 个课程安排，{invalid} 个无法解析")
+
+def generate_sessions(semester=None, start=None, end=None):
+    """按校历把课程安排展开为课堂表"""
+    from datetime import datetime as dt
+    from services.class_session_service import ClassSessionService
+    
+    if start and end:
+        start_date = dt.strptime(start, '%Y-%m-%d').date()
+        end_date = dt.strptime(end, '%Y-%m-%d').date()
+    else:
+        try:
+            start_date, end_date = ClassSessionService.semester_range(semester)
+        except ValueError as e:
+            print(f"无法确定日期范围: {e}")
+            return
+    
+    print(f"开始生成课堂表: {start_date} ~ {end_date}")
+    result = ClassSessionService.generate_sessions(start_date, end_date)
+    print(f"课堂表生成完成：{result['days']} 个上课日，共 {result['sessions']} 节课")
+
+def import_timetable(csv_path, chunk_size=1000, dry_run=False):
+    """从CSV文件批量导入课表"""
+    from services.timetable_import import import_timetable as run_import
+    
+    print(f"开始导入课表: {csv_path}{'（仅预览不写入）' if dry_run else ''}")
+    with open(csv_path, newline='', encoding='utf-8-sig') as csv_file:
+        try:
+            stats = run_import(csv_file, chunk_size, dry_run)
+        except ValueError as e:
+            print(f"课表导入失败: {e}")
+            return
+    
+    for table, label in (('courses', '课程'), ('schedules', '课程安排'), ('enrollments', '选课记录')):
+        counts = stats[table]
+        print(f"{label}: 新增 {counts['inserted']}，更新 {counts['updated']}，删除 {counts['deleted']}")
+    print(f"共 {stats['rows']} 行，出错 {stats['errors']} 行，选课冲突 {stats['conflicts']} 行")
+    print(f"耗时 {stats['seconds']:.2f} 秒（解析 {stats['read_seconds']:.2f} 秒），{stats['rows_per_second']:.0f} 行/秒")
+    if not dry_run:
+        print("如已生成课堂表，请运行 python run.py generate-sessions 重新生成")
+
+def migrate_photos(dry_run=False):
+    """把旧版平铺存放的签到照片和反馈图片迁移到按内容哈希分片的照片存储"""
+    import json
+    import hashlib
+    from sqlalchemy import select, update
+    from app import Attendance, Feedback
+    from services.photo_store import get_photo_store, PhotoStore
+    
+    upload_folder = app.config['UPLOAD_FOLDER']
+    migrated = {}  # 旧路径（相对上传目录） -> 新路径
+    missing = []
+    
+    def migrate_file(store, old_path):
+        """迁移单个文件，返回新路径，文件不存在时返回None"""
+        if old_path in migrated:
+            return migrated[old_path]
+        full_path = os.path.join(upload_folder, *old_path.split('/'))
+        if not os.path.isfile(full_path):
+            missing.append(old_path)
+            return None
+        
+        ext = old_path.rsplit('.', 1)[1].lower() if '.' in old_path.rsplit('/', 1)[-1] else 'jpg'
+        with open(full_path, 'rb') as f:
+            data = f.read()
+        if dry_run:
+            key = PhotoStore.key_for(hashlib.sha256(data).hexdigest(), ext)
+        else:
+            key = store.put(data, ext)
+        migrated[old_path] = store.upload_path(key)
+        return migrated[old_path]
+    
+    def is_legacy(store, path):
+        prefix = store.namespace + '/'
+        return bool(path) and not (path.startswith(prefix) and PhotoStore.is_key(path[len(prefix):]))
+    
+    # 签到照片与缩略图
+    photos = get_photo_store('photos')
+    attendance_changes = []
+    for row in db.session.execute(select(Attendance.id, Attendance.photo_path, Attendance.thumbnail_path)):
+        values = {}
+        for column in ('photo_path', 'thumbnail_path'):
+            old_path = getattr(row, column)
+            if is_legacy(photos, old_path):
+                new_path = migrate_file(photos, old_path)
+                if new_path:
+                    values[column] = new_path
+        if values:
+            attendance_changes.append(dict(values, id=row.id))
+    
+    # 反馈图片（images中保存的是相对feedback目录的文件名）
+    feedback_store = get_photo_store('feedback')
+    feedback_changes = []
+    for row in db.session.execute(select(Feedback.id, Feedback.images).where(Feedback.images.isnot(None))):
+        images = json.loads(row.images) if row.images else []
+        new_images = []
+        for name in images:
+            new_path = migrate_file(feedback_store, f"feedback/{name}") if is_legacy(feedback_store, f"feedback/{name}") else None
+            new_images.append(new_path[len('feedback/'):] if new_path else name)
+        if new_images != images:
+            feedback_changes.append({'id': row.id, 'images': json.dumps(new_images)})
+    
+    for path in missing:
+        print(f"文件不存在，保留原路径: {path}")
+    print(f"签到记录 {len(attendance_changes)} 条、反馈 {len(feedback_changes)} 条需更新，"
+          f"涉及 {len(migrated)} 个文件，去重后 {len(set(migrated.values()))} 个")
+    if dry_run:
+        return
+    
+    if attendance_changes:
+        db.session.execute(update(Attendance), attendance_changes)
+    if feedback_changes:
+        db.session.execute(update(Feedback), feedback_changes)
+    db.session.commit()
+    if attendance_changes:
+        from services.response_cache import clear_response_cache
+        clear_response_cache()
+    
+    # 数据库更新成功后再删除旧文件
+    for old_path in migrated:
+        os.remove(os.path.join(upload_folder, *old_path.split('/')))
+    print(f"照片迁移完成，已删除 {len(migrated)} 个旧文件")
+
+def rebuild_rollup(start=None, end=None):
+    """由签到记录重建每日签到汇总表"""
+    from datetime import datetime as dt
+    from services.attendance_rollup import RollupService
+    
+    start_date = dt.strptime(start, '%Y-%m-%d').date() if start else None
+    end_date = dt.strptime(end, '%Y-%m-%d').date() if end else None
+    
+    print(f"开始重建每日签到汇总: {start_date or '最早'} ~ {end_date or '最新'}")
+    rows = RollupService.rebuild(start_date, end_date)
+    # 统计接口读取汇总表
+    from services.response_cache import clear_response_cache
+    clear_response_cache()
+    print(f"每日签到汇总重建完成，共 {rows} 行")
+
 def run_server():
     """运行服务器"""
     # 检查是否为生产环境
@@ -211,6 +442,42 @@ def main():
             elif command == 'create-sample-data':
                 with app.app_context():
                     create_sample_data()
+            elif command == 'revalidate-locations':
+                chunk_size = 1000
+                for arg in args[1:]:
+                    if arg.startswith('--chunk-size='):
+                        chunk_size = int(arg.split('=', 1)[1])
+                with app.app_context():
+                    revalidate_locations(chunk_size, dry_run='--dry-run' in args)
+            elif command == 'reload-buildings':
+                from services.building_index import reload_building_cache
+                with app.app_context():
+                    cache_info = reload_building_cache()
+                print(f"建筑缓存已重新加载: {cache_info['buildings']} 栋建筑，版本 {cache_info['version']}")
+            elif command == 'compile-week-masks':
+                with app.app_context():
+                    compile_week_masks()
+            elif command == 'generate-sessions':
+                options = dict(arg[2:].split('=', 1) for arg in args[1:] if arg.startswith('--') and '=' in arg)
+                with app.app_context():
+                    generate_sessions(options.get('semester'), options.get('start'), options.get('end'))
+            elif command == 'import-timetable':
+                if len(args) < 2:
+                    print("请指定CSV文件: python run.py import-timetable timetable.csv")
+                    return
+                chunk_size = 1000
+                for arg in args[2:]:
+                    if arg.startswith('--chunk-size='):
+                        chunk_size = int(arg.split('=', 1)[1])
+                with app.app_context():
+                    import_timetable(args[1], chunk_size, dry_run='--dry-run' in args)
+            elif command == 'migrate-photos':
+                with app.app_context():
+                    migrate_photos(dry_run='--dry-run' in args)
+            elif command == 'rebuild-rollup':
+                options = dict(arg[2:].split('=', 1) for arg in args[1:] if arg.startswith('--') and '=' in arg)
+                with app.app_context():
+                    rebuild_rollup(options.get('start'), options.get('end'))
             elif command == 'shell':
                 # 启动交互式shell
                 import code
@@ -223,6 +490,18 @@ def main():
                 print("  python run.py --production       # 生产环境启动(443端口)")
                 print("  python run.py init-db            # 初始化数据库")
                 print("  python run.py create-sample-data # 创建示例数据")
+                print("  python run.py revalidate-locations [--chunk-size=1000] [--dry-run]")
+                print("                                   # 批量重新计算签到记录的位置信息")
+                print("  python run.py reload-buildings   # 通知所有工作进程重新加载建筑缓存")
+                print("  python run.py compile-week-masks # 为已有课程安排编译周次位图")
+                print("  python run.py generate-sessions [--semester=2025-2026-1] [--start=YYYY-MM-DD --end=YYYY-MM-DD]")
+                print("                                   # 按校历生成课堂表（课程安排或校历变更后需重新生成）")
+                print("  python run.py import-timetable timetable.csv [--chunk-size=1000] [--dry-run]")
+                print("                                   # 从CSV批量导入课表（按文件中的学期比对增删改）")
+                print("  python run.py migrate-photos [--dry-run]")
+                print("                                   # 把旧版照片迁移到按内容哈希分片的存储")
+                print("  python run.py rebuild-rollup [--start=YYYY-MM-DD] [--end=YYYY-MM-DD]")
+                print("                                   # 由签到记录重建每日签到汇总表（统计数据来源）")
                 print("  python run.py shell              # 启动交互式shell")
                 print("")
                 print("环境变量:")
@@ -240,7 +519,7 @@ def main():
             pass
     
     # 如果没有其他命令，则启动服务器
-    if not any(arg in ['init-db', 'create-sample-data', 'shell', '--help', '-h'] for arg in sys.argv[1:]):
+    if not any(arg in ['init-db', 'create-sample-data', 'revalidate-locations', 'reload-buildings', 'compile-week-masks', 'generate-sessions', 'import-timetable', 'migrate-photos', 'rebuild-rollup', 'shell', '--help', '-h'] for arg in sys.argv[1:]):
         # 初始化数据库
         init_database()
         
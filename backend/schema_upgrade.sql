@@ -0,0 +1,70 @@
+-- 考勤系统数据库结构升级脚本
+-- 用于将已有数据库升级到最新结构（新建数据库请直接使用 mysql_schema.sql）
+-- 按顺序执行尚未执行过的部分即可，语句同时兼容MySQL与SQLite
+
+-- 建筑围栏：圆形半径或多边形（JSON格式 [[经度, 纬度], ...]）
+ALTER TABLE buildings ADD COLUMN polygon TEXT;
+-- SQLite数据库还需要添加radius列（MySQL建表时已包含）
+-- ALTER TABLE buildings ADD COLUMN radius INT;
+-- 旧版MySQL建表语句中radius默认为50，使各建筑的判定范围从原有的100米/200米缩小为50米；
+-- 去掉默认值并清空由默认值填入的半径（SQLite的radius列由上面的语句添加，没有默认值，跳过这两句）
+ALTER TABLE buildings ALTER radius DROP DEFAULT;
+UPDATE buildings SET radius = NULL WHERE radius = 50;
+
+-- 课程安排周次位图（执行后运行 python run.py compile-week-masks 编译已有数据）
+ALTER TABLE course_schedules ADD COLUMN week_mask BIGINT;
+
+-- 课堂表（执行后运行 python run.py generate-sessions 生成）
+CREATE TABLE class_sessions (
+    id INTEGER PRIMARY KEY AUTO_INCREMENT,
+    course_schedule_id INT NOT NULL REFERENCES course_schedules(id) ON DELETE CASCADE,
+    course_id INT NOT NULL REFERENCES courses(id) ON DELETE CASCADE,
+    session_date DATE NOT NULL,
+    week INT,
+    start_at DATETIME NOT NULL,
+    end_at DATETIME NOT NULL,
+    late_cutoff DATETIME NOT NULL,
+    building_id INT NOT NULL REFERENCES buildings(id),
+    classroom VARCHAR(20) NOT NULL,
+    created_at DATETIME,
+    CONSTRAINT uix_class_session_schedule_date UNIQUE (course_schedule_id, session_date)
+);
+-- SQLite请将上面的 INTEGER PRIMARY KEY AUTO_INCREMENT 改为 INTEGER PRIMARY KEY AUTOINCREMENT
+CREATE INDEX ix_class_sessions_date_start ON class_sessions(session_date, start_at);
+CREATE INDEX ix_class_sessions_building_date ON class_sessions(building_id, session_date);
+
+-- 签到照片后台处理状态
+ALTER TABLE attendance ADD COLUMN photo_status VARCHAR(20);
+
+-- 签到照片缩略图
+ALTER TABLE attendance ADD COLUMN thumbnail_path VARCHAR(200);
+
+-- 签到请求键（幂等签到，重复提交由唯一索引拦截）
+ALTER TABLE attendance ADD COLUMN request_key VARCHAR(64);
+CREATE UNIQUE INDEX uix_attendance_request_key ON attendance(request_key);
+
+-- 签到记录列表游标分页 (signed_at, id)，原 idx_attendance_signed_at 可随后删除
+CREATE INDEX idx_attendance_signed_at_id ON attendance(signed_at, id);
+CREATE INDEX idx_attendance_user_signed_at ON attendance(user_id, signed_at, id);
+
+-- 每日签到汇总表，建表后由已有签到记录回填（与 python run.py rebuild-rollup 相同），回填完成后再开启 STATISTICS_FROM_ROLLUP
+CREATE TABLE attendance_daily_rollup (
+    id INTEGER PRIMARY KEY AUTO_INCREMENT,
+    user_id INT NOT NULL REFERENCES user(id) ON DELETE CASCADE,
+    local_date DATE NOT NULL,
+    course_name VARCHAR(100) NOT NULL,
+    status VARCHAR(20) NOT NULL,
+    count INT NOT NULL DEFAULT 0,
+    CONSTRAINT uix_attendance_rollup_key UNIQUE (user_id, local_date, course_name, status)
+);
+-- SQLite请将上面的 INTEGER PRIMARY KEY AUTO_INCREMENT 改为 INTEGER PRIMARY KEY AUTOINCREMENT
+CREATE INDEX ix_attendance_rollup_date ON attendance_daily_rollup(local_date);
+INSERT INTO attendance_daily_rollup (user_id, local_date, course_name, status, count)
+SELECT user_id, DATE(signed_at), course_name, status, COUNT(id)
+FROM attendance
+WHERE signed_at IS NOT NULL AND status IS NOT NULL AND status <> ''
+GROUP BY user_id, DATE(signed_at), course_name, status;
+
+-- 待处理照片的来源，进程退出时未处理完的照片据此恢复（升级前的待处理照片无法恢复，会被标记为failed）
+ALTER TABLE attendance ADD COLUMN photo_source VARCHAR(200);
+CREATE INDEX idx_attendance_photo_status ON attendance(photo_status);
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+请求准入控制
+按接口类别限制请求速率（令牌桶），并限制同时处理的请求数；名额用完时请求按优先级排队，
+队列已满或等待超时时立即返回503，超过速率时返回429，均带 Retry-After 响应头。
+签到类接口优先于课表和统计类接口，高峰时先拒绝统计类请求。
+
+计数与限制均为单个工作进程内的，多进程部署时总容量为各进程之和。
+"""
+
+import math
+import time
+import heapq
+import itertools
+import threading
+from flask import g, jsonify, request
+
+
+class TokenBucket:
+    """令牌桶，rate为每秒补充的令牌数，burst为桶容量"""
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        """
+        尝试取一个令牌
+
+        Returns:
+            float: 0表示成功，否则为需要等待的秒数
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+
+class ConcurrencyGate:
+    """
+    并发名额与优先级等待队列
+
+    名额用完时请求进入队列，释放名额后由优先级最高（数值最小）、最早到达的请求取得。
+    """
+
+    ADMITTED = 'admitted'
+    QUEUE_FULL = 'queue_full'
+    TIMEOUT = 'timeout'
+
+    def __init__(self, limit, queue_depth):
+        self.limit = limit
+        self.queue_depth = queue_depth
+        self.in_flight = 0
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+
+    @property
+    def waiting(self):
+        return len(self._waiting)
+
+    def acquire(self, priority, max_waiting, timeout):
+        """
+        获取并发名额
+
+        Args:
+            priority: 优先级，数值越小越优先
+            max_waiting: 队列中已有请求数达到该值时不再排队
+            timeout: 最长等待秒数
+
+        Returns:
+            str: ADMITTED、QUEUE_FULL 或 TIMEOUT
+        """
+        with self._condition:
+            if self.in_flight < self.limit and not self._waiting:
+                self.in_flight += 1
+                return self.ADMITTED
+            if len(self._waiting) >= min(max_waiting, self.queue_depth):
+                return self.QUEUE_FULL
+
+            entry = (priority, next(self._sequence))
+            heapq.heappush(self._waiting, entry)
+            deadline = time.monotonic() + timeout
+            while True:
+                if self._waiting[0] == entry and self.in_flight < self.limit:
+                    heapq.heappop(self._waiting)
+                    self.in_flight += 1
+                    # 可能还有空闲名额，唤醒下一个等待者
+                    self._condition.notify_all()
+                    return self.ADMITTED
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._waiting.remove(entry)
+                    heapq.heapify(self._waiting)
+                    self._condition.notify_all()
+                    return self.TIMEOUT
+                self._condition.wait(remaining)
+
+    def release(self):
+        """归还并发名额"""
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+
+class AdmissionController:
+    """按接口类别做速率限制与并发控制"""
+
+    def __init__(self, classes, endpoints, max_concurrency=32, queue_depth=64, queue_timeout=2.0, retry_after=1):
+        """
+        Args:
+            classes: {类别: {'priority': 0, 'rate': 每秒请求数, 'burst': 突发容量, 'queue_share': 可占用的队列比例}}
+                     rate为空表示不限速
+            endpoints: {Flask endpoint: 类别}，不在其中的接口不受控制
+            max_concurrency: 同时处理的请求数
+            queue_depth: 等待名额的请求数上限
+            queue_timeout: 排队最长等待秒数
+            retry_after: 队列已满时建议客户端重试的秒数
+        """
+        self.classes = classes
+        self.endpoints = endpoints
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.gate = ConcurrencyGate(max_concurrency, queue_depth)
+        self._buckets = {
+            name: TokenBucket(options['rate'], options.get('burst') or options['rate'])
+            for name, options in classes.items() if options.get('rate')
+        }
+        self._lock = threading.Lock()
+        self._counters = {
+            name: {'admitted': 0, 'rate_limited': 0, 'queue_full': 0, 'timeout': 0}
+            for name in classes
+        }
+
+    def admit(self, endpoint):
+        """
+        请求准入
+
+        Returns:
+            tuple: (类别, 拒绝响应)；类别为空表示不受控制，拒绝响应为空表示已取得名额
+        """
+        name = self.endpoints.get(endpoint)
+        if name is None:
+            return None, None
+        options = self.classes[name]
+
+        bucket = self._buckets.get(name)
+        if bucket is not None:
+            wait = bucket.try_acquire()
+            if wait > 0:
+                self._count(name, 'rate_limited')
+                return name, self._reject(429, '请求过于频繁，请稍后重试', wait)
+
+        max_waiting = int(self.gate.queue_depth * options.get('queue_share', 1.0))
+        result = self.gate.acquire(options.get('priority', 0), max_waiting, self.queue_timeout)
+        if result != ConcurrencyGate.ADMITTED:
+            self._count(name, result)
+            return name, self._reject(503, '服务繁忙，请稍后重试', self.retry_after)
+
+        self._count(name, 'admitted')
+        return name, None
+
+    def release(self):
+        self.gate.release()
+
+    @staticmethod
+    def _reject(status, message, retry_after):
+        response = jsonify({'success': False, 'message': message})
+        response.status_code = status
+        response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+        return response
+
+    def _count(self, name, key):
+        with self._lock:
+            self._counters[name][key] += 1
+
+    def stats(self):
+        """各类别的准入计数与当前并发、排队数"""
+        with self._lock:
+            counters = {name: dict(values) for name, values in self._counters.items()}
+        return {
+            'classes': counters,
+            'in_flight': self.gate.in_flight,
+            'waiting': self.gate.waiting,
+            'max_concurrency': self.gate.limit,
+            'queue_depth': self.gate.queue_depth
+        }
+
+
+# 进程内实例，未开启准入控制时为None
+admission_controller = None
+
+
+def init_admission_control(app):
+    """按配置为应用注册准入控制"""
+    global admission_controller
+    if not app.config.get('ADMISSION_CONTROL_ENABLED', False):
+        return None
+
+    classes = app.config['ADMISSION_CLASSES']
+    endpoints = {
+        endpoint: name
+        for name, options in classes.items()
+        for endpoint in options.get('endpoints', ())
+    }
+    admission_controller = AdmissionController(
+        classes,
+        endpoints,
+        app.config.get('ADMISSION_MAX_CONCURRENCY', 32),
+        app.config.get('ADMISSION_QUEUE_DEPTH', 64),
+        app.config.get('ADMISSION_QUEUE_TIMEOUT', 2.0),
+        app.config.get('ADMISSION_RETRY_AFTER', 1)
+    )
+
+    @app.before_request
+    def admit_request():
+        name, rejection = admission_controller.admit(request.endpoint)
+        if name is not None and rejection is None:
+            g.admission_slot = True
+        return rejection
+
+    @app.teardown_request
+    def release_request(exc=None):
+        if g.pop('admission_slot', False):
+            admission_controller.release()
+
+    return admission_controller
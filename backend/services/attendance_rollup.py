@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+每日签到汇总维护
+签到记录的新增、状态修改和删除在同一事务中增减 attendance_daily_rollup 的计数：
+ORM方式的写入由 after_flush 事件处理，批量INSERT（组提交、签到日志）显式调用 apply_inserted。
+统计按汇总表读取，读取的行数与天数相关，与签到记录数无关。
+"""
+
+import logging
+from collections import Counter
+from sqlalchemy import event, inspect, select, insert, update, delete, func, and_
+from sqlalchemy.dialects import mysql, sqlite, postgresql
+from models.attendance_rollup import AttendanceDailyRollup
+from app import db, Attendance
+
+logger = logging.getLogger(__name__)
+
+_ROLLUP = AttendanceDailyRollup.__table__
+_KEY_COLUMNS = ('user_id', 'local_date', 'course_name', 'status')
+
+
+def rollup_key(user_id, signed_at, course_name, status):
+    """签到记录对应的汇总键，缺少签到时间或状态的记录不计入汇总"""
+    if user_id is None or signed_at is None or not status:
+        return None
+    return (user_id, signed_at.date(), course_name, status)
+
+
+class RollupService:
+    """每日签到汇总服务类"""
+
+    @staticmethod
+    def apply(session, deltas):
+        """
+        在当前事务中按增量更新汇总计数
+
+        Args:
+            session: 数据库会话（与签到记录的写入为同一事务）
+            deltas: {汇总键: 增量}
+        """
+        rows = [
+            dict(zip(_KEY_COLUMNS, key), count=amount)
+            for key, amount in deltas.items() if key is not None and amount
+        ]
+        if not rows:
+            return
+
+        connection = session.connection()
+        dialect = connection.dialect
+        if dialect.name == 'mysql':
+            stmt = mysql.insert(_ROLLUP)
+            stmt = stmt.on_duplicate_key_update(count=_ROLLUP.c['count'] + stmt.inserted['count'])
+            connection.execute(stmt, rows)
+        elif dialect.name in ('sqlite', 'postgresql'):
+            module = sqlite if dialect.name == 'sqlite' else postgresql
+            stmt = module.insert(_ROLLUP)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[_ROLLUP.c[name] for name in _KEY_COLUMNS],
+                set_={'count': _ROLLUP.c['count'] + stmt.excluded['count']}
+            )
+            connection.execute(stmt, rows)
+        else:
+            for row in rows:
+                condition = and_(*(_ROLLUP.c[name] == row[name] for name in _KEY_COLUMNS))
+                result = connection.execute(
+                    update(_ROLLUP).where(condition).values(count=_ROLLUP.c['count'] + row['count'])
+                )
+                if result.rowcount == 0:
+                    connection.execute(insert(_ROLLUP).values(**row))
+
+        # 计数减到0的汇总行不再保留
+        decreased = [row for row in rows if row['count'] < 0]
+        if decreased:
+            connection.execute(delete(_ROLLUP).where(
+                _ROLLUP.c['count'] <= 0,
+                _ROLLUP.c.local_date.in_({row['local_date'] for row in decreased})
+            ))
+
+    @staticmethod
+    def apply_inserted(session, rows):
+        """批量INSERT签到记录后调用（同一事务），rows为Attendance列值字典"""
+        deltas = Counter(
+            rollup_key(row.get('user_id'), row.get('signed_at'), row.get('course_name'), row.get('status'))
+            for row in rows
+        )
+        RollupService.apply(session, deltas)
+
+    @staticmethod
+    def _after_flush(session, flush_context):
+        """ORM写入签到记录时，按新增、修改、删除的记录计算汇总增量"""
+        deltas = Counter()
+        for obj in session.new:
+            if isinstance(obj, Attendance):
+                deltas[RollupService._current_key(obj)] += 1
+        for obj in session.deleted:
+            if isinstance(obj, Attendance):
+                deltas[RollupService._original_key(obj)] -= 1
+        for obj in session.dirty:
+            if isinstance(obj, Attendance) and obj not in session.deleted:
+                original, current = RollupService._original_key(obj), RollupService._current_key(obj)
+                if original != current:
+                    deltas[original] -= 1
+                    deltas[current] += 1
+        if deltas:
+            RollupService.apply(session, deltas)
+
+    @staticmethod
+    def _current_key(obj):
+        return rollup_key(obj.user_id, obj.signed_at, obj.course_name, obj.status)
+
+    @staticmethod
+    def _original_key(obj):
+        """签到记录在本次flush之前（即数据库中）的汇总键"""
+        state = inspect(obj)
+
+        def original(name):
+            history = state.attrs[name].history
+            if history.deleted:
+                return history.deleted[0]
+            if history.unchanged:
+                return history.unchanged[0]
+            return getattr(obj, name)
+
+        return rollup_key(original('user_id'), original('signed_at'), original('course_name'), original('status'))
+
+    @staticmethod
+    def rebuild(start_date=None, end_date=None):
+        """
+        由签到记录重建汇总表
+
+        Args:
+            start_date: 起始日期（含），为空时不限
+            end_date: 结束日期（含），为空时不限
+
+        Returns:
+            int: 重建后的汇总行数
+        """
+        local_date = func.date(Attendance.signed_at)
+        source = select(
+            Attendance.user_id, local_date, Attendance.course_name, Attendance.status,
+            func.count(Attendance.id)
+        ).where(Attendance.signed_at.isnot(None), Attendance.status.isnot(None), Attendance.status != '')
+
+        scope = []
+        if start_date:
+            source = source.where(local_date >= start_date.isoformat())
+            scope.append(_ROLLUP.c.local_date >= start_date)
+        if end_date:
+            source = source.where(local_date <= end_date.isoformat())
+            scope.append(_ROLLUP.c.local_date <= end_date)
+        source = source.group_by(Attendance.user_id, local_date, Attendance.course_name, Attendance.status)
+
+        try:
+            db.session.execute(delete(_ROLLUP).where(*scope))
+            db.session.execute(insert(_ROLLUP).from_select(list(_KEY_COLUMNS) + ['count'], source))
+            count_stmt = select(func.count()).select_from(_ROLLUP).where(*scope)
+            rows = db.session.execute(count_stmt).scalar_one()
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return rows
+
+    @staticmethod
+    def daily_status_counts(start_date, end_date, student_id=None):
+        """
+        按日期、状态汇总签到数
+
+        Args:
+            start_date: 起始日期（含）
+            end_date: 结束日期（不含）
+            student_id: 学号，为空时统计全部学生
+
+        Returns:
+            list: [(当地日期, 状态, 数量)]
+        """
+        from app import User
+
+        stmt = select(_ROLLUP.c.local_date, _ROLLUP.c.status, func.sum(_ROLLUP.c['count']))
+        if student_id:
+            stmt = stmt.join(User.__table__, _ROLLUP.c.user_id == User.id).where(User.student_id == student_id)
+        stmt = stmt.where(
+            _ROLLUP.c.local_date >= start_date, _ROLLUP.c.local_date < end_date
+        ).group_by(_ROLLUP.c.local_date, _ROLLUP.c.status)
+        return [(day, status, int(count)) for day, status, count in db.session.execute(stmt)]
+
+
+def init_attendance_rollup(app):
+    """注册签到记录ORM写入时维护汇总表的事件"""
+    if not event.contains(db.session, 'after_flush', RollupService._after_flush):
+        event.listen(db.session, 'after_flush', RollupService._after_flush)
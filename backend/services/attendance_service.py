@@ -6,9 +6,16 @@
 
 from datetime import datetime, timedelta
 import pytz
-from geopy.distance import geodesic
+import numpy as np
+from sqlalchemy import or_
+from sqlalchemy.orm import contains_eager
+from flask import current_app
 from models.course_schedule import Course, CourseSchedule, StudentCourse, TimeSlot
 from models.building import Building
+from services.building_index import get_building_index, get_building
+from services.timetable_cache import get_student_timetable
+from services.semester_calendar import get_semester_calendar
+from utils.geo_utils import get_distance_function
 from app import db
 
 class AttendanceService:
@@ -37,11 +44,14 @@ class AttendanceService:
         tz = pytz.timezone('Asia/Shanghai')
         check_time = datetime.fromtimestamp(timestamp, tz)
         
-        # 获取当前日期是星期几 (0-6, 0是星期一)
-        weekday = check_time.weekday()
+        # 按校历解析当天按星期几的课表上课及所在教学周（停课日返回None）
+        resolved = get_semester_calendar().resolve(check_time.date())
         
         # 查找学生当前时间应该上的课
-        current_course = AttendanceService._get_current_course(student_id, weekday, check_time)
+        current_course = None
+        if resolved is not None:
+            weekday, week = resolved
+            current_course = AttendanceService._get_current_course(student_id, weekday, check_time, week)
         
         # 如果没有课程，返回无课状态
         if not current_course:
@@ -52,40 +62,36 @@ class AttendanceService:
                 'message': '当前时间没有安排课程'
             }
         
-        # 获取课程对应的教学楼
-        building = db.session.query(Building).filter_by(
-            name_en=current_course.course_schedule.building
-        ).first()
+        # 从建筑缓存获取课程对应的教学楼
+        building = get_building(current_course['building_id'])
         
         if not building:
             return {
                 'status': 'error',
-                'course': current_course.course.to_dict(),
+                'course': current_course['course'],
                 'building': None,
                 'message': '未找到对应的教学楼信息'
             }
         
-        # 检查位置是否在教学楼附近
-        is_in_location = AttendanceService._check_location(
-            location, 
-            [building.longitude, building.latitude]
-        )
+        # 检查位置是否在教学楼围栏内
+        is_in_location = AttendanceService._check_geofence(location, building['id'])
         
         if not is_in_location:
             return {
                 'status': 'absent',
-                'course': current_course.course.to_dict(),
-                'building': building.to_dict(),
+                'course': current_course['course'],
+                'building': building,
                 'message': '不在教学楼附近，签到无效'
             }
         
-        # 检查是否迟到
-        time_slot = TimeSlot.get_time_slot(current_course.course_schedule.time_slot)
-        start_time = datetime.combine(check_time.date(), time_slot.start_time)
+        # 检查是否迟到（以课程安排的上课时间为准）
+        start_time = datetime.combine(check_time.date(), current_course['start_time'])
         start_time = tz.localize(start_time)
         
-        # 迟到时间阈值（15分钟）
-        late_threshold = start_time + timedelta(minutes=15)
+        # 迟到时间阈值（默认15分钟）
+        late_threshold = start_time + timedelta(
+            minutes=current_app.config.get('LATE_THRESHOLD_MINUTES', 15)
+        )
         
         if check_time <= late_threshold:
             status = 'present'
@@ -96,13 +102,13 @@ class AttendanceService:
         
         return {
             'status': status,
-            'course': current_course.course.to_dict(),
-            'building': building.to_dict(),
+            'course': current_course['course'],
+            'building': building,
             'message': message
         }
     
     @staticmethod
-    def _get_current_course(student_id, weekday, check_time):
+    def _get_current_course(student_id, weekday, check_time, week=None):
         """
         获取学生当前时间应该上的课程
         
@@ -110,36 +116,14 @@ class AttendanceService:
             student_id: 学生ID
             weekday: 星期几 (0-6)
             check_time: 签到时间
+            week: 教学周，为空时不按周次过滤
             
         Returns:
-            StudentCourse: 学生课程对象，如果没有则返回None
+            dict: 编译课表中的课程条目（含course、building_id、start_time等），如果没有则返回None
         """
-        # 获取当前时间的小时和分钟
-        current_hour = check_time.hour
-        current_minute = check_time.minute
-        current_time = current_hour * 60 + current_minute  # 转换为分钟计数
-        
-        # 查询学生当天的所有课程
-        student_courses = db.session.query(StudentCourse).join(
-            CourseSchedule, StudentCourse.course_schedule_id == CourseSchedule.id
-        ).filter(
-            StudentCourse.student_id == student_id,
-            CourseSchedule.day_of_week == weekday
-        ).all()
-        
-        # 检查当前时间是否在某个课程的时间段内
-        for student_course in student_courses:
-            schedule = student_course.course_schedule
-            
-            # 转换上课和下课时间为分钟计数
-            start_minutes = schedule.start_time.hour * 60 + schedule.start_time.minute
-            end_minutes = schedule.end_time.hour * 60 + schedule.end_time.minute
-            
-            # 检查当前时间是否在课程时间段内
-            if start_minutes <= current_time <= end_minutes:
-                return student_course
-        
-        return None
+        # 转换为分钟计数，在缓存的周课表中二分查找
+        current_time = check_time.hour * 60 + check_time.minute
+        return get_student_timetable(student_id).find(weekday, current_time, week)
     
     @staticmethod
     def _check_location(user_location, building_location, max_distance=100):
@@ -154,15 +138,33 @@ class AttendanceService:
         Returns:
             bool: 是否在建筑物附近
         """
-        # 转换坐标格式为 (latitude, longitude)，因为geodesic函数需要这种格式
-        user_coords = (user_location[1], user_location[0])
-        building_coords = (building_location[1], building_location[0])
-        
-        # 计算距离（米）
-        distance = geodesic(user_coords, building_coords).meters
+        # 按配置的距离算法计算距离（米），坐标格式为 [longitude, latitude]
+        distance = get_distance_function()(
+            user_location[1], user_location[0],
+            building_location[1], building_location[0]
+        )
         
         return distance <= max_distance
     
+    @staticmethod
+    def _check_geofence(user_location, building_id):
+        """
+        检查用户是否在建筑围栏内，建筑未设置围栏时按签到默认半径判断
+        
+        Args:
+            user_location: 用户位置 [longitude, latitude]
+            building_id: 建筑ID
+            
+        Returns:
+            bool: 是否在建筑围栏内
+        """
+        index = get_building_index()
+        return index.contains(
+            index.position_of(building_id),
+            user_location[1], user_location[0],
+            default_radius=current_app.config.get('CHECK_IN_RADIUS_METERS', 100)
+        )
+    
     @staticmethod
     def find_nearest_building(location):
         """
@@ -179,35 +181,51 @@ class AttendanceService:
                     'is_valid': 是否在有效范围内
                 }
         """
-        # 获取所有建筑
-        buildings = db.session.query(Building).all()
-        
-        if not buildings:
-            return {
-                'building': None,
-                'distance': float('inf'),
-                'is_valid': False
-            }
+        # 从进程内空间索引查找最近的建筑，无需访问数据库
+        index = get_building_index()
+        position, min_distance = index.nearest_position(location[1], location[0])
+        
+        # 判断是否在最近建筑的围栏内，未设置围栏的建筑按默认半径判断
+        is_valid = index.contains(
+            position, location[1], location[0],
+            default_radius=current_app.config.get('GEOFENCE_DEFAULT_RADIUS_METERS', 200),
+            distance=min_distance
+        )
         
-        user_coords = (location[1], location[0])  # (latitude, longitude)
-        nearest_building = None
-        min_distance = float('inf')
+        return {
+            'building': index.building_at(position),
+            'distance': min_distance,
+            'is_valid': is_valid
+        }
+    
+    @staticmethod
+    def find_nearest_buildings(locations):
+        """
+        批量根据GPS位置找到最近的建筑，用于回填和审计大量历史坐标
         
-        # 找到最近的建筑
-        for building in buildings:
-            building_coords = (building.latitude, building.longitude)
-            distance = geodesic(user_coords, building_coords).meters
+        Args:
+            locations: 位置数组，形状为 (n, 2)，每行为 [longitude, latitude]
             
-            if distance < min_distance:
-                min_distance = distance
-                nearest_building = building
+        Returns:
+            dict: 与输入逐行对应的结果
+                {
+                    'buildings': 建筑信息列表（无建筑时为None）,
+                    'distances': 距离数组（米）,
+                    'is_valid': 是否在有效范围内的布尔数组
+                }
+        """
+        locations = np.asarray(locations, dtype=float).reshape(-1, 2)
+        index = get_building_index()
+        positions, distances = index.nearest_batch(locations[:, 1], locations[:, 0])
         
-        # 判断是否在有效范围内（200米内）
-        is_valid = min_distance <= 200
+        is_valid = index.contains_batch(
+            positions, locations[:, 1], locations[:, 0], distances,
+            default_radius=current_app.config.get('GEOFENCE_DEFAULT_RADIUS_METERS', 200)
+        )
         
         return {
-            'building': nearest_building.to_dict() if nearest_building else None,
-            'distance': min_distance,
+            'buildings': [index.building_at(position) for position in positions],
+            'distances': distances,
             'is_valid': is_valid
         }
     
@@ -270,55 +288,78 @@ class AttendanceService:
         
         end_date = start_date + timedelta(days=days-1)
         
-        # 获取学生的所有课程
-        student_courses = db.session.query(StudentCourse).join(
+        # 一次查询取出学生的所有课程及其课程安排、课程信息（已联表，直接填充关联对象）
+        # 配置了校历时在SQL中排除日期范围内不上课的安排
+        calendar = get_semester_calendar()
+        query = db.session.query(StudentCourse).join(
             CourseSchedule, StudentCourse.course_schedule_id == CourseSchedule.id
         ).join(
             Course, StudentCourse.course_id == Course.id
+        ).options(
+            contains_eager(StudentCourse.course_schedule),
+            contains_eager(StudentCourse.course)
         ).filter(
             StudentCourse.student_id == student_id
-        ).all()
+        )
+        
+        range_mask = calendar.week_mask_for_range(start_date, end_date)
+        if range_mask is not None:
+            query = query.filter(or_(
+                CourseSchedule.week_mask.is_(None),
+                CourseSchedule.week_mask.op('&')(range_mask) != 0
+            ))
+        
+        # 按星期分桶，每门课的日期无关信息只构建一次
+        courses_by_weekday = {}
+        for student_course in query.all():
+            course_schedule = student_course.course_schedule
+            course = student_course.course
+            # 从建筑缓存获取建筑信息
+            building = get_building(course_schedule.building_id)
+            
+            courses_by_weekday.setdefault(course_schedule.day_of_week, []).append((course_schedule, {
+                'course_id': course.id,
+                'course_name': course.course_name,
+                'course_code': course.course_code,
+                'teacher': course.teacher_name,
+                'classroom': course_schedule.classroom,
+                'building': building['name_en'] if building else 'Unknown',
+                'building_name': building['name'] if building else 'Unknown',
+                'building_name_en': building['name_en'] if building else 'Unknown',
+                'start_time': course_schedule.start_time.strftime('%H:%M'),
+                'end_time': course_schedule.end_time.strftime('%H:%M'),
+                'time_slot': getattr(course_schedule, 'time_slot', 1)
+            }))
+        
+        # 每个星期的课程按上课时间排序
+        for bucket in courses_by_weekday.values():
+            bucket.sort(key=lambda item: item[1]['start_time'])
         
         # 构建课程表数据
         schedule = []
+        now = datetime.now(tz)
         current_date = start_date
         
         while current_date <= end_date:
-            weekday = current_date.weekday()  # 0-6, 0是星期一
-            
-            # 获取当天的课程
-            daily_courses = []
-            for student_course in student_courses:
-                course_schedule = student_course.course_schedule
-                if course_schedule.day_of_week == weekday:
-                    # 获取建筑信息（course_schedule.building已经是Building对象）
-                    building = course_schedule.building
+            # 按校历解析当天按星期几的课表上课，停课日跳过
+            resolved = calendar.resolve(current_date)
+            if resolved is not None:
+                weekday, week = resolved
+                date_str = current_date.strftime('%Y-%m-%d')
+                
+                # 只遍历当天星期对应的课程
+                for course_schedule, course_info in courses_by_weekday.get(weekday, ()):
+                    if not course_schedule.meets_in_week(week):
+                        continue
                     
-                    # 构建课程信息
-                    course_info = {
-                        'course_id': student_course.course.id,
-                        'course_name': student_course.course.course_name,
-                        'course_code': student_course.course.course_code,
-                        'teacher': student_course.course.teacher_name,
-                        'classroom': course_schedule.classroom,
-                        'building': building.name_en if building else 'Unknown',
-                        'building_name': building.name if building else 'Unknown',
-                        'building_name_en': building.name_en if building else 'Unknown',
-                        'start_time': course_schedule.start_time.strftime('%H:%M'),
-                        'end_time': course_schedule.end_time.strftime('%H:%M'),
-                        'time_slot': getattr(course_schedule, 'time_slot', 1),
-                        'day_of_week': weekday,
-                        'date': current_date.strftime('%Y-%m-%d'),
-                        'status': AttendanceService._get_course_status(current_date, course_schedule.start_time, tz)
-                    }
-                    daily_courses.append(course_info)
-            
-            # 按时间排序
-            daily_courses.sort(key=lambda x: x['start_time'])
-            
-            # 添加到课程表
-            if daily_courses:  # 只添加有课的日期
-                schedule.extend(daily_courses)
+                    schedule.append(dict(
+                        course_info,
+                        day_of_week=current_date.weekday(),
+                        date=date_str,
+                        status=AttendanceService._get_course_status(
+                            current_date, course_schedule.start_time, tz, now
+                        )
+                    ))
             
             current_date += timedelta(days=1)
         
@@ -332,7 +373,7 @@ class AttendanceService:
         }
     
     @staticmethod
-    def _get_course_status(course_date, start_time, tz):
+    def _get_course_status(course_date, start_time, tz, now=None):
         """
         获取课程状态
         
@@ -340,11 +381,13 @@ class AttendanceService:
             course_date: 课程日期
             start_time: 开始时间
             tz: 时区
+            now: 当前时间，批量计算时由调用方传入，默认取当前时间
             
         Returns:
             str: 课程状态 ('upcoming', 'current', 'past')
         """
-        now = datetime.now(tz)
+        if now is None:
+            now = datetime.now(tz)
         course_datetime = datetime.combine(course_date, start_time)
         course_datetime = tz.localize(course_datetime)
         
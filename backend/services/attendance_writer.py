@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+签到记录组提交
+把几毫秒内到达的签到记录合并为一个多行INSERT事务提交，上课开始时的签到高峰不再是每人一次事务提交；
+每个调用方仍然得到自己的签到记录ID或异常
+"""
+
+import time
+import queue
+import logging
+import threading
+from datetime import datetime
+from concurrent.futures import Future
+from flask import current_app
+from sqlalchemy import insert, select
+
+logger = logging.getLogger(__name__)
+
+
+class GroupCommitWriter:
+    """
+    签到记录组提交线程
+
+    后台线程取到第一条记录后继续等待至多 window 秒或凑满 max_batch 条，然后在一个事务中写入整批记录。
+    整批写入失败时逐条重试，只有出错的记录以异常返回给调用方。
+    """
+
+    def __init__(self, app, window=0.005, max_batch=200):
+        self.app = app
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._counters = {'records': 0, 'batches': 0, 'fallbacks': 0, 'errors': 0}
+        self._thread = threading.Thread(target=self._run, name='attendance-group-commit', daemon=True)
+        self._thread.start()
+
+    def submit(self, values):
+        """
+        提交一条签到记录
+
+        Args:
+            values: Attendance列值字典
+
+        Returns:
+            Future: 结果为签到记录ID
+        """
+        future = Future()
+        self._queue.put((dict(values), future))
+        return future
+
+    def write(self, values, timeout=None):
+        """提交一条签到记录并等待写入完成，返回签到记录ID"""
+        return self.submit(values).result(timeout)
+
+    def _collect(self):
+        """阻塞取到第一条记录后，在时间窗口内继续收集同一批记录"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # 调用方可能已超时放弃，但记录仍会写入
+            batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            with self.app.app_context():
+                try:
+                    self._flush(batch)
+                except Exception as e:
+                    logger.error(f"签到记录组提交线程异常: {e}")
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+
+    def _flush(self, batch):
+        """整批写入，失败时逐条重试"""
+        from app import db
+
+        rows = [values for values, _ in batch]
+        now = datetime.utcnow()
+        for values in rows:
+            values.setdefault('created_at', now)
+
+        try:
+            ids = self._insert_batch(db.session, rows)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.warning(f"签到记录批量写入失败，逐条重试（{len(batch)} 条）: {e}")
+            self._count('fallbacks')
+            self._flush_each(batch)
+            return
+        finally:
+            db.session.remove()
+
+        for (_, future), attendance_id in zip(batch, ids):
+            future.set_result(attendance_id)
+        self._count('batches')
+        self._count('records', len(batch))
+
+    def _flush_each(self, batch):
+        """逐条写入，每条一个事务"""
+        from app import db
+
+        for values, future in batch:
+            try:
+                attendance_id = self._insert_batch(db.session, [values])[0]
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                self._count('errors')
+                future.set_exception(e)
+            else:
+                self._count('records')
+                future.set_result(attendance_id)
+            finally:
+                db.session.remove()
+
+    @staticmethod
+    def _insert_batch(session, rows):
+        """
+        执行多行INSERT并按参数顺序返回自增ID，同时更新每日签到汇总
+
+        支持RETURNING的数据库（SQLite 3.35+等）直接返回ID；
+        MySQL多行INSERT分配的自增值不一定连续（innodb_autoinc_lock_mode=2、auto_increment_increment>1），
+        插入后按唯一的请求键查回各行ID；其他数据库（或有记录没有请求键时）逐行插入。
+        """
+        from app import Attendance
+        from services.attendance_rollup import RollupService
+
+        dialect = session.get_bind().dialect
+        if dialect.insert_executemany_returning_sort_by_parameter_order:
+            result = session.execute(
+                insert(Attendance).returning(Attendance.id, sort_by_parameter_order=True), rows
+            )
+            ids = list(result.scalars())
+        elif dialect.name == 'mysql' and all(values.get('request_key') for values in rows):
+            session.execute(insert(Attendance).values(rows))
+            keys = [values['request_key'] for values in rows]
+            id_by_key = dict(session.execute(
+                select(Attendance.request_key, Attendance.id).where(Attendance.request_key.in_(keys))
+            ).all())
+            ids = [id_by_key[key] for key in keys]
+        else:
+            ids = [session.execute(insert(Attendance).values(values)).inserted_primary_key[0] for values in rows]
+
+        # 批量INSERT不经过ORM的flush事件，在同一事务中更新每日汇总
+        RollupService.apply_inserted(session, rows)
+        return ids
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self._counters[key] += amount
+
+    def stats(self):
+        """写入计数：已写入记录数、批量提交次数、逐条重试次数、失败记录数、排队中记录数"""
+        with self._lock:
+            return dict(self._counters, pending=self._queue.qsize())
+
+
+# 全局实例 - 延迟初始化
+attendance_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_attendance_writer():
+    """获取签到记录组提交线程，未开启组提交（ATTENDANCE_GROUP_COMMIT）时返回None"""
+    global attendance_writer
+    if not current_app.config.get('ATTENDANCE_GROUP_COMMIT', False):
+        return None
+    if attendance_writer is None:
+        with _writer_lock:
+            if attendance_writer is None:
+                attendance_writer = GroupCommitWriter(
+                    current_app._get_current_object(),
+                    current_app.config.get('ATTENDANCE_GROUP_COMMIT_WINDOW_MS', 5) / 1000.0,
+                    current_app.config.get('ATTENDANCE_GROUP_COMMIT_MAX_BATCH', 200)
+                )
+    return attendance_writer
@@ -0,0 +1,568 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+建筑空间索引
+在进程内缓存建筑坐标，按校区划分网格，最近建筑与半径查询无需访问数据库
+"""
+
+import math
+import time
+import logging
+import threading
+import numpy as np
+from flask import current_app
+from sqlalchemy import func
+from utils.version_stamp import read_stamp, write_stamp
+from services.response_cache import invalidate_schedule
+from utils.geo_utils import (
+    EARTH_RADIUS_METERS, DISTANCE_STRATEGIES, DISTANCE_MATRIX_STRATEGIES,
+    haversine_distance_matrix, get_distance_strategy
+)
+
+logger = logging.getLogger(__name__)
+
+# 网格单元大小（度），约1公里
+GRID_CELL_DEGREES = 0.01
+
+# 子午圈曲率半径的最小值（WGS-84赤道处，米），纬度差对应距离的下界
+MERIDIAN_RADIUS_MIN = 6335439.0
+# 纬线圈半径计算所用的最小地球半径（米），经度差对应距离的下界
+# 取球面平均半径，对椭球测地线、haversine与等距圆柱投影三种算法均成立
+PARALLEL_RADIUS_MIN = EARTH_RADIUS_METERS
+
+# 浮点误差余量，保证剪枝永远不会排除真正的候选建筑
+_BOUND_SAFETY = 0.999
+
+# 批量查询时每次参与广播计算的点数，控制距离矩阵的内存占用
+BATCH_CHUNK_SIZE = 4096
+# 椭球测地线与球面距离之比落在[0.9944, 1.0045]之间，取更宽的比例筛选精算候选
+GEODESIC_CANDIDATE_RATIO = 1.01 / 0.99
+
+
+def _interval_gap(value, lower, upper):
+    """计算数值到区间的距离，位于区间内时为0"""
+    if value < lower:
+        return lower - value
+    if value > upper:
+        return value - upper
+    return 0.0
+
+
+def _exceeds_limit(lat, lon, min_lat, max_lat, min_lon, max_lon, limit):
+    """
+    判断点到经纬度矩形内任意一点的距离是否一定大于limit
+
+    纬度差乘以最小子午圈半径是距离的严格下界；若距离不超过limit，
+    路径的纬度偏移不超过limit/最小子午圈半径，由此可得经度差的下界。
+
+    Args:
+        lat, lon: 查询点坐标
+        min_lat, max_lat, min_lon, max_lon: 矩形范围
+        limit: 距离上限（米）
+
+    Returns:
+        bool: True表示矩形内所有点的距离都大于limit，可以安全跳过
+    """
+    if math.isinf(limit):
+        return False
+
+    dlat = math.radians(_interval_gap(lat, min_lat, max_lat))
+    if MERIDIAN_RADIUS_MIN * dlat * _BOUND_SAFETY > limit:
+        return True
+
+    dlon = math.radians(_interval_gap(lon, min_lon, max_lon))
+    if dlon == 0:
+        return False
+
+    max_abs_lat = max(abs(lat), abs(min_lat), abs(max_lat))
+    peak_lat = math.radians(max_abs_lat) + limit / MERIDIAN_RADIUS_MIN
+    if peak_lat >= math.pi / 2:
+        return False
+
+    return PARALLEL_RADIUS_MIN * math.cos(peak_lat) * dlon * _BOUND_SAFETY > limit
+
+
+def _radius_bbox(latitude, longitude, radius):
+    """
+    计算圆形围栏的包围盒，包围盒外的点到圆心的距离一定大于半径
+
+    Returns:
+        tuple: (min_lat, max_lat, min_lon, max_lon)
+    """
+    half_lat = math.degrees(radius / MERIDIAN_RADIUS_MIN) / _BOUND_SAFETY
+    # 包围盒内的点纬度偏移不超过半径对应的纬度差，经度方向按更高纬度放宽
+    peak_lat = math.radians(abs(latitude)) + 2 * radius / MERIDIAN_RADIUS_MIN
+    if peak_lat >= math.pi / 2:
+        half_lon = 180.0
+    else:
+        half_lon = math.degrees(radius / (PARALLEL_RADIUS_MIN * math.cos(peak_lat))) / _BOUND_SAFETY
+    return latitude - half_lat, latitude + half_lat, longitude - half_lon, longitude + half_lon
+
+
+def _point_in_polygon(latitude, longitude, vertices):
+    """射线法判断点是否在多边形内，vertices为 [(经度, 纬度), ...]"""
+    inside = False
+    previous_lon, previous_lat = vertices[-1]
+    for vertex_lon, vertex_lat in vertices:
+        if (vertex_lat > latitude) != (previous_lat > latitude):
+            crossing_lon = (previous_lon - vertex_lon) * (latitude - vertex_lat) / (previous_lat - vertex_lat) + vertex_lon
+            if longitude < crossing_lon:
+                inside = not inside
+        previous_lon, previous_lat = vertex_lon, vertex_lat
+    return inside
+
+
+class _Geofence:
+    """建筑围栏，多边形优先于圆形半径，显式设置的围栏预先计算包围盒"""
+
+    __slots__ = ('vertices', 'radius', 'bbox')
+
+    def __init__(self, building):
+        polygon = building.get('polygon')
+        self.vertices = [(float(lon), float(lat)) for lon, lat in polygon] if polygon and len(polygon) >= 3 else None
+        self.radius = building.get('radius')
+        self.bbox = None
+
+        if self.vertices:
+            self.bbox = (
+                min(lat for _, lat in self.vertices), max(lat for _, lat in self.vertices),
+                min(lon for lon, _ in self.vertices), max(lon for lon, _ in self.vertices)
+            )
+        elif self.radius is not None:
+            self.bbox = _radius_bbox(building['latitude'], building['longitude'], self.radius)
+
+
+class _GridCell:
+    """网格单元，记录成员建筑及其紧凑包围盒"""
+
+    __slots__ = ('campus', 'members', 'min_lat', 'max_lat', 'min_lon', 'max_lon')
+
+    def __init__(self, campus):
+        self.campus = campus
+        self.members = []
+        self.min_lat = self.min_lon = float('inf')
+        self.max_lat = self.max_lon = float('-inf')
+
+    def add(self, position, latitude, longitude):
+        self.members.append(position)
+        self.min_lat = min(self.min_lat, latitude)
+        self.max_lat = max(self.max_lat, latitude)
+        self.min_lon = min(self.min_lon, longitude)
+        self.max_lon = max(self.max_lon, longitude)
+
+
+class BuildingIndex:
+    """建筑网格索引，查询结果与用同一距离算法逐个计算的线性扫描完全一致"""
+
+    def __init__(self, buildings, strategy=None, cell_degrees=GRID_CELL_DEGREES):
+        """
+        Args:
+            buildings: 建筑字典列表（Building.to_dict()的结果），顺序即线性扫描顺序
+            strategy: 距离算法名称，默认按配置 DISTANCE_STRATEGY 选择
+            cell_degrees: 网格单元大小（度）
+        """
+        self.strategy = get_distance_strategy(strategy)
+        self.distance = DISTANCE_STRATEGIES[self.strategy]
+        self.cell_degrees = cell_degrees
+        self._buildings = [dict(building) for building in buildings]
+        self._latitudes = [building['latitude'] for building in self._buildings]
+        self._longitudes = [building['longitude'] for building in self._buildings]
+        self._fences = [_Geofence(building) for building in self._buildings]
+        self._positions = {building.get('id'): position for position, building in enumerate(self._buildings)}
+
+        cells = {}
+        for position, building in enumerate(self._buildings):
+            key = (
+                building.get('campus'),
+                math.floor(building['latitude'] / cell_degrees),
+                math.floor(building['longitude'] / cell_degrees)
+            )
+            cell = cells.get(key)
+            if cell is None:
+                cell = cells[key] = _GridCell(building.get('campus'))
+            cell.add(position, building['latitude'], building['longitude'])
+
+        self._cells = list(cells.values())
+
+    @classmethod
+    def from_models(cls, buildings, strategy=None):
+        """由Building模型列表构建索引"""
+        return cls([building.to_dict() for building in buildings], strategy)
+
+    def __len__(self):
+        return len(self._buildings)
+
+    def position_of(self, building_id):
+        """获取建筑在扫描顺序中的位置，不存在时返回-1"""
+        return self._positions.get(building_id, -1)
+
+    def building_at(self, position):
+        """按扫描顺序位置获取建筑字典，位置为-1时返回None"""
+        if position < 0:
+            return None
+        return dict(self._buildings[position])
+
+    def _ordered_cells(self, latitude, longitude):
+        """按网格单元与查询点的近似距离排序，尽早得到较小的最近距离以便剪枝"""
+        cos_lat = math.cos(math.radians(latitude))
+
+        def approx_gap(cell):
+            dlat = _interval_gap(latitude, cell.min_lat, cell.max_lat)
+            dlon = _interval_gap(longitude, cell.min_lon, cell.max_lon) * cos_lat
+            return dlat * dlat + dlon * dlon
+
+        return sorted(self._cells, key=approx_gap)
+
+    def nearest(self, latitude, longitude):
+        """
+        查找最近的建筑
+
+        Args:
+            latitude: 纬度
+            longitude: 经度
+
+        Returns:
+            tuple: (建筑字典, 距离（米）)，无建筑时为 (None, inf)
+        """
+        position, distance = self.nearest_position(latitude, longitude)
+        return self.building_at(position), distance
+
+    def nearest_position(self, latitude, longitude):
+        """
+        查找最近的建筑位置
+
+        Returns:
+            tuple: (建筑位置, 距离（米）)，无建筑时为 (-1, inf)
+        """
+        best_position = -1
+        best_distance = float('inf')
+
+        for cell in self._ordered_cells(latitude, longitude):
+            if _exceeds_limit(latitude, longitude, cell.min_lat, cell.max_lat,
+                              cell.min_lon, cell.max_lon, best_distance):
+                continue
+
+            for position in cell.members:
+                building_lat = self._latitudes[position]
+                building_lon = self._longitudes[position]
+                if _exceeds_limit(latitude, longitude, building_lat, building_lat,
+                                  building_lon, building_lon, best_distance):
+                    continue
+
+                distance = self.distance(latitude, longitude, building_lat, building_lon)
+                # 距离相同时取扫描顺序靠前的建筑，与线性扫描保持一致
+                if distance < best_distance or (
+                        distance == best_distance and position < best_position):
+                    best_distance = distance
+                    best_position = position
+
+        return best_position, best_distance
+
+    def within_radius(self, latitude, longitude, radius):
+        """
+        查找半径范围内的所有建筑
+
+        Args:
+            latitude: 纬度
+            longitude: 经度
+            radius: 半径（米）
+
+        Returns:
+            list: [(建筑字典, 距离（米）), ...]，按距离从近到远排序
+        """
+        matches = []
+        for cell in self._cells:
+            if _exceeds_limit(latitude, longitude, cell.min_lat, cell.max_lat,
+                              cell.min_lon, cell.max_lon, radius):
+                continue
+
+            for position in cell.members:
+                distance = self.distance(
+                    latitude, longitude, self._latitudes[position], self._longitudes[position]
+                )
+                if distance <= radius:
+                    matches.append((distance, position))
+
+        matches.sort()
+        return [(dict(self._buildings[position]), distance) for distance, position in matches]
+
+    def contains(self, position, latitude, longitude, default_radius=None, distance=None):
+        """
+        判断点是否在建筑围栏内，先用包围盒快速排除，再做精确判断
+
+        Args:
+            position: 建筑位置
+            latitude, longitude: 点坐标
+            default_radius: 建筑未设置围栏时使用的半径（米），为空时视为不在围栏内
+            distance: 已算好的点到建筑中心的距离（米），可省去重复计算
+
+        Returns:
+            bool: 是否在围栏内
+        """
+        if position < 0:
+            return False
+
+        fence = self._fences[position]
+        radius = fence.radius if fence.radius is not None else default_radius
+        if fence.vertices is None and radius is None:
+            return False
+
+        bbox = fence.bbox
+        if bbox is None:
+            bbox = _radius_bbox(self._latitudes[position], self._longitudes[position], radius)
+        min_lat, max_lat, min_lon, max_lon = bbox
+        if not (min_lat <= latitude <= max_lat and min_lon <= longitude <= max_lon):
+            return False
+
+        if fence.vertices is not None:
+            return _point_in_polygon(latitude, longitude, fence.vertices)
+
+        if distance is None:
+            distance = self.distance(latitude, longitude, self._latitudes[position], self._longitudes[position])
+        return distance <= radius
+
+    def contains_batch(self, positions, latitudes, longitudes, distances, default_radius=None):
+        """
+        批量判断点是否在对应建筑的围栏内
+
+        圆形围栏直接用已算好的距离向量化比较，多边形围栏逐点判断。
+
+        Args:
+            positions: 建筑位置数组（-1表示无建筑）
+            latitudes, longitudes: 点坐标数组
+            distances: 点到对应建筑中心的距离数组（米）
+            default_radius: 建筑未设置围栏时使用的半径（米）
+
+        Returns:
+            ndarray: 布尔数组
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        distances = np.asarray(distances, dtype=float)
+        result = np.zeros(len(positions), dtype=bool)
+        if not self._buildings or len(positions) == 0:
+            return result
+
+        fallback = np.nan if default_radius is None else float(default_radius)
+        radii = np.array([
+            np.nan if fence.vertices is not None else (fence.radius if fence.radius is not None else fallback)
+            for fence in self._fences
+        ], dtype=float)
+
+        valid = positions >= 0
+        point_radii = np.full(len(positions), np.nan)
+        point_radii[valid] = radii[positions[valid]]
+        with np.errstate(invalid='ignore'):
+            result = valid & (distances <= point_radii)
+
+        for row in np.flatnonzero(valid & np.isnan(point_radii)):
+            position = positions[row]
+            if self._fences[position].vertices is not None:
+                result[row] = self.contains(position, float(latitudes[row]), float(longitudes[row]))
+
+        return result
+
+    def nearest_batch(self, latitudes, longitudes, chunk_size=BATCH_CHUNK_SIZE):
+        """
+        批量查找最近的建筑，结果与逐点调用 nearest() 相同
+
+        可向量化的算法直接对距离矩阵取最小值；测地线先用球面距离矩阵
+        筛出可能最近的少数候选，再逐个精确计算。
+
+        Args:
+            latitudes: 纬度数组
+            longitudes: 经度数组
+            chunk_size: 每批参与广播计算的点数
+
+        Returns:
+            tuple: (建筑位置数组, 距离数组)，无建筑时位置为-1、距离为inf
+        """
+        latitudes = np.asarray(latitudes, dtype=float).ravel()
+        longitudes = np.asarray(longitudes, dtype=float).ravel()
+        count = len(latitudes)
+
+        positions = np.full(count, -1, dtype=np.int64)
+        distances = np.full(count, np.inf)
+        if not self._buildings or count == 0:
+            return positions, distances
+
+        building_lats = np.asarray(self._latitudes, dtype=float)
+        building_lons = np.asarray(self._longitudes, dtype=float)
+        matrix_func = DISTANCE_MATRIX_STRATEGIES.get(self.strategy)
+
+        for start in range(0, count, chunk_size):
+            end = min(start + chunk_size, count)
+            chunk_lats = latitudes[start:end]
+            chunk_lons = longitudes[start:end]
+
+            if matrix_func is not None:
+                matrix = matrix_func(chunk_lats, chunk_lons, building_lats, building_lons)
+                # argmin在距离相同时返回第一个位置，与线性扫描一致
+                nearest_positions = matrix.argmin(axis=1)
+                positions[start:end] = nearest_positions
+                distances[start:end] = matrix[np.arange(end - start), nearest_positions]
+                continue
+
+            approx = haversine_distance_matrix(chunk_lats, chunk_lons, building_lats, building_lons)
+            limits = approx.min(axis=1) * GEODESIC_CANDIDATE_RATIO + 1e-6
+            candidates = approx <= limits[:, np.newaxis]
+            for row in range(end - start):
+                latitude = float(chunk_lats[row])
+                longitude = float(chunk_lons[row])
+                best_position = -1
+                best_distance = float('inf')
+                for position in np.flatnonzero(candidates[row]):
+                    distance = self.distance(
+                        latitude, longitude, self._latitudes[position], self._longitudes[position]
+                    )
+                    if distance < best_distance:
+                        best_distance = distance
+                        best_position = position
+                positions[start + row] = best_position
+                distances[start + row] = best_distance
+
+        return positions, distances
+
+
+class BuildingCache:
+    """
+    版本化的建筑缓存，以建筑数量和最大updated_at作为数据版本
+
+    各工作进程通过共享的版本戳文件感知重新加载请求：稳态下只检查戳文件，
+    不访问数据库；戳文件变化后查询一次版本，版本变化时才重新加载建筑数据。
+    """
+
+    def __init__(self):
+        self._index = None
+        self._version = None
+        self._stamp = None
+        self._checked_at = 0.0
+        self._miss_checked_at = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _config(key, default):
+        try:
+            return current_app.config.get(key, default)
+        except RuntimeError:
+            # 在应用上下文外时使用默认值
+            return default
+
+    @classmethod
+    def _stamp_path(cls):
+        return cls._config('BUILDING_CACHE_STAMP_PATH', None)
+
+    @staticmethod
+    def _query_version():
+        """查询建筑数据版本：(建筑数量, 最大updated_at)"""
+        from app import db
+        from models.building import Building
+        count, last_updated = db.session.query(
+            func.count(Building.id), func.max(Building.updated_at)
+        ).one()
+        return count, last_updated
+
+    def _refresh(self, stamp):
+        """按数据版本刷新索引，版本未变化时保留现有索引"""
+        version = self._query_version()
+        if self._index is None or version != self._version:
+            from app import db
+            from models.building import Building
+            buildings = db.session.query(Building).order_by(Building.id).all()
+            self._index = BuildingIndex.from_models(buildings)
+            self._version = version
+            logger.info(f"建筑缓存已加载: {len(self._index)} 栋建筑，版本 {version}")
+        self._stamp = stamp
+        self._checked_at = time.monotonic()
+
+    def get_index(self):
+        """获取建筑索引，首次调用或收到重新加载请求时从数据库加载"""
+        index = self._index
+        interval = self._config('BUILDING_CACHE_CHECK_INTERVAL', 1.0)
+        if index is not None and time.monotonic() - self._checked_at < interval:
+            return index
+
+        with self._lock:
+            stamp = read_stamp(self._stamp_path())
+            if self._index is None or stamp != self._stamp:
+                self._refresh(stamp)
+            else:
+                self._checked_at = time.monotonic()
+            return self._index
+
+    def get_building(self, building_id):
+        """
+        按ID读取建筑信息，缓存未命中时检查一次数据版本后重试
+
+        Returns:
+            dict: 建筑信息，不存在时返回None
+        """
+        index = self.get_index()
+        position = index.position_of(building_id)
+        if position < 0 and building_id is not None:
+            interval = self._config('BUILDING_CACHE_CHECK_INTERVAL', 1.0)
+            with self._lock:
+                # 限制未命中触发的版本查询频率，避免不存在的ID反复访问数据库
+                if time.monotonic() - self._miss_checked_at >= interval:
+                    self._miss_checked_at = time.monotonic()
+                    self._refresh(self._stamp)
+                index = self._index
+            position = index.position_of(building_id)
+        return index.building_at(position)
+
+    def invalidate(self):
+        """清除本进程的缓存，下次查询时重新加载"""
+        with self._lock:
+            self._index = None
+            self._version = None
+
+    def reload(self):
+        """
+        通知所有工作进程重新加载：写入新的版本戳并立即刷新本进程
+
+        Returns:
+            dict: 重新加载后的缓存信息
+        """
+        stamp = write_stamp(self._stamp_path())
+        # 课表响应中含教学楼名称
+        invalidate_schedule()
+
+        with self._lock:
+            self._index = None
+            self._refresh(stamp)
+            return self.info()
+
+    def info(self):
+        """缓存状态信息"""
+        count, last_updated = self._version or (0, None)
+        return {
+            'buildings': len(self._index) if self._index is not None else 0,
+            'version': {
+                'count': count,
+                'updated_at': last_updated.isoformat() if last_updated else None
+            },
+            'stamp': self._stamp
+        }
+
+
+# 进程内缓存实例
+building_cache = BuildingCache()
+
+
+def get_building_index():
+    """获取建筑索引"""
+    return building_cache.get_index()
+
+
+def get_building(building_id):
+    """按ID读取建筑信息，不访问数据库"""
+    return building_cache.get_building(building_id)
+
+
+def invalidate_building_index():
+    """清除本进程的建筑索引，下次查询时重新加载"""
+    building_cache.invalidate()
+
+
+def reload_building_cache():
+    """通知所有工作进程重新加载建筑数据"""
+    return building_cache.reload()
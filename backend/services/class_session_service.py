@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+课堂表服务
+把课程安排按校历展开为具体日期的课堂，签到、缺勤检测和统计可直接按索引做范围查询
+"""
+
+import logging
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select, insert, delete
+from models.course_schedule import ClassSession, CourseSchedule, Course, StudentCourse
+from services.semester_calendar import get_semester_calendar
+from app import db, User, Attendance
+
+logger = logging.getLogger(__name__)
+
+
+class ClassSessionService:
+    """课堂表服务类"""
+
+    @staticmethod
+    def semester_range(semester_name=None):
+        """
+        获取校历中学期覆盖的日期范围
+
+        Args:
+            semester_name: 学期名称，为空时覆盖所有已配置的学期
+
+        Returns:
+            tuple: (开始日期, 结束日期)
+
+        Raises:
+            ValueError: 未配置校历或找不到指定学期
+        """
+        semesters = get_semester_calendar().semesters
+        if semester_name:
+            semesters = [semester for semester in semesters if semester.name == semester_name]
+        if not semesters:
+            raise ValueError(f"校历中没有学期: {semester_name}" if semester_name else "未配置校历，请指定日期范围")
+        return semesters[0].start_date, max(semester.end_date for semester in semesters)
+
+    @staticmethod
+    def generate_sessions(start_date, end_date, chunk_size=1000):
+        """
+        按校历把所有课程安排展开为日期范围内的课堂，范围内已有的课堂会被替换
+
+        Args:
+            start_date: 开始日期（含）
+            end_date: 结束日期（含）
+            chunk_size: 每批插入的行数
+
+        Returns:
+            dict: {'days': 上课天数, 'sessions': 生成的课堂数}
+        """
+        calendar = get_semester_calendar()
+        late_threshold = timedelta(minutes=current_app.config.get('LATE_THRESHOLD_MINUTES', 15))
+
+        # 课程安排只读取一次，按星期分桶
+        schedules_by_weekday = {}
+        rows = db.session.execute(select(
+            CourseSchedule.id, CourseSchedule.course_id, CourseSchedule.building_id,
+            CourseSchedule.classroom, CourseSchedule.day_of_week,
+            CourseSchedule.start_time, CourseSchedule.end_time, CourseSchedule.week_mask
+        ))
+        for row in rows:
+            schedules_by_weekday.setdefault(row.day_of_week, []).append(row)
+
+        sessions = []
+        days = 0
+        current_date = start_date
+        while current_date <= end_date:
+            # 调休补课日按被调换日期的课表上课，停课日跳过
+            resolved = calendar.resolve(current_date)
+            if resolved is not None:
+                weekday, week = resolved
+                days += 1
+                for row in schedules_by_weekday.get(weekday, ()):
+                    if week is not None and row.week_mask is not None and not row.week_mask & (1 << (week - 1)):
+                        continue
+
+                    start_at = datetime.combine(current_date, row.start_time)
+                    sessions.append({
+                        'course_schedule_id': row.id,
+                        'course_id': row.course_id,
+                        'session_date': current_date,
+                        'week': week,
+                        'start_at': start_at,
+                        'end_at': datetime.combine(current_date, row.end_time),
+                        'late_cutoff': start_at + late_threshold,
+                        'building_id': row.building_id,
+                        'classroom': row.classroom,
+                        'created_at': datetime.now()
+                    })
+            current_date += timedelta(days=1)
+
+        # 删除与批量插入在同一事务中完成，失败时保留原有课堂
+        try:
+            db.session.execute(delete(ClassSession).where(
+                ClassSession.session_date >= start_date,
+                ClassSession.session_date <= end_date
+            ))
+            for offset in range(0, len(sessions), chunk_size):
+                db.session.execute(insert(ClassSession), sessions[offset:offset + chunk_size])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        logger.info(f"课堂表生成完成: {start_date} ~ {end_date}，{days} 个上课日，{len(sessions)} 节课")
+        return {'days': days, 'sessions': len(sessions)}
+
+    @staticmethod
+    def get_current_session(student_id, at=None):
+        """
+        获取学生某时刻正在进行的课堂
+
+        Args:
+            student_id: 学生ID
+            at: 学校当地时间（naive datetime），默认当前时间
+
+        Returns:
+            ClassSession: 多节课重叠时返回开始时间最晚的一节，没有课时返回None
+        """
+        at = at or datetime.now()
+        return db.session.query(ClassSession).join(
+            StudentCourse, StudentCourse.course_schedule_id == ClassSession.course_schedule_id
+        ).filter(
+            StudentCourse.student_id == student_id,
+            ClassSession.session_date == at.date(),
+            ClassSession.start_at <= at,
+            ClassSession.end_at >= at
+        ).order_by(ClassSession.start_at.desc()).first()
+
+    @staticmethod
+    def get_sessions(start_at, end_at, building_id=None):
+        """
+        获取时间范围内开始的课堂
+
+        Args:
+            start_at: 开始时间（含）
+            end_at: 结束时间（不含）
+            building_id: 教学楼ID，为空时不限
+
+        Returns:
+            list: ClassSession列表，按上课时间排序
+        """
+        query = db.session.query(ClassSession).filter(
+            ClassSession.session_date >= start_at.date(),
+            ClassSession.session_date <= end_at.date(),
+            ClassSession.start_at >= start_at,
+            ClassSession.start_at < end_at
+        )
+        if building_id is not None:
+            query = query.filter(ClassSession.building_id == building_id)
+        return query.order_by(ClassSession.start_at, ClassSession.id).all()
+
+    @staticmethod
+    def find_absentees(session_id):
+        """
+        查找课堂的缺勤学生：选了该课程安排但在上课期间没有有效签到记录的学生
+
+        Args:
+            session_id: 课堂ID
+
+        Returns:
+            list: 缺勤学生的学号，课堂不存在时返回None
+        """
+        session = db.session.get(ClassSession, session_id)
+        if session is None:
+            return None
+
+        # 上课期间该课程的有效签到（签到记录只保存课程名称）
+        signed_in = select(User.student_id).join(
+            Attendance, Attendance.user_id == User.id
+        ).join(
+            Course, Course.course_name == Attendance.course_name
+        ).where(
+            Course.id == session.course_id,
+            Attendance.signed_at >= session.start_at,
+            Attendance.signed_at <= session.end_at,
+            Attendance.status != 'absent'
+        )
+
+        rows = db.session.execute(select(StudentCourse.student_id).where(
+            StudentCourse.course_schedule_id == session.course_schedule_id,
+            StudentCourse.status == 'active',
+            StudentCourse.student_id.not_in(signed_in)
+        ).order_by(StudentCourse.student_id))
+        return [row.student_id for row in rows]
@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+签到照片后台处理
+签到记录先以待处理状态提交，照片的解码、企业微信下载、压缩和保存由后台线程池完成后再回填photo_path，
+避免企业微信媒体服务变慢或图片压缩占用请求线程；
+进程退出时未处理完的照片由恢复线程重新提交（照片来源记录在签到记录的photo_source列）
+"""
+
+import os
+import time
+import base64
+import logging
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from sqlalchemy import select, update
+from services.photo_store import get_photo_store
+from services.signin_upload import (
+    INCOMING_DIR, UPLOAD_REFERENCE_PREFIX, is_upload_reference, incoming_path, open_incoming_photo,
+    discard_incoming_photo
+)
+from utils.image_utils import process_photo
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# 照片处理状态
+PHOTO_PENDING = 'pending'
+PHOTO_READY = 'ready'
+PHOTO_FAILED = 'failed'
+
+# 签到记录photo_source列的长度
+PHOTO_SOURCE_MAX_LENGTH = 200
+
+# 恢复线程的文件锁（位于incoming目录，清理孤立文件时跳过）
+RECOVERY_LOCK_NAME = '.photo_recovery.lock'
+
+
+def is_supported_photo(photo):
+    """照片是否为可处理的格式：base64数据、multipart上传的照片引用或企业微信serverId"""
+    if not photo:
+        return False
+    return photo.startswith('data:image/') or (len(photo) > 10 and not photo.startswith('http'))
+
+
+def photo_source(photo):
+    """
+    签到记录中保存的照片来源：multipart上传的照片引用或企业微信serverId，
+    照片未处理完进程就退出时据此重新处理；base64数据只在内存中，无法恢复，返回None
+    """
+    if not is_supported_photo(photo) or photo.startswith('data:image/') or len(photo) > PHOTO_SOURCE_MAX_LENGTH:
+        return None
+    return photo
+
+
+def save_signin_photo(photo):
+    """
+    解码或下载签到照片，按上传配置压缩后与缩略图一起存入照片存储
+
+    Args:
+        photo: base64数据（data:image/...）、multipart上传的照片引用（upload:...）或企业微信serverId
+
+    Returns:
+        tuple: (照片路径, 缩略图路径)，均相对上传目录；无法获取照片时返回 (None, None)，
+               无法识别为图片时原样保存且缩略图路径为None
+    """
+    incoming = None
+    if photo.startswith('data:image/'):
+        # 解析base64数据
+        header, data = photo.split(',', 1)
+        image_data = base64.b64decode(data)
+    elif is_upload_reference(photo):
+        # multipart上传时已写入incoming目录
+        incoming = photo
+    else:
+        # 企业微信serverId格式，通过企业微信API流式下载到incoming目录
+        incoming = _download_wechat_photo(photo)
+        if not incoming:
+            logger.warning(f"无法从企业微信下载照片: {photo}")
+            return None, None
+
+    if incoming:
+        source = incoming_path(incoming)
+        if not os.path.exists(source):
+            logger.warning(f"待处理照片不存在: {photo}")
+            return None, None
+    else:
+        source = image_data
+
+    try:
+        try:
+            image_data, thumbnail_data = process_photo(source)
+        except ValueError as e:
+            logger.warning(f"照片无法压缩，保存原始数据: {e}")
+            if incoming:
+                with open(source, 'rb') as f:
+                    image_data = f.read()
+            thumbnail_data = None
+
+        store = get_photo_store('photos')
+        photo_path = store.upload_path(store.put(image_data, 'jpg'))
+        thumbnail_path = store.upload_path(store.put(thumbnail_data, 'jpg')) if thumbnail_data else None
+    finally:
+        # incoming中的原始照片处理完成后删除；保存失败时签到记录标记为failed，原始照片同样不再需要
+        if incoming:
+            discard_incoming_photo(incoming)
+
+    logger.info(f"照片已保存: {photo_path}（{len(image_data)} 字节）")
+    return photo_path, thumbnail_path
+
+
+def _download_wechat_photo(media_id):
+    """
+    把企业微信照片按块下载到incoming目录，下载时检查大小上限与图片文件头
+
+    Returns:
+        str: 照片引用，下载失败时返回None
+    """
+    from wechat_api import get_wechat_api
+
+    writer = open_incoming_photo()
+    try:
+        downloaded = get_wechat_api().download_media_to(media_id, writer, writer.max_size)
+    except Exception:
+        writer.discard()
+        raise
+    if not downloaded:
+        writer.discard()
+        return None
+    return writer.commit()
+
+
+class PhotoPipeline:
+    """
+    签到照片处理线程池
+
+    排队中的任务数有上限，队列已满时在调用线程中直接处理，保证照片不会丢失。
+    """
+
+    def __init__(self, workers=4, queue_size=200):
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='photo') if workers > 0 else None
+        # 正在处理与排队中的任务共用的名额
+        self._slots = threading.BoundedSemaphore(workers + queue_size) if workers > 0 else None
+        self._lock = threading.Lock()
+        self._counters = {'submitted': 0, 'inline': 0, 'ready': 0, 'failed': 0}
+
+    def submit(self, attendance_id, student_id, photo):
+        """
+        提交签到照片的处理任务
+
+        Args:
+            attendance_id: 签到记录ID（记录需已提交）
+            student_id: 学号
+            photo: base64数据或企业微信serverId
+
+        Returns:
+            bool: 是否交由后台线程处理，False表示已在当前线程处理完成
+        """
+        app = current_app._get_current_object()
+        task = (app, attendance_id, student_id, photo)
+
+        if self._slots is not None and self._slots.acquire(blocking=False):
+            self._count('submitted')
+            try:
+                self._executor.submit(self._run_queued, *task)
+                return True
+            except RuntimeError:
+                # 线程池已关闭（进程退出中）
+                self._slots.release()
+
+        if self._executor is not None:
+            logger.warning(f"照片处理队列已满，在请求线程中处理签到记录 {attendance_id} 的照片")
+        self._count('inline')
+        self._process(*task)
+        return False
+
+    def _run_queued(self, *task):
+        """后台线程执行任务并归还名额"""
+        try:
+            self._process(*task)
+        finally:
+            self._slots.release()
+
+    def _process(self, app, attendance_id, student_id, photo):
+        """压缩保存照片并回填签到记录"""
+        from app import db, Attendance
+        from services.response_cache import invalidate_attendance
+
+        with app.app_context():
+            try:
+                photo_path, thumbnail_path = save_signin_photo(photo)
+            except Exception as e:
+                logger.error(f"签到记录 {attendance_id}（{student_id}）照片处理失败: {e}")
+                photo_path, thumbnail_path = None, None
+
+            status = PHOTO_READY if photo_path else PHOTO_FAILED
+            self._count(status)
+            try:
+                # 只回填仍为待处理状态的记录：恢复线程重新提交的照片可能已由原任务处理完成
+                result = db.session.execute(
+                    update(Attendance)
+                    .where(Attendance.id == attendance_id, Attendance.photo_status == PHOTO_PENDING)
+                    .values(
+                        photo_path=photo_path, thumbnail_path=thumbnail_path, photo_status=status, photo_source=None
+                    )
+                )
+                if result.rowcount == 0:
+                    db.session.rollback()
+                    logger.info(f"签到记录 {attendance_id} 的照片已处理过，忽略本次结果")
+                    return
+                signed_at = db.session.execute(
+                    select(Attendance.signed_at).where(Attendance.id == attendance_id)
+                ).scalar()
+                db.session.commit()
+                if signed_at is not None:
+                    invalidate_attendance([(student_id, signed_at)])
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"签到记录 {attendance_id} 照片路径回填失败: {e}")
+            finally:
+                db.session.remove()
+
+    def _count(self, key):
+        with self._lock:
+            self._counters[key] += 1
+
+    def stats(self):
+        """处理计数"""
+        with self._lock:
+            return dict(self._counters, workers=self.workers)
+
+    def shutdown(self, wait=True):
+        """关闭线程池，wait为True时等待排队中的照片处理完成"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+
+
+# 全局实例 - 延迟初始化
+photo_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+def get_photo_pipeline():
+    """获取签到照片处理线程池"""
+    global photo_pipeline
+    if photo_pipeline is None:
+        with _pipeline_lock:
+            if photo_pipeline is None:
+                photo_pipeline = PhotoPipeline(
+                    current_app.config.get('PHOTO_WORKERS', 4),
+                    current_app.config.get('PHOTO_QUEUE_SIZE', 200)
+                )
+    return photo_pipeline
+
+
+def _recoverable(source):
+    """照片来源是否仍可用：上传的照片文件还在，或为企业微信serverId（可重新下载）"""
+    if not source:
+        return False
+    if not is_upload_reference(source):
+        return True
+    try:
+        return os.path.exists(incoming_path(source))
+    except ValueError:
+        return False
+
+
+def recover_pending_photos(min_age=900, chunk_size=500):
+    """
+    恢复进程退出时未处理完的签到照片（需在应用上下文中调用）
+
+    创建超过min_age秒仍为待处理状态的签到记录：照片来源仍可用时重新提交处理，否则标记为failed；
+    incoming目录中超过min_age秒且没有被签到记录或签到日志引用的文件视为孤立文件删除。
+    较新的记录与文件可能仍在处理或上传中，不做处理。
+
+    Returns:
+        dict: {'resubmitted': 重新提交数, 'failed': 标记失败数, 'removed': 删除的孤立文件数}
+    """
+    from app import db, Attendance, User
+    from services.response_cache import invalidate_attendance
+    from services.signin_journal import get_signin_journal
+
+    started = time.time()
+    stale_before = datetime.utcnow() - timedelta(seconds=min_age)
+
+    # 先读签到日志再读签到记录：日志记录写入主数据库后才删除，两次读取之间写入的照片不会漏掉
+    journal = get_signin_journal()
+    referenced = journal.photo_references() if journal is not None else set()
+    try:
+        rows = db.session.execute(
+            select(Attendance.id, Attendance.photo_source, Attendance.signed_at, Attendance.created_at, User.student_id)
+            .join(User, User.id == Attendance.user_id)
+            .where(Attendance.photo_status == PHOTO_PENDING)
+        ).all()
+        db.session.commit()
+
+        resubmit = []
+        failed = []
+        for row in rows:
+            if row.photo_source:
+                referenced.add(row.photo_source)
+            if row.created_at is not None and row.created_at > stale_before:
+                continue
+            (resubmit if _recoverable(row.photo_source) else failed).append(row)
+
+        for start in range(0, len(failed), chunk_size):
+            chunk = failed[start:start + chunk_size]
+            db.session.execute(
+                update(Attendance)
+                .where(Attendance.id.in_([row.id for row in chunk]), Attendance.photo_status == PHOTO_PENDING)
+                .values(photo_status=PHOTO_FAILED, photo_source=None)
+            )
+            db.session.commit()
+            invalidate_attendance([(row.student_id, row.signed_at) for row in chunk])
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        db.session.remove()
+
+    if resubmit:
+        pipeline = get_photo_pipeline()
+        for row in resubmit:
+            pipeline.submit(row.id, row.student_id, row.photo_source)
+
+    removed = 0
+    folder = os.path.join(current_app.config['UPLOAD_FOLDER'], INCOMING_DIR)
+    if os.path.isdir(folder):
+        for entry in os.scandir(folder):
+            if not entry.is_file() or entry.name == RECOVERY_LOCK_NAME:
+                continue
+            if f"{UPLOAD_REFERENCE_PREFIX}{INCOMING_DIR}/{entry.name}" in referenced:
+                continue
+            try:
+                if entry.stat().st_mtime > started - min_age:
+                    continue
+                os.remove(entry.path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+
+    return {'resubmitted': len(resubmit), 'failed': len(failed), 'removed': removed}
+
+
+class PhotoRecovery:
+    """
+    待处理照片恢复线程
+
+    启动时执行一次恢复，之后每隔interval秒执行一次；多个工作进程中只有取得incoming目录文件锁的进程执行，
+    该进程退出后由其他进程接替。
+    """
+
+    def __init__(self, app, interval=600, min_age=900):
+        self.app = app
+        self.interval = interval
+        self.min_age = min_age
+        self._lock_file = None
+        self._thread = threading.Thread(target=self._run, name='photo-recovery', daemon=True)
+        self._thread.start()
+
+    def _acquire(self):
+        """取得（或已持有）恢复锁时返回True；没有fcntl的平台上不加锁"""
+        if fcntl is None or self._lock_file is not None:
+            return True
+        folder = os.path.join(self.app.config['UPLOAD_FOLDER'], INCOMING_DIR)
+        os.makedirs(folder, exist_ok=True)
+        lock_file = open(os.path.join(folder, RECOVERY_LOCK_NAME), 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def _run(self):
+        while True:
+            try:
+                if self._acquire():
+                    with self.app.app_context():
+                        result = recover_pending_photos(self.min_age)
+                    if any(result.values()):
+                        logger.info(
+                            f"待处理照片恢复: 重新提交 {result['resubmitted']} 张，"
+                            f"标记失败 {result['failed']} 张，删除孤立文件 {result['removed']} 个"
+                        )
+            except Exception as e:
+                logger.error(f"待处理照片恢复失败: {e}")
+            time.sleep(self.interval)
+
+
+# 进程内恢复线程，未开启时为None
+photo_recovery = None
+
+
+def init_photo_recovery(app):
+    """按配置启动待处理照片恢复线程（PHOTO_RECOVERY_INTERVAL为0时不启动）"""
+    global photo_recovery
+    interval = app.config.get('PHOTO_RECOVERY_INTERVAL', 600)
+    if not interval:
+        return None
+    photo_recovery = PhotoRecovery(app, interval, app.config.get('PHOTO_RECOVERY_MIN_AGE', 900))
+    return photo_recovery
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+内容寻址的照片存储
+文件按内容的SHA-256命名并分两级目录存放（ab/cd/abcd....jpg），相同内容只保存一份，
+避免单个目录文件过多以及同名文件互相覆盖
+"""
+
+import os
+import re
+import hashlib
+import tempfile
+import threading
+from flask import current_app
+
+# 两级分片目录，每级取摘要的2个十六进制字符
+SHARD_LEVELS = 2
+SHARD_WIDTH = 2
+
+# 存储键格式：ab/cd/<64位摘要>.<扩展名>
+STORE_KEY_PATTERN = re.compile(r'^[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.[a-z0-9]+$')
+
+
+class PhotoTooLarge(ValueError):
+    """写入的数据超过大小上限"""
+
+
+class PendingPhoto:
+    """
+    流式写入中的照片，边写边计算摘要，提交时按摘要移动到最终位置
+
+    用法：
+        with store.open_writer('jpg') as writer:
+            for chunk in stream:
+                writer.write(chunk)
+        key = writer.key
+    """
+
+    def __init__(self, store, ext, max_size=None):
+        self.store = store
+        self.ext = ext
+        self.max_size = max_size
+        self.size = 0
+        self.key = None
+        self._hash = hashlib.sha256()
+        os.makedirs(store.tmp_dir, exist_ok=True)
+        self._file = tempfile.NamedTemporaryFile(dir=store.tmp_dir, delete=False)
+
+    def write(self, chunk):
+        """写入一段数据，超过大小上限时抛出PhotoTooLarge"""
+        self.size += len(chunk)
+        if self.max_size is not None and self.size > self.max_size:
+            raise PhotoTooLarge(f"文件超过大小上限 {self.max_size} 字节")
+        self._hash.update(chunk)
+        self._file.write(chunk)
+
+    def commit(self):
+        """完成写入并返回存储键，相同内容已存在时丢弃本次写入"""
+        self._file.close()
+        self.key = self.store.key_for(self._hash.hexdigest(), self.ext)
+        self.store._place(self._file.name, self.key)
+        return self.key
+
+    def discard(self):
+        """放弃写入并删除临时文件"""
+        self._file.close()
+        try:
+            os.remove(self._file.name)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.discard()
+        return False
+
+
+class PhotoStore:
+    """上传目录下某一类文件（签到照片、反馈图片）的内容寻址存储"""
+
+    def __init__(self, upload_folder, namespace):
+        self.namespace = namespace
+        self.root = os.path.join(upload_folder, namespace)
+        self.tmp_dir = os.path.join(self.root, '.tmp')
+
+    @staticmethod
+    def key_for(digest, ext):
+        """由摘要和扩展名生成存储键"""
+        shards = [digest[i * SHARD_WIDTH:(i + 1) * SHARD_WIDTH] for i in range(SHARD_LEVELS)]
+        return '/'.join(shards + [f"{digest}.{ext.lower()}"])
+
+    @staticmethod
+    def is_key(name):
+        """是否为存储键格式（用于区分旧版平铺文件）"""
+        return bool(STORE_KEY_PATTERN.match(name or ''))
+
+    def full_path(self, key):
+        """存储键对应的文件路径"""
+        return os.path.join(self.root, *key.split('/'))
+
+    def upload_path(self, key):
+        """相对上传目录的路径，即 /api/uploads/ 后的部分"""
+        return f"{self.namespace}/{key}"
+
+    def exists(self, key):
+        return os.path.exists(self.full_path(key))
+
+    def put(self, data, ext='jpg'):
+        """
+        保存一段完整数据
+
+        Returns:
+            str: 存储键
+        """
+        key = self.key_for(hashlib.sha256(data).hexdigest(), ext)
+        if self.exists(key):
+            return key
+
+        writer = PendingPhoto(self, ext)
+        try:
+            writer._file.write(data)
+        except Exception:
+            writer.discard()
+            raise
+        writer._file.close()
+        self._place(writer._file.name, key)
+        return key
+
+    def open_writer(self, ext='jpg', max_size=None):
+        """打开流式写入器"""
+        return PendingPhoto(self, ext, max_size)
+
+    def _place(self, tmp_path, key):
+        """把临时文件移动到存储键对应的位置，已存在相同内容时删除临时文件"""
+        target = self.full_path(key)
+        if os.path.exists(target):
+            os.remove(tmp_path)
+            return
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # 同一文件系统内的重命名是原子的，读取方不会看到写了一半的文件
+        os.replace(tmp_path, target)
+
+
+# 按上传目录和类别缓存的存储实例
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_photo_store(namespace='photos'):
+    """
+    获取上传目录下某一类文件的存储
+
+    Args:
+        namespace: 类别目录，photos（签到照片）或 feedback（反馈图片）
+    """
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    with _stores_lock:
+        store = _stores.get((upload_folder, namespace))
+        if store is None:
+            store = _stores[(upload_folder, namespace)] = PhotoStore(upload_folder, namespace)
+    return store
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+签到记录查询服务
+签到记录列表按 (signed_at, id) 倒序做游标分页：下一页从上一页最后一条记录之后继续，
+翻到多深都只读取一页数据；总数默认取自带有效期的计数缓存，需要精确总数时再执行COUNT
+"""
+
+import json
+import time
+import base64
+import threading
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import and_, or_, func, select
+from utils.lru_cache import LRUCache
+from app import db, Attendance, User
+
+
+class InvalidCursor(ValueError):
+    """分页游标无法解析"""
+
+
+# 签到记录列表查询的列，顺序与 serialize_row 的解包一致
+RECORD_COLUMNS = (
+    Attendance.id, Attendance.user_id, User.name, User.student_id,
+    Attendance.course_name, Attendance.classroom, Attendance.latitude, Attendance.longitude,
+    Attendance.location_address, Attendance.photo_path, Attendance.thumbnail_path,
+    Attendance.photo_status, Attendance.status, Attendance.signed_at, Attendance.created_at,
+)
+
+
+class RecordService:
+    """签到记录查询服务类"""
+
+    _count_cache = None
+    _count_cache_lock = threading.Lock()
+
+    @staticmethod
+    def select_records(filters):
+        """
+        按列查询签到记录与用户姓名、学号的语句（一次关联查询，不加载ORM对象）
+
+        结果行用 serialize_row 转换为字典
+        """
+        stmt = select(*RECORD_COLUMNS)
+        stmt = stmt.outerjoin(User, Attendance.user_id == User.id)
+        if filters:
+            stmt = stmt.where(*filters)
+        return stmt
+
+    @staticmethod
+    def serialize_row(row):
+        """把 select_records 的结果行转换为与 Attendance.to_dict 相同的字典"""
+        (attendance_id, user_id, user_name, student_id, course_name, classroom, latitude, longitude,
+         location_address, photo_path, thumbnail_path, photo_status, status, signed_at, created_at) = row
+        return {
+            'id': attendance_id,
+            'user_id': user_id,
+            'user_name': user_name,
+            'student_id': student_id,
+            'course_name': course_name,
+            'classroom': classroom,
+            'latitude': latitude,
+            'longitude': longitude,
+            'location_address': location_address,
+            'photo_path': photo_path,
+            'photo_url': f'/api/uploads/{photo_path}' if photo_path else None,
+            'thumbnail_url': f'/api/uploads/{thumbnail_path}' if thumbnail_path else None,
+            'photo_status': photo_status,
+            'status': status,
+            'signed_at': signed_at.isoformat() if signed_at else None,
+            'created_at': created_at.isoformat() if created_at else None
+        }
+
+    @staticmethod
+    def fetch_records(filters, order_by=None, limit=None, offset=0):
+        """
+        执行一次按列查询，返回签到记录字典列表
+
+        Args:
+            filters: 过滤条件列表
+            order_by: 排序列，默认按签到时间
+            limit: 最多条数
+            offset: 跳过条数
+        """
+        stmt = RecordService.select_records(filters)
+        stmt = stmt.order_by(*(order_by if order_by is not None else (Attendance.signed_at,)))
+        if offset:
+            stmt = stmt.offset(offset)
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        return [RecordService.serialize_row(row) for row in db.session.execute(stmt)]
+
+    @staticmethod
+    def iter_records(filters, chunk_size=500):
+        """按签到时间顺序逐条产出签到记录字典，数据库结果分批读取，不一次载入整个结果集"""
+        stmt = RecordService.select_records(filters).order_by(Attendance.signed_at, Attendance.id)
+        for row in db.session.execute(stmt.execution_options(yield_per=chunk_size)):
+            yield RecordService.serialize_row(row)
+
+    @staticmethod
+    def encode_cursor(signed_at, attendance_id):
+        """把一页最后一条记录的 (signed_at, id) 编码为不透明的游标"""
+        raw = json.dumps([signed_at.isoformat(), attendance_id], separators=(',', ':'))
+        return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+    @staticmethod
+    def decode_cursor(cursor):
+        """
+        解析游标
+
+        Returns:
+            tuple: (signed_at, id)
+
+        Raises:
+            InvalidCursor: 游标格式不正确
+        """
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            signed_at, attendance_id = json.loads(raw)
+            return datetime.fromisoformat(signed_at), int(attendance_id)
+        except (ValueError, TypeError) as e:
+            raise InvalidCursor(f"无效的分页游标: {cursor}") from e
+
+    @staticmethod
+    def build_filters(student_id=None, status=None, start_date=None, end_date=None):
+        """
+        按查询参数生成过滤条件
+
+        Returns:
+            tuple: (过滤条件列表, 是否需要关联用户表)
+        """
+        filters = []
+        if student_id:
+            filters.append(User.student_id == student_id)
+        if status and status != 'all':
+            filters.append(Attendance.status == status)
+        if start_date:
+            try:
+                filters.append(Attendance.signed_at >= datetime.fromisoformat(start_date.replace('Z', '+00:00')))
+            except ValueError:
+                pass
+        if end_date:
+            try:
+                filters.append(Attendance.signed_at <= datetime.fromisoformat(end_date.replace('Z', '+00:00')))
+            except ValueError:
+                pass
+        return filters, bool(student_id)
+
+    @staticmethod
+    def list_records(filters, join_user=False, per_page=10, cursor=None, page=None, exact_total=False):
+        """
+        查询一页签到记录（按签到时间倒序），无论每页多少条都只执行一次按列查询（以及可能的一次COUNT）
+
+        Args:
+            filters: build_filters 生成的过滤条件
+            join_user: 过滤条件是否用到用户表
+            per_page: 每页条数，超过 MAX_PAGE_SIZE 时按 MAX_PAGE_SIZE
+            cursor: 上一页返回的 next_cursor，为空时从第一页开始
+            page: 兼容旧的页码分页（没有游标且页码大于1时按OFFSET查询）
+            exact_total: 是否执行COUNT返回精确总数，否则使用缓存的计数
+
+        Returns:
+            tuple: (签到记录字典列表, 分页信息字典)
+
+        Raises:
+            InvalidCursor: 游标格式不正确
+        """
+        max_page_size = current_app.config.get('MAX_PAGE_SIZE', 100)
+        per_page = max(1, min(per_page or current_app.config.get('DEFAULT_PAGE_SIZE', 10), max_page_size))
+
+        page_filters = []
+        offset = 0
+        if cursor:
+            last_signed_at, last_id = RecordService.decode_cursor(cursor)
+            page_filters.append(or_(
+                Attendance.signed_at < last_signed_at,
+                and_(Attendance.signed_at == last_signed_at, Attendance.id < last_id)
+            ))
+        elif page and page > 1:
+            offset = (page - 1) * per_page
+
+        # 多取一条判断是否还有下一页，不需要COUNT
+        records = RecordService.fetch_records(
+            list(filters) + page_filters,
+            order_by=(Attendance.signed_at.desc(), Attendance.id.desc()),
+            limit=per_page + 1,
+            offset=offset
+        )
+        has_next = len(records) > per_page
+        records = records[:per_page]
+
+        total = RecordService.count_records(filters, join_user, exact_total)
+        pagination = {
+            'per_page': per_page,
+            'total': total,
+            'total_exact': exact_total,
+            'pages': (total + per_page - 1) // per_page,
+            'has_prev': bool(cursor) or offset > 0,
+            'has_next': has_next,
+            'next_cursor': RecordService.encode_cursor(
+                datetime.fromisoformat(records[-1]['signed_at']), records[-1]['id']
+            ) if has_next else None
+        }
+        if not cursor:
+            pagination['page'] = page or 1
+        return records, pagination
+
+    @classmethod
+    def _get_count_cache(cls):
+        if cls._count_cache is None:
+            with cls._count_cache_lock:
+                if cls._count_cache is None:
+                    cls._count_cache = LRUCache(current_app.config.get('RECORDS_COUNT_CACHE_SIZE', 1024))
+        return cls._count_cache
+
+    @staticmethod
+    def count_records(filters, join_user=False, exact=False):
+        """
+        符合条件的签到记录数
+
+        exact为False时返回有效期内（RECORDS_COUNT_CACHE_SECONDS）缓存的计数，
+        同一组查询条件在有效期内只执行一次COUNT，翻页不再重复计数。
+        """
+        key = ' AND '.join(
+            str(condition.compile(compile_kwargs={'literal_binds': True})) for condition in filters
+        )
+        cache = RecordService._get_count_cache()
+        if not exact:
+            cached = cache.get(key)
+            if cached is not None and cached[1] > time.monotonic():
+                return cached[0]
+
+        stmt = select(func.count(Attendance.id))
+        if join_user:
+            stmt = stmt.join(User, Attendance.user_id == User.id)
+        if filters:
+            stmt = stmt.where(*filters)
+        total = db.session.execute(stmt).scalar_one()
+
+        ttl = current_app.config.get('RECORDS_COUNT_CACHE_SECONDS', 60)
+        cache.set(key, (total, time.monotonic() + ttl))
+        return total
@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+读接口响应缓存
+签到记录、统计、课表接口的响应按规范化后的查询参数缓存，并按学生和月份打标签；
+签到、状态更正等写入提交后只失效受影响的标签，其他学生、其他月份的缓存不受影响。
+
+缓存条目记录开始计算响应的时间，标签记录最近一次失效的时间：
+条目任一标签在其开始计算之后（或同时）失效即视为过期，计算期间发生的写入不会被缓存掩盖。
+"""
+
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+from functools import wraps
+from urllib.parse import urlencode
+from flask import current_app, request
+from utils.lru_cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# 日期范围跨越的月份超过该数时按不限月份打标签
+MAX_TAGGED_MONTHS = 24
+
+
+_TAG_SCHEMA = (
+    '''
+    CREATE TABLE IF NOT EXISTS response_cache_tags (
+        tag TEXT PRIMARY KEY,
+        invalidated_at REAL NOT NULL
+    )
+    ''',
+)
+
+_ENTRY_SCHEMA = (
+    '''
+    CREATE TABLE IF NOT EXISTS response_cache (
+        cache_key TEXT PRIMARY KEY,
+        body BLOB NOT NULL,
+        mimetype TEXT NOT NULL,
+        tags TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        expires_at REAL NOT NULL
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS ix_response_cache_expires ON response_cache (expires_at)',
+)
+
+# 所有条目都带有的标签，清空缓存时失效该标签，其他工作进程的进程内缓存随之过期
+ALL_TAG = 'all'
+
+
+def _connect(path, schema):
+    """打开本地缓存数据库（WAL模式，缓存内容可以重新计算，不需要每次提交都落盘）"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    connection = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    for statement in schema:
+        connection.execute(statement)
+    return connection
+
+
+class TagStore:
+    """
+    各工作进程共用的标签失效时间（本地SQLite文件）
+
+    任一进程失效的标签对所有进程的缓存条目立即生效，只有带该标签的条目过期。
+    """
+
+    # 每失效多少次清理一次不会再使任何条目过期的标签
+    PRUNE_EVERY = 1024
+
+    def __init__(self, path, max_age=300):
+        self.max_age = max_age
+        self._connection = _connect(path, _TAG_SCHEMA)
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def invalidated_at(self, tags):
+        """标签中最近一次失效的时间，均未失效时为0"""
+        if not tags:
+            return 0.0
+        with self._lock:
+            value = self._connection.execute(
+                f"SELECT MAX(invalidated_at) FROM response_cache_tags WHERE tag IN ({', '.join('?' * len(tags))})",
+                list(tags)
+            ).fetchone()[0]
+        return value or 0.0
+
+    def invalidate(self, tags, at):
+        with self._lock:
+            self._connection.executemany(
+                'INSERT INTO response_cache_tags (tag, invalidated_at) VALUES (?, ?) '
+                'ON CONFLICT(tag) DO UPDATE SET invalidated_at = MAX(invalidated_at, excluded.invalidated_at)',
+                [(tag, at) for tag in tags]
+            )
+            self._writes += 1
+            if self._writes % self.PRUNE_EVERY == 0:
+                # 失效时间早于最长缓存时间的标签不会再使任何条目过期
+                self._connection.execute(
+                    'DELETE FROM response_cache_tags WHERE invalidated_at <= ? AND tag != ?',
+                    (at - self.max_age, ALL_TAG)
+                )
+
+
+class MemoryBackend:
+    """进程内LRU缓存，标签失效时间由 TagStore 在各工作进程间共享"""
+
+    name = 'simple'
+
+    def __init__(self, maxsize=10000):
+        self._entries = LRUCache(maxsize)
+
+    def get(self, key):
+        return self._entries.get(key)
+
+    def set(self, key, entry):
+        self._entries.set(key, entry)
+
+    def delete(self, key):
+        self._entries.pop(key)
+
+    def clear(self):
+        self._entries.clear()
+
+    def size(self):
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    """各工作进程共用的本地SQLite缓存，一个进程计算的响应其他进程也可以命中"""
+
+    name = 'sqlite'
+
+    # 每写入多少个条目清理一次过期条目
+    PRUNE_EVERY = 256
+
+    def __init__(self, path, max_entries=10000):
+        self.max_entries = max_entries
+        self._connection = _connect(path, _ENTRY_SCHEMA)
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def get(self, key):
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT body, mimetype, tags, created_at, expires_at FROM response_cache WHERE cache_key = ?', (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        body, mimetype, tags, created_at, expires_at = row
+        return bytes(body), mimetype, json.loads(tags), created_at, expires_at
+
+    def set(self, key, entry):
+        body, mimetype, tags, created_at, expires_at = entry
+        with self._lock:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO response_cache (cache_key, body, mimetype, tags, created_at, expires_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (key, body, mimetype, json.dumps(tags), created_at, expires_at)
+            )
+            self._writes += 1
+            if self._writes % self.PRUNE_EVERY == 0:
+                self._prune(time.time())
+
+    def _prune(self, now):
+        """删除过期条目，以及超出容量时最早过期的条目"""
+        self._connection.execute('DELETE FROM response_cache WHERE expires_at <= ?', (now,))
+        excess = self._connection.execute('SELECT COUNT(*) FROM response_cache').fetchone()[0] - self.max_entries
+        if excess > 0:
+            self._connection.execute(
+                'DELETE FROM response_cache WHERE cache_key IN '
+                '(SELECT cache_key FROM response_cache ORDER BY expires_at LIMIT ?)', (excess,)
+            )
+
+    def delete(self, key):
+        with self._lock:
+            self._connection.execute('DELETE FROM response_cache WHERE cache_key = ?', (key,))
+
+    def clear(self):
+        with self._lock:
+            self._connection.execute('DELETE FROM response_cache')
+
+    def size(self):
+        with self._lock:
+            return self._connection.execute('SELECT COUNT(*) FROM response_cache').fetchone()[0]
+
+
+class ResponseCache:
+    """带标签失效的响应缓存与按接口的命中统计"""
+
+    def __init__(self, backend, tags, default_timeout=300):
+        self.backend = backend
+        self.tags = tags
+        self.default_timeout = default_timeout
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._invalidations = 0
+
+    def _count(self, endpoint, key):
+        with self._lock:
+            counters = self._counters.setdefault(endpoint, {'hits': 0, 'misses': 0, 'stale': 0, 'stores': 0})
+            counters[key] += 1
+
+    def get(self, endpoint, key):
+        """
+        读取缓存的响应
+
+        Returns:
+            tuple: (响应内容, mimetype)，未缓存、已过期或标签已失效时返回None
+        """
+        entry = self.backend.get(key)
+        if entry is not None:
+            body, mimetype, tags, created_at, expires_at = entry
+            if expires_at > time.time() and self.tags.invalidated_at(tags) < created_at:
+                self._count(endpoint, 'hits')
+                return body, mimetype
+            self.backend.delete(key)
+            self._count(endpoint, 'stale')
+        self._count(endpoint, 'misses')
+        return None
+
+    def set(self, endpoint, key, body, mimetype, tags, created_at, timeout=None):
+        """
+        缓存响应
+
+        Args:
+            created_at: 开始计算响应的时间（time.time()），此后失效的标签会使该条目过期
+            timeout: 缓存秒数，不超过 CACHE_DEFAULT_TIMEOUT
+        """
+        timeout = min(timeout or self.default_timeout, self.default_timeout)
+        self.backend.set(key, (body, mimetype, list(tags) + [ALL_TAG], created_at, created_at + timeout))
+        self._count(endpoint, 'stores')
+
+    def invalidate(self, tags):
+        """使带有这些标签的缓存条目过期（对所有工作进程生效）"""
+        tags = list(tags)
+        if not tags:
+            return
+        self.tags.invalidate(tags, time.time())
+        with self._lock:
+            self._invalidations += len(tags)
+
+    def clear(self):
+        """清空全部缓存（对所有工作进程生效）"""
+        self.backend.clear()
+        self.tags.invalidate([ALL_TAG], time.time())
+
+    def stats(self):
+        """各接口的命中、未命中次数与命中率"""
+        with self._lock:
+            endpoints = {}
+            for endpoint, counters in self._counters.items():
+                lookups = counters['hits'] + counters['misses']
+                endpoints[endpoint] = dict(
+                    counters,
+                    hit_rate=round(counters['hits'] / lookups, 4) if lookups else 0.0,
+                    miss_rate=round(counters['misses'] / lookups, 4) if lookups else 0.0
+                )
+            invalidations = self._invalidations
+        return {
+            'backend': self.backend.name,
+            'size': self.backend.size(),
+            'default_timeout': self.default_timeout,
+            'tag_invalidations': invalidations,
+            'endpoints': endpoints
+        }
+
+
+# 全局实例 - 延迟初始化，CACHE_TYPE为null时为None
+response_cache = None
+_cache_lock = threading.Lock()
+_cache_created = False
+
+
+def get_response_cache():
+    """按配置（CACHE_TYPE）获取响应缓存，不缓存时返回None"""
+    global response_cache, _cache_created
+    if not _cache_created:
+        with _cache_lock:
+            if not _cache_created:
+                response_cache = _create_response_cache(current_app.config)
+                _cache_created = True
+    return response_cache
+
+
+def _create_response_cache(config):
+    cache_type = (config.get('CACHE_TYPE') or 'null').lower()
+    timeout = config.get('CACHE_DEFAULT_TIMEOUT', 300)
+    max_entries = config.get('CACHE_MAX_ENTRIES', 10000)
+    if cache_type in ('null', 'none'):
+        return None
+    if cache_type == 'simple':
+        backend = MemoryBackend(max_entries)
+    elif cache_type == 'sqlite':
+        backend = SQLiteBackend(config['CACHE_SQLITE_PATH'], max_entries)
+    else:
+        raise ValueError(f"不支持的缓存类型: {cache_type}")
+    return ResponseCache(backend, TagStore(config['CACHE_SQLITE_PATH'], timeout), timeout)
+
+
+def query_params(*names, **defaults):
+    """
+    生成按参数名取查询参数的函数，其他参数（如轮询时附加的时间戳）不参与缓存键
+
+    defaults 为参数未传时的默认值，可以是可调用对象（如当天日期）；值为None的参数不参与缓存键
+    """
+    def vary(args):
+        params = {}
+        for name in names:
+            value = args.get(name)
+            if value is None:
+                value = defaults.get(name)
+                if callable(value):
+                    value = value()
+            if value is not None:
+                params[name] = str(value)
+        return params
+    return vary
+
+
+def cached_response(vary, tags, timeout_config=None):
+    """
+    缓存视图函数的成功响应（状态码200、非流式）
+
+    Args:
+        vary: 由 request.args 得到规范化查询参数字典的函数，返回None时不使用缓存
+        tags: 由规范化查询参数得到标签列表的函数
+        timeout_config: 缓存秒数的配置项，默认为 CACHE_DEFAULT_TIMEOUT
+    """
+    def decorator(view):
+        @wraps(view)
+        def decorated_function(*args, **kwargs):
+            cache = get_response_cache()
+            params = vary(request.args) if cache is not None else None
+            if params is None:
+                return view(*args, **kwargs)
+
+            endpoint = request.endpoint
+            key = f"{endpoint}?{urlencode(sorted(params.items()))}"
+            cached = cache.get(endpoint, key)
+            if cached is not None:
+                body, mimetype = cached
+                response = current_app.response_class(body, status=200, mimetype=mimetype)
+                response.headers['X-Cache'] = 'HIT'
+                return response
+
+            created_at = time.time()
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code == 200 and not response.is_streamed:
+                timeout = current_app.config.get(timeout_config) if timeout_config else None
+                cache.set(endpoint, key, response.get_data(), response.mimetype, tags(params), created_at, timeout)
+                response.headers['X-Cache'] = 'MISS'
+            return response
+        return decorated_function
+    return decorator
+
+
+def attendance_tags(student_id=None, months=None):
+    """签到记录类响应的标签：attendance:<学号或*>:<YYYY-MM或*>"""
+    student = student_id or '*'
+    return [f"attendance:{student}:{month}" for month in (months or ('*',))]
+
+
+def months_between(start_date=None, end_date=None):
+    """
+    签到记录查询日期范围跨越的月份（YYYY-MM），与 RecordService.build_filters 的日期解析一致
+
+    Returns:
+        list: 月份列表，范围不完整、无法解析或跨越过多月份时返回None（不限月份）
+    """
+    try:
+        start = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
+        end = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        return None
+    first = start.year * 12 + start.month - 1
+    last = end.year * 12 + end.month - 1
+    if last - first >= MAX_TAGGED_MONTHS:
+        return None
+    return [f"{index // 12:04d}-{index % 12 + 1:02d}" for index in range(first, last + 1)]
+
+
+def schedule_tags(student_id):
+    """课表响应的标签"""
+    return ['schedule', f"schedule:{student_id}"]
+
+
+def _invalidate(tags):
+    """失效标签，缓存出错时只记录日志，不影响已提交的写入"""
+    try:
+        cache = get_response_cache()
+    except RuntimeError:
+        # 在应用上下文外时只能使用已创建的缓存
+        cache = response_cache
+    if cache is None:
+        return
+    try:
+        cache.invalidate(tags)
+    except Exception as e:
+        logger.warning(f"响应缓存失效失败: {e}")
+
+
+def invalidate_attendance(changes):
+    """
+    签到记录写入提交后失效受影响的缓存
+
+    Args:
+        changes: [(学号, 签到时间)]，学号为空时只失效不限学生的缓存
+    """
+    tags = set()
+    for student_id, signed_at in changes:
+        month = signed_at.strftime('%Y-%m')
+        for student in {student_id or '*', '*'}:
+            tags.update(attendance_tags(student, [month, '*']))
+    _invalidate(tags)
+
+
+def invalidate_schedule(student_ids=None):
+    """课表变化后失效课表缓存，student_ids为空时失效全部学生"""
+    if student_ids is None:
+        _invalidate(['schedule'])
+    else:
+        _invalidate([f"schedule:{student_id}" for student_id in student_ids])
+
+
+def clear_response_cache():
+    """清空响应缓存（批量修改签到记录的命令执行后使用）"""
+    cache = get_response_cache()
+    if cache is not None:
+        cache.clear()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+学期校历
+根据配置的学期开始日期和调整日期，把日期解析为（按星期几的课表上课，第几周）
+"""
+
+from datetime import date, datetime, timedelta
+from flask import current_app
+
+
+def _parse_date(value):
+    """解析 YYYY-MM-DD 字符串，已是date对象时原样返回"""
+    if value is None or isinstance(value, date):
+        return value
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+class Semester:
+    """单个学期"""
+
+    __slots__ = ('name', 'start_date', 'weeks')
+
+    def __init__(self, name, start_date, weeks):
+        self.name = name
+        self.start_date = start_date
+        self.weeks = weeks
+
+    @property
+    def end_date(self):
+        """学期最后一天"""
+        return self.start_date + timedelta(days=self.weeks * 7 - 1)
+
+    def week_of(self, day):
+        """日期所在的教学周（从1开始），不在学期内时返回None"""
+        offset = (day - self.start_date).days
+        if offset < 0 or offset >= self.weeks * 7:
+            return None
+        return offset // 7 + 1
+
+
+class SemesterCalendar:
+    """
+    校历
+
+    未配置任何学期时不做周次过滤，所有日期都按当天星期几上课（与旧行为一致）。
+    """
+
+    def __init__(self, semesters=None, overrides=None):
+        """
+        Args:
+            semesters: [{'name': '2025-2026-1', 'start_date': '2025-09-08', 'weeks': 20}, ...]
+            overrides: [{'date': '2025-10-01', 'follows': None}, {'date': '2025-09-28', 'follows': '2025-10-03'}, ...]
+                       follows为空表示当天停课，否则当天按follows日期的课表上课（调休补课）
+        """
+        self.semesters = sorted(
+            (Semester(item['name'], _parse_date(item['start_date']), int(item.get('weeks', 20)))
+             for item in semesters or []),
+            key=lambda semester: semester.start_date
+        )
+        self.overrides = {
+            _parse_date(item['date']): _parse_date(item.get('follows'))
+            for item in overrides or []
+        }
+
+    @property
+    def enabled(self):
+        """是否配置了学期"""
+        return bool(self.semesters)
+
+    def semester_of(self, day):
+        """日期所在的学期，不在任何学期内时返回None"""
+        for semester in self.semesters:
+            if semester.week_of(day) is not None:
+                return semester
+        return None
+
+    def resolve(self, day):
+        """
+        解析某天实际上课安排
+
+        Args:
+            day: 日期
+
+        Returns:
+            tuple: (星期几 0-6, 教学周)，未配置校历时教学周为None；
+                   当天停课或不在学期内时返回None
+        """
+        if day in self.overrides:
+            follows = self.overrides[day]
+            if follows is None:
+                return None
+            day = follows
+
+        if not self.enabled:
+            return day.weekday(), None
+
+        semester = self.semester_of(day)
+        if semester is None:
+            return None
+        return day.weekday(), semester.week_of(day)
+
+    def week_mask_for_range(self, start_date, end_date):
+        """
+        日期范围内所有上课日涉及的教学周位图，用于在SQL中预先过滤课程安排
+
+        Returns:
+            int: 周次位图，未配置校历时返回None（不过滤）
+        """
+        if not self.enabled:
+            return None
+
+        mask = 0
+        day = start_date
+        while day <= end_date:
+            resolved = self.resolve(day)
+            if resolved is not None:
+                mask |= 1 << (resolved[1] - 1)
+            day += timedelta(days=1)
+        return mask
+
+
+# 校历按配置对象缓存，配置不变时只解析一次
+_calendar_cache = {}
+
+
+def get_semester_calendar():
+    """获取当前应用配置的校历"""
+    try:
+        config = current_app.config.get('SEMESTER_CALENDAR') or {}
+    except RuntimeError:
+        # 在应用上下文外时不使用校历
+        config = {}
+
+    calendar = _calendar_cache.get(id(config))
+    if calendar is None or calendar[0] is not config:
+        calendar = (config, SemesterCalendar(config.get('semesters'), config.get('overrides')))
+        _calendar_cache.clear()
+        _calendar_cache[id(config)] = calendar
+    return calendar[1]
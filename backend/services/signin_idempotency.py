@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+签到幂等
+每次签到带一个请求键：前端提供幂等键时使用幂等键，否则由（学号, 课程, 时间窗口）推导。
+请求键保存在签到记录的唯一索引列上，近期的签到结果缓存在进程内，
+网络重试等重复提交直接重放第一次的响应，不再写入新记录或保存照片。
+推导的请求键按固定时间窗口划分，跨窗口边界的重试另按上一窗口的请求键查找
+"""
+
+import hashlib
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+from utils.lru_cache import LRUCache
+
+
+def make_request_key(student_id, idempotency_key=None, course_name=None, at=None):
+    """
+    生成签到请求键
+
+    Args:
+        student_id: 学号
+        idempotency_key: 前端提供的幂等键，为空时按课程与时间窗口推导
+        course_name: 课程名称
+        at: 签到时间，默认当前时间
+
+    Returns:
+        str: 64位十六进制请求键
+    """
+    if idempotency_key:
+        source = f"key:{student_id}:{idempotency_key}"
+    else:
+        # 同一学生同一课程在同一时间窗口内的签到视为重复提交
+        window = current_app.config.get('SIGNIN_DEDUP_WINDOW_SECONDS', 600)
+        at = at or datetime.now()
+        source = f"natural:{student_id}:{course_name}:{int(at.timestamp()) // window}"
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+
+def previous_window_key(student_id, course_name, at):
+    """上一个时间窗口的自然请求键，用于识别跨窗口边界的重试"""
+    window = current_app.config.get('SIGNIN_DEDUP_WINDOW_SECONDS', 600)
+    return make_request_key(student_id, None, course_name, at - timedelta(seconds=window))
+
+
+def response_data(attendance):
+    """签到接口返回的data部分，attendance可以是签到记录对象或列值字典"""
+    get = attendance.get if isinstance(attendance, dict) else lambda name: getattr(attendance, name)
+    return {
+        'attendance_id': get('id'),
+        'status': get('status'),
+        'photo_status': get('photo_status'),
+        'signed_at': get('signed_at').isoformat()
+    }
+
+
+class SigninReplayCache:
+    """请求键到签到响应的有界缓存，缓存未命中时由数据库唯一索引兜底"""
+
+    def __init__(self, maxsize=10000):
+        self._cache = LRUCache(maxsize)
+
+    def get(self, request_key):
+        """获取已完成签到的响应数据，没有时返回None"""
+        return self._cache.get(request_key)
+
+    def remember(self, request_key, data):
+        """记录签到响应数据"""
+        self._cache.set(request_key, data)
+
+    def find_existing(self, request_key):
+        """插入因唯一索引冲突失败后，从数据库取回原签到记录的响应数据"""
+        from app import db, Attendance
+
+        attendance = db.session.query(Attendance).filter_by(request_key=request_key).first()
+        if attendance is None:
+            return None
+        data = response_data(attendance)
+        self.remember(request_key, data)
+        return data
+
+    def stats(self):
+        return self._cache.stats()
+
+
+# 全局实例 - 延迟初始化
+replay_cache = None
+_replay_lock = threading.Lock()
+
+
+def get_replay_cache():
+    """获取签到响应重放缓存"""
+    global replay_cache
+    if replay_cache is None:
+        with _replay_lock:
+            if replay_cache is None:
+                replay_cache = SigninReplayCache(current_app.config.get('SIGNIN_REPLAY_CACHE_SIZE', 10000))
+    return replay_cache
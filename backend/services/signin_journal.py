@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+签到本地日志
+开启后签到先追加到本地SQLite日志（WAL模式，每次提交落盘）即返回成功，
+再由后台线程分批写入主数据库；主数据库变慢或重启期间签到不会丢失，启动时自动重放未写入的记录。
+一批记录写入失败且不是主数据库不可用时逐条重试，无法写入的记录移入死信表 signin_journal_dead，不阻塞后续签到。
+"""
+
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError, DataError, OperationalError, InterfaceError, TimeoutError as PoolTimeout
+from services.signin_upload import UPLOAD_REFERENCE_PREFIX
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS signin_journal (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    request_key TEXT NOT NULL UNIQUE,
+    payload TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    claimed_by TEXT,
+    claimed_at REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT
+);
+CREATE TABLE IF NOT EXISTS signin_journal_dead (
+    seq INTEGER PRIMARY KEY,
+    request_key TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    attempts INTEGER NOT NULL,
+    last_error TEXT,
+    failed_at REAL NOT NULL
+);
+'''
+
+
+class JournalFull(Exception):
+    """待写入的签到数超过上限"""
+
+
+def _connect(path):
+    """打开日志数据库：WAL模式，synchronous=FULL保证每次提交都已落盘"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    connection = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=FULL')
+    connection.executescript(_SCHEMA)
+    return connection
+
+
+def _is_transient(error):
+    """主数据库不可用、连接断开、锁等待超时等稍后重试即可能成功的错误"""
+    return isinstance(error, (OperationalError, InterfaceError, PoolTimeout))
+
+
+def _is_permanent(error):
+    """记录本身无法写入的错误（约束冲突、数据超长、用户冲突、日志内容损坏），重试不会成功"""
+    return isinstance(error, (IntegrityError, DataError, ValueError, KeyError, TypeError))
+
+
+class SigninJournal:
+    """签到本地日志与后台写入线程"""
+
+    def __init__(self, app, path, max_pending=10000, batch_size=200, retry_max=30.0, max_attempts=5, lease=60.0):
+        self.app = app
+        self.path = path
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.retry_max = retry_max
+        self.max_attempts = max_attempts
+        self.lease = lease
+        # 多个工作进程共用同一日志文件，认领记录时以进程号区分
+        self.owner = f"{os.getpid()}-{id(self)}"
+        self._connection = _connect(path)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._counters = {
+            'appended': 0, 'drained': 0, 'duplicates': 0, 'rejected': 0, 'failures': 0, 'dead_lettered': 0
+        }
+        self._release_dead_claims()
+        pending = self._count_pending()
+        self._thread = threading.Thread(target=self._run, name='signin-journal', daemon=True)
+        self._thread.start()
+        if pending:
+            logger.info(f"签到日志中有 {pending} 条未写入主数据库的记录，开始重放")
+
+    def _release_dead_claims(self):
+        """释放已退出进程认领的记录，重启后不必等租约过期即可重放"""
+        with self._lock:
+            owners = [row[0] for row in self._connection.execute(
+                'SELECT DISTINCT claimed_by FROM signin_journal WHERE claimed_by IS NOT NULL'
+            )]
+            for owner in owners:
+                pid = int(owner.split('-', 1)[0])
+                try:
+                    os.kill(pid, 0)
+                    continue
+                except ProcessLookupError:
+                    pass
+                except OSError:
+                    # 进程存在但无权限发送信号
+                    continue
+                self._connection.execute(
+                    'UPDATE signin_journal SET claimed_by = NULL, claimed_at = NULL WHERE claimed_by = ?', (owner,)
+                )
+
+    def _count_pending(self):
+        """日志文件中待写入的记录数（各工作进程共用同一文件，任一进程写入后即减少）"""
+        with self._lock:
+            return self._connection.execute('SELECT COUNT(*) FROM signin_journal').fetchone()[0]
+
+    def append(self, request_key, values, student, photo=None):
+        """
+        追加一条签到，返回时已落盘
+
+        Args:
+            request_key: 签到请求键
+            values: Attendance列值字典（user_id可以为空，由写入线程按学号补全）
+            student: {'student_id', 'name', 'wechat_userid'}
+            photo: 待处理的照片数据，写入主数据库后交给照片处理线程
+
+        Returns:
+            tuple: (日志序号, 第一次提交的响应数据)，不是重复提交时响应数据为None
+
+        Raises:
+            JournalFull: 待写入的签到数超过上限
+        """
+        payload = json.dumps({
+            'values': dict(values, signed_at=values['signed_at'].isoformat()),
+            'student': student,
+            'photo': photo
+        }, ensure_ascii=False)
+
+        with self._lock:
+            # 在写事务中按日志文件计数：其他进程写入主数据库的记录同样计入，多个进程同时追加也不会超出上限
+            self._connection.execute('BEGIN IMMEDIATE')
+            try:
+                existing = self._connection.execute(
+                    'SELECT seq, payload FROM signin_journal WHERE request_key = ?', (request_key,)
+                ).fetchone()
+                cursor = None
+                if existing is None:
+                    pending = self._connection.execute('SELECT COUNT(*) FROM signin_journal').fetchone()[0]
+                    if pending < self.max_pending:
+                        cursor = self._connection.execute(
+                            'INSERT INTO signin_journal (request_key, payload, created_at) VALUES (?, ?, ?)',
+                            (request_key, payload, time.time())
+                        )
+                self._connection.execute('COMMIT')
+            except Exception:
+                self._connection.execute('ROLLBACK')
+                raise
+            if existing is not None:
+                return existing[0], self._response(*existing)
+            if cursor is None:
+                self._counters['rejected'] += 1
+                raise JournalFull(f"签到日志已有 {pending} 条待写入记录")
+            self._counters['appended'] += 1
+
+        self._wakeup.set()
+        return cursor.lastrowid, None
+
+    @staticmethod
+    def _response(seq, payload):
+        """日志记录对应的签到响应数据（签到记录ID在写入主数据库后才有）"""
+        from services.signin_idempotency import response_data
+
+        values = json.loads(payload)['values']
+        values['signed_at'] = datetime.fromisoformat(values['signed_at'])
+        values['id'] = None
+        return dict(response_data(values), journal_id=seq)
+
+    def find_response(self, request_key):
+        """尚未写入主数据库的签到的响应数据，没有时返回None"""
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT seq, payload FROM signin_journal WHERE request_key = ?', (request_key,)
+            ).fetchone()
+        return self._response(*row) if row else None
+
+    def _claim(self, connection):
+        """认领一批未被其他进程处理（或租约已过期）的记录"""
+        now = time.time()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            rows = connection.execute(
+                'SELECT seq, request_key, payload FROM signin_journal '
+                'WHERE claimed_by IS NULL OR claimed_by = ? OR claimed_at < ? ORDER BY seq LIMIT ?',
+                (self.owner, now - self.lease, self.batch_size)
+            ).fetchall()
+            if rows:
+                connection.executemany(
+                    'UPDATE signin_journal SET claimed_by = ?, claimed_at = ? WHERE seq = ?',
+                    [(self.owner, now, row[0]) for row in rows]
+                )
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        return rows
+
+    def _run(self):
+        connection = _connect(self.path)
+        delay = 0.5
+        while True:
+            try:
+                rows = self._claim(connection)
+                if not rows:
+                    self._wakeup.wait(5)
+                    self._wakeup.clear()
+                    continue
+
+                with self.app.app_context():
+                    try:
+                        photos = self._drain(rows)
+                        written = rows
+                    except Exception as e:
+                        if _is_transient(e):
+                            raise
+                        logger.warning(f"签到日志批量写入失败，逐条重试: {e}")
+                        photos, written = self._drain_each(connection, rows)
+                connection.executemany('DELETE FROM signin_journal WHERE seq = ?', [(row[0],) for row in written])
+                self._submit_photos(photos)
+                delay = 0.5
+            except Exception as e:
+                # 主数据库不可用时退避重试，记录保留在日志中
+                self._counters['failures'] += 1
+                logger.warning(f"签到日志写入主数据库失败，{delay:.1f} 秒后重试: {e}")
+                try:
+                    connection.executemany(
+                        'UPDATE signin_journal SET last_error = ? WHERE claimed_by = ?', [(str(e)[:500], self.owner)]
+                    )
+                except sqlite3.Error:
+                    pass
+                time.sleep(delay)
+                delay = min(delay * 2, self.retry_max)
+
+    def _drain_each(self, connection, rows):
+        """
+        逐条写入一批记录，跳过无法写入的记录
+
+        主数据库不可用时抛出异常，由调用方退避重试（已写入的记录重放时按重复提交处理）
+
+        Returns:
+            tuple: (需要处理照片的记录, 已写入的日志记录)
+        """
+        photos = []
+        written = []
+        for row in rows:
+            try:
+                photos.extend(self._drain([row]))
+                written.append(row)
+            except Exception as e:
+                if _is_transient(e):
+                    raise
+                self._record_failure(connection, row, e)
+        return photos, written
+
+    def _record_failure(self, connection, row, error):
+        """
+        记录单条写入失败：确定无法写入或失败次数达到上限（max_attempts）时移入死信表，
+        否则留在日志中，下一批重试
+        """
+        seq, request_key, _ = row
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute(
+                'UPDATE signin_journal SET attempts = attempts + 1, last_error = ? WHERE seq = ?',
+                (str(error)[:500], seq)
+            )
+            attempts = connection.execute('SELECT attempts FROM signin_journal WHERE seq = ?', (seq,)).fetchone()[0]
+            dead = _is_permanent(error) or attempts >= self.max_attempts
+            if dead:
+                connection.execute(
+                    'INSERT OR REPLACE INTO signin_journal_dead '
+                    '(seq, request_key, payload, created_at, attempts, last_error, failed_at) '
+                    'SELECT seq, request_key, payload, created_at, attempts, last_error, ? FROM signin_journal WHERE seq = ?',
+                    (time.time(), seq)
+                )
+                connection.execute('DELETE FROM signin_journal WHERE seq = ?', (seq,))
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+
+        if dead:
+            self._counters['dead_lettered'] += 1
+            logger.error(f"签到日志记录 {seq}（{request_key}）无法写入主数据库，已移入死信表: {error}")
+        else:
+            logger.warning(f"签到日志记录 {seq} 第 {attempts} 次写入失败，稍后重试: {error}")
+
+    def _drain(self, rows):
+        """
+        在一个事务中把一批记录写入主数据库
+
+        Returns:
+            list: [(签到记录ID, 学号, 照片数据)] 需要处理照片的记录
+        """
+        from app import db, Attendance
+        from services.user_service import UserService
+        from services.photo_pipeline import PHOTO_PENDING
+        from services.attendance_rollup import RollupService
+        from services.response_cache import invalidate_attendance
+
+        photos = []
+        inserted = []
+        changes = []
+        created_users = {}
+        duplicates = 0
+        try:
+            for seq, request_key, payload in rows:
+                entry = json.loads(payload)
+                values = entry['values']
+                values['signed_at'] = datetime.fromisoformat(values['signed_at'])
+                student = entry['student']
+                if values.get('user_id') is None:
+                    # 新用户与签到记录在同一事务中提交，批次失败时一起回滚
+                    values['user_id'] = UserService.get_or_create_user_id(
+                        student['student_id'], student['name'], student.get('wechat_userid'), commit=False
+                    )
+                    created_users[student['student_id']] = values['user_id']
+
+                try:
+                    with db.session.begin_nested():
+                        attendance_id = db.session.execute(insert(Attendance).values(**values)).inserted_primary_key[0]
+                    inserted.append(values)
+                    changes.append((student['student_id'], values['signed_at']))
+                except IntegrityError:
+                    # 上次已写入但未来得及删除日志（进程退出或其他进程处理过）。
+                    # 各写入路径（本日志、组提交、ORM）都在插入签到记录的同一事务中更新每日汇总，
+                    # 已存在的记录必然已计入汇总，这里不能再计一次
+                    existing = db.session.execute(
+                        select(Attendance.id, Attendance.photo_status, Attendance.signed_at)
+                        .where(Attendance.request_key == request_key)
+                    ).first()
+                    if existing is None:
+                        raise
+                    duplicates += 1
+                    changes.append((student['student_id'], existing.signed_at))
+                    if existing.photo_status != PHOTO_PENDING:
+                        continue
+                    attendance_id = existing.id
+
+                if entry.get('photo'):
+                    photos.append((attendance_id, student['student_id'], entry['photo']))
+            # 批量INSERT不经过ORM的flush事件，在同一事务中更新每日汇总
+            RollupService.apply_inserted(db.session, inserted)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            db.session.remove()
+        self._counters['drained'] += len(inserted)
+        self._counters['duplicates'] += duplicates
+        for student_id, user_id in created_users.items():
+            UserService.remember_user_id(student_id, user_id)
+        invalidate_attendance(changes)
+        return photos
+
+    def _submit_photos(self, photos):
+        from services.photo_pipeline import get_photo_pipeline
+
+        if not photos:
+            return
+        with self.app.app_context():
+            pipeline = get_photo_pipeline()
+            for attendance_id, student_id, photo in photos:
+                pipeline.submit(attendance_id, student_id, photo)
+
+    def photo_references(self):
+        """日志中（含死信表）仍引用的multipart上传照片，清理incoming目录时保留"""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT photo FROM (SELECT json_extract(payload, '$.photo') AS photo FROM signin_journal "
+                "UNION ALL SELECT json_extract(payload, '$.photo') FROM signin_journal_dead) WHERE photo LIKE ?",
+                (UPLOAD_REFERENCE_PREFIX + '%',)
+            ).fetchall()
+        return {photo for (photo,) in rows}
+
+    def stats(self):
+        """本进程的日志计数，以及日志文件中待写入与移入死信表的记录数"""
+        pending = self._count_pending()
+        with self._lock:
+            dead = self._connection.execute('SELECT COUNT(*) FROM signin_journal_dead').fetchone()[0]
+            return dict(self._counters, pending=pending, dead=dead)
+
+
+# 进程内实例，未开启签到日志时为None
+signin_journal = None
+
+
+def init_signin_journal(app):
+    """按配置打开签到日志并启动后台写入线程（会重放上次未写入的记录）"""
+    global signin_journal
+    if not app.config.get('SIGNIN_JOURNAL_ENABLED', False):
+        return None
+    signin_journal = SigninJournal(
+        app,
+        app.config['SIGNIN_JOURNAL_PATH'],
+        app.config.get('SIGNIN_JOURNAL_MAX_PENDING', 10000),
+        app.config.get('SIGNIN_JOURNAL_BATCH_SIZE', 200),
+        app.config.get('SIGNIN_JOURNAL_RETRY_MAX_SECONDS', 30.0),
+        app.config.get('SIGNIN_JOURNAL_MAX_ATTEMPTS', 5)
+    )
+    return signin_journal
+
+
+def get_signin_journal():
+    """获取签到日志，未开启时返回None"""
+    return signin_journal
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+multipart签到照片上传
+照片部分按块直接写入上传目录下的incoming目录，写入时检查大小上限和图片文件头，
+请求处理期间不在内存中保留整张照片，也不需要base64解码；压缩保存由照片处理线程完成
+"""
+
+import os
+import uuid
+import tempfile
+from flask import current_app, request
+from werkzeug.formparser import FormDataParser
+from services.photo_store import PhotoTooLarge
+from config import UPLOAD_CONFIG
+
+# 待处理照片目录（相对上传目录）与签到记录中的照片引用前缀
+INCOMING_DIR = 'incoming'
+UPLOAD_REFERENCE_PREFIX = 'upload:'
+
+# 表单解析缓冲区上限（需大于解析器每次读取的64KB，单个文本字段也不能超过该大小）与字段数上限
+MAX_FORM_MEMORY_SIZE = 500 * 1024
+MAX_FORM_PARTS = 32
+
+# 允许的图片文件头
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+)
+SIGNATURE_LENGTH = max(len(signature) for signature, _ in IMAGE_SIGNATURES)
+
+
+class UnsupportedPhoto(ValueError):
+    """上传的照片不是支持的图片格式"""
+
+
+class IncomingPhoto:
+    """
+    流式写入的待处理照片
+
+    由表单解析器逐块写入临时文件，提交后以随机文件名保存；
+    不按内容寻址，避免两次签到上传相同照片时其中一张被处理后删除。
+    """
+
+    def __init__(self, folder, max_size=None):
+        self.folder = folder
+        self.max_size = max_size
+        self.size = 0
+        self.ext = None
+        self._head = b''
+        os.makedirs(folder, exist_ok=True)
+        self._file = tempfile.NamedTemporaryFile(dir=folder, prefix='.', delete=False)
+
+    def write(self, chunk):
+        """写入一段数据，超过大小上限或文件头不是图片时抛出异常"""
+        self.size += len(chunk)
+        if self.max_size is not None and self.size > self.max_size:
+            raise PhotoTooLarge(f"照片超过大小上限 {self.max_size} 字节")
+        if self.ext is None and len(self._head) < SIGNATURE_LENGTH:
+            self._head += chunk[:SIGNATURE_LENGTH - len(self._head)]
+            self._detect()
+        self._file.write(chunk)
+        return len(chunk)
+
+    def _detect(self):
+        for signature, ext in IMAGE_SIGNATURES:
+            if self._head.startswith(signature):
+                self.ext = ext
+                return
+        if len(self._head) >= SIGNATURE_LENGTH:
+            raise UnsupportedPhoto('照片格式不支持，仅支持JPEG、PNG、GIF')
+
+    def seek(self, offset, whence=0):
+        # 表单解析器写完后会把文件流定位到开头，照片不在请求线程中读取，这里无需处理
+        return 0
+
+    def commit(self):
+        """
+        完成写入
+
+        Returns:
+            str: 照片引用（upload:incoming/<文件名>），没有上传内容时返回None
+        """
+        self._file.close()
+        if self.size == 0:
+            self.discard()
+            return None
+        if self.ext is None:
+            self.discard()
+            raise UnsupportedPhoto('照片格式不支持，仅支持JPEG、PNG、GIF')
+        name = f"{uuid.uuid4().hex}.{self.ext}"
+        os.replace(self._file.name, os.path.join(self.folder, name))
+        return f"{UPLOAD_REFERENCE_PREFIX}{INCOMING_DIR}/{name}"
+
+    def discard(self):
+        """放弃写入并删除临时文件"""
+        self._file.close()
+        try:
+            os.remove(self._file.name)
+        except FileNotFoundError:
+            pass
+
+
+def open_incoming_photo():
+    """打开一个写入incoming目录的待处理照片，大小上限为 UPLOAD_CONFIG['max_file_size']"""
+    folder = os.path.join(current_app.config['UPLOAD_FOLDER'], INCOMING_DIR)
+    return IncomingPhoto(folder, UPLOAD_CONFIG['max_file_size'])
+
+
+def parse_signin_upload():
+    """
+    解析multipart签到请求，照片部分（字段名photo）流式写入incoming目录
+
+    Returns:
+        tuple: (表单字段字典, 照片引用)，没有上传照片时照片引用为None
+
+    Raises:
+        PhotoTooLarge: 照片超过 UPLOAD_CONFIG['max_file_size']
+        UnsupportedPhoto: 照片不是JPEG、PNG、GIF，或上传了多张照片
+    """
+    writers = []
+
+    def stream_factory(total_content_length, content_type, filename, content_length=None):
+        if writers:
+            raise UnsupportedPhoto('每次签到只能上传一张照片')
+        writer = open_incoming_photo()
+        writers.append(writer)
+        return writer
+
+    parser = FormDataParser(
+        stream_factory=stream_factory,
+        max_form_memory_size=MAX_FORM_MEMORY_SIZE,
+        max_form_parts=MAX_FORM_PARTS,
+        silent=False
+    )
+    try:
+        _, form, files = parser.parse(
+            request.stream, request.mimetype, request.content_length, request.mimetype_params
+        )
+    except Exception:
+        for writer in writers:
+            writer.discard()
+        raise
+
+    photo = None
+    for writer in writers:
+        if 'photo' in files and files['photo'].stream is writer:
+            photo = writer.commit()
+        else:
+            writer.discard()
+    return form.to_dict(), photo
+
+
+def is_upload_reference(photo):
+    """是否为multipart上传的照片引用"""
+    return bool(photo) and photo.startswith(UPLOAD_REFERENCE_PREFIX)
+
+
+def incoming_path(reference):
+    """照片引用对应的文件路径，引用格式不正确时抛出ValueError"""
+    relative = reference[len(UPLOAD_REFERENCE_PREFIX):]
+    directory, _, name = relative.partition('/')
+    if directory != INCOMING_DIR or not name or '/' in name or name.startswith('.'):
+        raise ValueError(f"无效的照片引用: {reference}")
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], INCOMING_DIR, name)
+
+
+def discard_incoming_photo(reference):
+    """删除待处理照片（照片已处理完成，或重复提交时不再需要）"""
+    try:
+        os.remove(incoming_path(reference))
+    except (FileNotFoundError, ValueError):
+        pass
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+签到统计服务
+月度统计由一条按 (日期, 状态) 分组的聚合查询得到，开启 STATISTICS_FROM_ROLLUP 时读取每日签到汇总表；
+逐条的每日签到记录只在请求时返回，并以流式响应输出
+"""
+
+from datetime import date, datetime
+from flask import current_app
+from sqlalchemy import select, func, extract
+from services.record_service import RecordService
+from services.attendance_rollup import RollupService
+from app import db, Attendance, User
+
+# 统计的签到状态
+STATUSES = ('attended', 'late', 'absent')
+
+
+class StatisticsService:
+    """签到统计服务类"""
+
+    @staticmethod
+    def month_filters(year, month, student_id=None):
+        """某月（可限定学生）签到记录的过滤条件"""
+        start_date = datetime(year, month, 1)
+        end_date = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+        filters = [Attendance.signed_at >= start_date, Attendance.signed_at < end_date]
+        if student_id:
+            filters.append(User.student_id == student_id)
+        return filters
+
+    @staticmethod
+    def month_summary(year, month, student_id=None):
+        """
+        月度签到统计
+
+        Returns:
+            dict: 总数、各状态数量、出勤率，以及每日各状态数量 daily_counts {日: {状态: 数量}}
+        """
+        counts = dict.fromkeys(STATUSES, 0)
+        total_count = 0
+        daily_counts = {}
+        for day_value, status, count in StatisticsService._month_day_counts(year, month, student_id):
+            total_count += count
+            if status in counts:
+                counts[status] += count
+            daily = daily_counts.setdefault(int(day_value), {})
+            daily[status] = daily.get(status, 0) + count
+
+        attendance_rate = (counts['attended'] / total_count * 100) if total_count > 0 else 0
+        return {
+            'year': year,
+            'month': month,
+            'total_count': total_count,
+            'attended_count': counts['attended'],
+            'late_count': counts['late'],
+            'absent_count': counts['absent'],
+            'attendance_rate': round(attendance_rate, 1),
+            'daily_counts': daily_counts
+        }
+
+    @staticmethod
+    def _month_day_counts(year, month, student_id=None):
+        """某月每日各状态的签到数 [(日, 状态, 数量)]"""
+        if current_app.config.get('STATISTICS_FROM_ROLLUP', False):
+            start_date = date(year, month, 1)
+            end_date = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+            return [
+                (local_date.day, status, count)
+                for local_date, status, count in RollupService.daily_status_counts(start_date, end_date, student_id)
+            ]
+
+        day = extract('day', Attendance.signed_at)
+        stmt = select(day, Attendance.status, func.count(Attendance.id))
+        if student_id:
+            stmt = stmt.join(User, Attendance.user_id == User.id)
+        stmt = stmt.where(*StatisticsService.month_filters(year, month, student_id)).group_by(day, Attendance.status)
+        return db.session.execute(stmt).all()
+
+    @staticmethod
+    def stream_with_daily_records(summary, student_id=None):
+        """
+        输出带 daily_records {日: [签到记录, ...]} 的统计响应JSON
+
+        签到记录按签到时间顺序分批读取并逐日输出，整个月的记录不会同时存在于内存中。
+        需在 stream_with_context 中使用。
+        """
+        filters = StatisticsService.month_filters(summary['year'], summary['month'], student_id)
+        dumps = current_app.json.dumps
+
+        data = dumps(summary)
+        # 去掉data对象的右括号，在其中追加daily_records
+        yield '{"success":true,"data":' + data[:-1] + ',"daily_records":{'
+
+        current_day = None
+        for record in RecordService.iter_records(filters):
+            day = int(record['signed_at'][8:10])
+            if day != current_day:
+                prefix = '' if current_day is None else '],'
+                current_day = day
+                yield f'{prefix}"{day}":[' + dumps(record)
+            else:
+                yield ',' + dumps(record)
+
+        yield ('' if current_day is None else ']') + '}}}'
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+学生周课表缓存
+为每个学生编译按星期划分的有序时间区间，签到时二分查找当前课程，无需联表查询
+"""
+
+import time
+import logging
+import threading
+from bisect import bisect_right
+from flask import current_app
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from models.course_schedule import Course, CourseSchedule, StudentCourse, week_bit
+from utils.lru_cache import LRUCache
+from utils.version_stamp import read_stamp, write_stamp
+from services.response_cache import invalidate_schedule
+from app import db
+
+logger = logging.getLogger(__name__)
+
+
+def _meets_in_week(week_mask, week):
+    """周次位图是否包含第week周，位图或周次为空时视为上课"""
+    if week is None or week_mask is None:
+        return True
+    return bool(week_mask & week_bit(week))
+
+
+def _to_minutes(value):
+    """将time对象转换为当天的分钟数"""
+    return value.hour * 60 + value.minute
+
+
+class CompiledTimetable:
+    """单个学生编译后的周课表"""
+
+    __slots__ = ('student_id', '_days')
+
+    def __init__(self, student_id, entries):
+        """
+        Args:
+            student_id: 学生ID
+            entries: 课程条目字典列表，需包含 day_of_week、start_minute、end_minute、schedule_id、week_mask
+        """
+        self.student_id = student_id
+        days = {}
+        for entry in entries:
+            days.setdefault(entry['day_of_week'], []).append(entry)
+
+        self._days = {}
+        for day_of_week, day_entries in days.items():
+            day_entries.sort(key=lambda item: (item['start_minute'], item['end_minute'], item['schedule_id']))
+            starts = [entry['start_minute'] for entry in day_entries]
+            # 前缀最大下课时间，二分定位后向前回溯时可以提前结束
+            max_ends = []
+            current_max = -1
+            for entry in day_entries:
+                current_max = max(current_max, entry['end_minute'])
+                max_ends.append(current_max)
+            self._days[day_of_week] = (starts, max_ends, day_entries)
+
+    def find(self, day_of_week, minute, week=None):
+        """
+        查找某天某时刻正在进行的课程
+
+        Args:
+            day_of_week: 星期（与CourseSchedule.day_of_week取值一致）
+            minute: 当天的分钟数
+            week: 教学周，为空时不按周次过滤
+
+        Returns:
+            dict: 课程条目，多门课程重叠时返回开始时间最晚的一门；没有课程时返回None
+        """
+        day = self._days.get(day_of_week)
+        if not day:
+            return None
+
+        starts, max_ends, entries = day
+        position = bisect_right(starts, minute) - 1
+        while position >= 0 and max_ends[position] >= minute:
+            entry = entries[position]
+            if entry['end_minute'] >= minute and _meets_in_week(entry['week_mask'], week):
+                return entry
+            position -= 1
+        return None
+
+    def entries(self, day_of_week=None):
+        """获取课程条目，指定星期时只返回当天的条目（按开始时间排序）"""
+        if day_of_week is not None:
+            day = self._days.get(day_of_week)
+            return list(day[2]) if day else []
+        return [entry for day in self._days.values() for entry in day[2]]
+
+
+class TimetableCache:
+    """
+    学生周课表的进程内LRU缓存
+
+    首次查询某学生时编译课表；该学生选课变化时失效其条目，
+    课程或课程安排变化时清空全部条目，并通过版本戳通知其他工作进程。
+    """
+
+    def __init__(self):
+        self._cache = None
+        self._stamp = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _config(key, default):
+        try:
+            return current_app.config.get(key, default)
+        except RuntimeError:
+            # 在应用上下文外时使用默认值
+            return default
+
+    def _get_cache(self):
+        """获取LRU缓存，版本戳变化时清空"""
+        interval = self._config('TIMETABLE_CACHE_CHECK_INTERVAL', 1.0)
+        if self._cache is not None and time.monotonic() - self._checked_at < interval:
+            return self._cache
+
+        with self._lock:
+            stamp = read_stamp(self._config('TIMETABLE_CACHE_STAMP_PATH', None))
+            if self._cache is None:
+                self._cache = LRUCache(self._config('TIMETABLE_CACHE_SIZE', 20000))
+            elif stamp != self._stamp:
+                self._cache.clear()
+                logger.info("课表缓存版本变化，已清空")
+            self._stamp = stamp
+            self._checked_at = time.monotonic()
+            return self._cache
+
+    @staticmethod
+    def compile(student_id):
+        """从数据库编译学生的周课表（一次联表查询）"""
+        rows = db.session.query(
+            StudentCourse.id.label('student_course_id'),
+            CourseSchedule.id.label('schedule_id'),
+            CourseSchedule.day_of_week,
+            CourseSchedule.start_time,
+            CourseSchedule.end_time,
+            CourseSchedule.building_id,
+            CourseSchedule.classroom,
+            CourseSchedule.week_mask,
+            Course
+        ).join(
+            CourseSchedule, StudentCourse.course_schedule_id == CourseSchedule.id
+        ).join(
+            Course, StudentCourse.course_id == Course.id
+        ).filter(
+            StudentCourse.student_id == student_id
+        ).all()
+
+        entries = [{
+            'student_course_id': row.student_course_id,
+            'schedule_id': row.schedule_id,
+            'day_of_week': row.day_of_week,
+            'start_time': row.start_time,
+            'end_time': row.end_time,
+            'start_minute': _to_minutes(row.start_time),
+            'end_minute': _to_minutes(row.end_time),
+            'building_id': row.building_id,
+            'classroom': row.classroom,
+            'week_mask': row.week_mask,
+            'course': row.Course.to_dict()
+        } for row in rows]
+
+        return CompiledTimetable(student_id, entries)
+
+    def get(self, student_id):
+        """获取学生的周课表，未缓存时编译"""
+        cache = self._get_cache()
+        timetable = cache.get(student_id)
+        if timetable is None:
+            timetable = self.compile(student_id)
+            cache.set(student_id, timetable)
+        return timetable
+
+    def invalidate(self, student_ids=None):
+        """
+        使课表缓存失效并通知其他工作进程
+
+        Args:
+            student_ids: 需要失效的学生ID集合，为空时清空全部
+        """
+        cache = self._get_cache()
+        if student_ids is None:
+            cache.clear()
+        else:
+            for student_id in student_ids:
+                cache.pop(student_id)
+
+        # 其他工作进程无法得知具体学生，收到版本戳变化后清空全部缓存
+        with self._lock:
+            self._stamp = write_stamp(self._config('TIMETABLE_CACHE_STAMP_PATH', None))
+        invalidate_schedule(student_ids)
+
+    def stats(self):
+        """缓存统计"""
+        return self._get_cache().stats()
+
+
+# 进程内缓存实例
+timetable_cache = TimetableCache()
+
+
+def get_student_timetable(student_id):
+    """获取学生编译后的周课表"""
+    return timetable_cache.get(student_id)
+
+
+# 会话提交后失效受影响的课表
+_PENDING_KEY = 'timetable_cache_invalidations'
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_timetable_changes(session, flush_context):
+    """记录本次刷新中变化的选课、课程安排和课程"""
+    pending = session.info.setdefault(_PENDING_KEY, set())
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(instance, StudentCourse):
+            pending.add(instance.student_id)
+            # 学号本身被修改时，原学号的课表同样需要失效
+            history = inspect(instance).attrs.student_id.history
+            pending.update(value for value in history.deleted or () if value)
+        elif isinstance(instance, (CourseSchedule, Course)):
+            pending.add(None)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_timetable_invalidations(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    try:
+        timetable_cache.invalidate(None if None in pending else pending)
+    except Exception as e:
+        logger.warning(f"课表缓存失效失败: {e}")
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_timetable_invalidations(session):
+    session.info.pop(_PENDING_KEY, None)
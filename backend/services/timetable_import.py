@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+课表批量导入
+逐行读取CSV课表，与数据库中已有的课程、课程安排和选课记录比对，
+在一个事务中分批执行插入、更新和删除
+
+CSV为UTF-8编码（可带BOM），首行为表头，每行表示一个课程安排，填写student_id时同时表示该学生选了这个安排：
+    semester, course_code, course_name, course_name_en, credit, teacher_name, teacher_id, department,
+    building, classroom, day_of_week, start_time, end_time, week_numbers, student_id
+其中building可填写建筑ID、中文名称或英文名称，时间格式为HH:MM，周次格式同CourseSchedule.week_numbers。
+
+比对范围为文件中出现的学期：这些学期中文件里没有的课程、课程安排和选课记录会被删除，其他学期的数据不受影响。
+"""
+
+import csv
+import time
+import logging
+from datetime import datetime
+from sqlalchemy import select, insert, update, delete
+from models.course_schedule import Course, CourseSchedule, StudentCourse, ClassSession, parse_week_numbers
+from models.building import Building
+from app import db
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_COLUMNS = (
+    'semester', 'course_code', 'course_name', 'teacher_name',
+    'building', 'classroom', 'day_of_week', 'start_time', 'end_time', 'week_numbers'
+)
+
+# 参与比对的课程字段
+COURSE_FIELDS = ('course_name', 'course_name_en', 'credit', 'teacher_name', 'teacher_id', 'department', 'semester')
+
+# IN 列表每批的最大长度
+IN_CLAUSE_LIMIT = 1000
+
+
+def _chunks(items, size):
+    """按固定大小切分列表"""
+    items = list(items)
+    for offset in range(0, len(items), size):
+        yield items[offset:offset + size]
+
+
+def _parse_time(value):
+    """解析 HH:MM 或 HH:MM:SS"""
+    value = value.strip()
+    return datetime.strptime(value, '%H:%M:%S' if value.count(':') == 2 else '%H:%M').time()
+
+
+def _optional(value):
+    """空字符串视为空值"""
+    value = (value or '').strip()
+    return value or None
+
+
+def _building_lookup():
+    """建筑ID、中文名称、英文名称到建筑ID的映射"""
+    lookup = {}
+    for row in db.session.execute(select(Building.id, Building.name, Building.name_en)):
+        lookup[str(row.id)] = row.id
+        lookup[row.name] = row.id
+        lookup[row.name_en] = row.id
+    return lookup
+
+
+class TimetableImport:
+    """单次课表导入，read解析文件，apply比对并写入数据库"""
+
+    def __init__(self, chunk_size=1000):
+        self.chunk_size = chunk_size
+        self.courses = {}      # course_code -> 课程字段
+        self.schedules = {}    # (course_code, day_of_week, start_time, building_id, classroom) -> 安排字段
+        self.enrollments = {}  # (student_id, course_code) -> 安排键
+        self.stats = {
+            'rows': 0,
+            'errors': 0,
+            'conflicts': 0,
+            'courses': {'inserted': 0, 'updated': 0, 'deleted': 0},
+            'schedules': {'inserted': 0, 'updated': 0, 'deleted': 0},
+            'enrollments': {'inserted': 0, 'updated': 0, 'deleted': 0}
+        }
+
+    def read(self, csv_file):
+        """
+        逐行解析CSV，按自然键去重后保存在内存中
+
+        Args:
+            csv_file: 已打开的文本文件对象
+        """
+        buildings = _building_lookup()
+        # 列数不足的行缺少的字段按空字符串处理，由逐行校验记为无法导入
+        reader = csv.DictReader(csv_file, restval='')
+        missing = [column for column in REQUIRED_COLUMNS if column not in (reader.fieldnames or ())]
+        if missing:
+            raise ValueError(f"CSV缺少列: {', '.join(missing)}")
+
+        for line_number, row in enumerate(reader, start=2):
+            self.stats['rows'] += 1
+            try:
+                self._read_row(row, buildings)
+            except (ValueError, KeyError) as e:
+                self.stats['errors'] += 1
+                logger.warning(f"课表第 {line_number} 行无法导入: {e}")
+
+    def _read_row(self, row, buildings):
+        """解析一行课表"""
+        course_code = row['course_code'].strip()
+        building = row['building'].strip()
+        if building not in buildings:
+            raise ValueError(f"未知建筑: {building}")
+
+        week_numbers = row['week_numbers'].strip()
+        credit = _optional(row.get('credit'))
+        course = {
+            'course_code': course_code,
+            'course_name': row['course_name'].strip(),
+            'course_name_en': _optional(row.get('course_name_en')),
+            'credit': float(credit) if credit else 0.0,
+            'teacher_name': row['teacher_name'].strip(),
+            'teacher_id': _optional(row.get('teacher_id')),
+            'department': _optional(row.get('department')),
+            'semester': row['semester'].strip()
+        }
+        schedule = {
+            'day_of_week': int(row['day_of_week']),
+            'start_time': _parse_time(row['start_time']),
+            'end_time': _parse_time(row['end_time']),
+            'building_id': buildings[building],
+            'classroom': row['classroom'].strip(),
+            'week_numbers': week_numbers,
+            # 批量写入不经过ORM校验器，需要在这里编译周次位图
+            'week_mask': parse_week_numbers(week_numbers)
+        }
+
+        self.courses[course_code] = course
+        schedule_key = (course_code, schedule['day_of_week'], schedule['start_time'],
+                        schedule['building_id'], schedule['classroom'])
+        self.schedules[schedule_key] = schedule
+
+        student_id = _optional(row.get('student_id'))
+        if student_id:
+            enrollment_key = (student_id, course_code)
+            # 每个学生每门课只能关联一个课程安排，以先出现的为准
+            if self.enrollments.setdefault(enrollment_key, schedule_key) != schedule_key:
+                self.stats['conflicts'] += 1
+
+    def apply(self):
+        """比对数据库中的已有数据，分批执行插入、更新和删除（调用方负责提交或回滚）"""
+        semesters = {course['semester'] for course in self.courses.values()}
+        course_ids = self._apply_courses(semesters)
+        schedule_ids = self._apply_schedules(course_ids)
+        self._apply_enrollments(course_ids, schedule_ids)
+        self._delete_stale(course_ids, schedule_ids)
+
+    def _select_in(self, statement, column, values):
+        """按IN条件分批查询"""
+        for chunk in _chunks(values, IN_CLAUSE_LIMIT):
+            yield from db.session.execute(statement.where(column.in_(chunk)))
+
+    def _execute_batches(self, statement, rows):
+        """分批执行批量插入或按主键批量更新"""
+        for chunk in _chunks(rows, self.chunk_size):
+            db.session.execute(statement, chunk)
+
+    def _delete_ids(self, model, ids):
+        """按主键分批删除"""
+        for chunk in _chunks(ids, IN_CLAUSE_LIMIT):
+            db.session.execute(delete(model).where(model.id.in_(chunk)))
+
+    def _apply_courses(self, semesters):
+        """比对课程，返回比对范围内课程代码到ID的映射"""
+        columns = (Course.id, Course.course_code) + tuple(getattr(Course, field) for field in COURSE_FIELDS)
+        existing = {row.course_code: row for row in self._select_in(select(*columns), Course.semester, semesters)}
+        existing.update(
+            (row.course_code, row) for row in self._select_in(select(*columns), Course.course_code, self.courses)
+        )
+
+        inserts, updates = [], []
+        for course_code, course in self.courses.items():
+            row = existing.get(course_code)
+            if row is None:
+                inserts.append(course)
+            elif any(getattr(row, field) != course[field] for field in COURSE_FIELDS):
+                updates.append(dict(course, id=row.id))
+
+        self._execute_batches(insert(Course), inserts)
+        self._execute_batches(update(Course), updates)
+        self.stats['courses']['inserted'] = len(inserts)
+        self.stats['courses']['updated'] = len(updates)
+
+        course_ids = {course_code: row.id for course_code, row in existing.items()}
+        if inserts:
+            course_ids.update(
+                (row.course_code, row.id) for row in self._select_in(
+                    select(Course.id, Course.course_code), Course.course_code, [course['course_code'] for course in inserts]
+                )
+            )
+        return course_ids
+
+    def _apply_schedules(self, course_ids):
+        """比对课程安排，返回安排键到ID的映射"""
+        codes_by_id = {course_id: course_code for course_code, course_id in course_ids.items()}
+        existing = {}
+        for row in self._select_in(select(
+            CourseSchedule.id, CourseSchedule.course_id, CourseSchedule.day_of_week, CourseSchedule.start_time,
+            CourseSchedule.end_time, CourseSchedule.building_id, CourseSchedule.classroom,
+            CourseSchedule.week_numbers, CourseSchedule.week_mask
+        ), CourseSchedule.course_id, codes_by_id):
+            key = (codes_by_id[row.course_id], row.day_of_week, row.start_time, row.building_id, row.classroom)
+            existing[key] = row
+
+        inserts, updates = [], []
+        schedule_ids = {}
+        for key, schedule in self.schedules.items():
+            row = existing.get(key)
+            if row is None:
+                inserts.append(dict(schedule, course_id=course_ids[key[0]]))
+                continue
+            schedule_ids[key] = row.id
+            if (row.end_time, row.week_numbers, row.week_mask) != (
+                    schedule['end_time'], schedule['week_numbers'], schedule['week_mask']):
+                updates.append({
+                    'id': row.id,
+                    'end_time': schedule['end_time'],
+                    'week_numbers': schedule['week_numbers'],
+                    'week_mask': schedule['week_mask']
+                })
+
+        self._execute_batches(insert(CourseSchedule), inserts)
+        self._execute_batches(update(CourseSchedule), updates)
+        self.stats['schedules']['inserted'] = len(inserts)
+        self.stats['schedules']['updated'] = len(updates)
+
+        if inserts:
+            new_course_ids = {schedule['course_id'] for schedule in inserts}
+            for row in self._select_in(select(
+                CourseSchedule.id, CourseSchedule.course_id, CourseSchedule.day_of_week,
+                CourseSchedule.start_time, CourseSchedule.building_id, CourseSchedule.classroom
+            ), CourseSchedule.course_id, new_course_ids):
+                key = (codes_by_id.get(row.course_id), row.day_of_week, row.start_time, row.building_id, row.classroom)
+                if key in self.schedules and key not in schedule_ids:
+                    schedule_ids[key] = row.id
+        return schedule_ids
+
+    def _apply_enrollments(self, course_ids, schedule_ids):
+        """比对选课记录"""
+        codes_by_id = {course_id: course_code for course_code, course_id in course_ids.items()}
+        existing = {}
+        for row in self._select_in(select(
+            StudentCourse.id, StudentCourse.student_id, StudentCourse.course_id,
+            StudentCourse.course_schedule_id, StudentCourse.status
+        ), StudentCourse.course_id, codes_by_id):
+            existing[(row.student_id, codes_by_id[row.course_id])] = row
+
+        inserts, updates = [], []
+        for key, schedule_key in self.enrollments.items():
+            schedule_id = schedule_ids[schedule_key]
+            row = existing.pop(key, None)
+            if row is None:
+                inserts.append({
+                    'student_id': key[0],
+                    'course_id': course_ids[key[1]],
+                    'course_schedule_id': schedule_id,
+                    'status': 'active'
+                })
+            elif row.course_schedule_id != schedule_id or row.status != 'active':
+                updates.append({'id': row.id, 'course_schedule_id': schedule_id, 'status': 'active'})
+
+        # 必须先删除不再存在的选课记录，再删除它们引用的课程安排
+        self._delete_ids(StudentCourse, [row.id for row in existing.values()])
+        self._execute_batches(update(StudentCourse), updates)
+        self._execute_batches(insert(StudentCourse), inserts)
+        self.stats['enrollments']['inserted'] = len(inserts)
+        self.stats['enrollments']['updated'] = len(updates)
+        self.stats['enrollments']['deleted'] = len(existing)
+
+    def _delete_stale(self, course_ids, schedule_ids):
+        """删除比对范围内文件中不存在的课程安排和课程（批量删除不经过ORM级联，需按外键顺序处理）"""
+        stale_courses = [course_id for course_code, course_id in course_ids.items() if course_code not in self.courses]
+        stale_schedules = []
+        kept = set(schedule_ids.values())
+        for row in self._select_in(select(CourseSchedule.id), CourseSchedule.course_id, course_ids.values()):
+            if row.id not in kept:
+                stale_schedules.append(row.id)
+
+        # 这些课程的选课记录已在比对选课时删除
+        for chunk in _chunks(stale_schedules, IN_CLAUSE_LIMIT):
+            db.session.execute(
+                update(StudentCourse).where(StudentCourse.course_schedule_id.in_(chunk)).values(course_schedule_id=None)
+            )
+            db.session.execute(delete(ClassSession).where(ClassSession.course_schedule_id.in_(chunk)))
+        self._delete_ids(CourseSchedule, stale_schedules)
+        self._delete_ids(Course, stale_courses)
+
+        self.stats['schedules']['deleted'] = len(stale_schedules)
+        self.stats['courses']['deleted'] = len(stale_courses)
+
+
+def import_timetable(csv_file, chunk_size=1000, dry_run=False):
+    """
+    导入课表
+
+    Args:
+        csv_file: 已打开的CSV文本文件对象
+        chunk_size: 每批写入的行数
+        dry_run: 只比对不提交
+
+    Returns:
+        dict: 导入统计，含各表插入/更新/删除数量、出错行数和耗时
+    """
+    started = time.time()
+    job = TimetableImport(chunk_size)
+    job.read(csv_file)
+    read_seconds = time.time() - started
+
+    try:
+        job.apply()
+        if dry_run:
+            db.session.rollback()
+        else:
+            db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    if not dry_run:
+        # 批量语句不经过ORM事件，需要手动通知课表缓存
+        from services.timetable_cache import timetable_cache
+        timetable_cache.invalidate()
+
+    stats = job.stats
+    stats['read_seconds'] = read_seconds
+    stats['seconds'] = time.time() - started
+    stats['rows_per_second'] = stats['rows'] / stats['seconds'] if stats['seconds'] else 0
+    logger.info(f"课表导入完成: {stats}")
+    return stats
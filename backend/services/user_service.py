@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+用户服务
+签到时按学号取得用户ID：进程内LRU缓存命中时不查询数据库，未命中时用一条按数据库方言生成的upsert语句完成查找或创建
+"""
+
+import logging
+import threading
+from flask import current_app
+from sqlalchemy import insert, select, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects import mysql, sqlite, postgresql
+from utils.lru_cache import LRUCache
+from app import db, User
+
+logger = logging.getLogger(__name__)
+
+
+class UserConflict(ValueError):
+    """企业微信用户ID已关联其他学号"""
+
+
+class UserService:
+    """用户服务类"""
+
+    _cache = None
+    _cache_lock = threading.Lock()
+
+    @classmethod
+    def _get_cache(cls):
+        if cls._cache is None:
+            with cls._cache_lock:
+                if cls._cache is None:
+                    cls._cache = LRUCache(current_app.config.get('USER_CACHE_SIZE', 50000))
+        return cls._cache
+
+    @staticmethod
+    def get_or_create_user_id(student_id, name, wechat_userid=None, commit=True):
+        """
+        按学号获取用户ID，用户不存在时创建（已存在的用户不修改姓名等信息）
+
+        同一学生的并发首次签到由数据库唯一约束合并为同一条用户记录，不会因冲突失败。
+
+        Args:
+            student_id: 学号
+            name: 姓名
+            wechat_userid: 企业微信用户ID
+            commit: 为False时在调用方的事务中执行，不提交也不写入缓存，
+                    调用方提交后用 remember_user_id 写入缓存
+
+        Returns:
+            int: 用户ID
+
+        Raises:
+            UserConflict: 企业微信用户ID已关联其他学号
+        """
+        cache = UserService._get_cache()
+        user_id = cache.get(student_id)
+        if user_id is not None:
+            return user_id
+
+        user_id = UserService._upsert(student_id, name, wechat_userid, commit)
+        if commit:
+            cache.set(student_id, user_id)
+        return user_id
+
+    @staticmethod
+    def remember_user_id(student_id, user_id):
+        """缓存已提交的用户ID"""
+        UserService._get_cache().set(student_id, user_id)
+
+    @staticmethod
+    def cached_user_id(student_id):
+        """只从缓存取用户ID，未缓存时返回None（不访问数据库）"""
+        return UserService._get_cache().get(student_id)
+
+    @staticmethod
+    def _upsert(student_id, name, wechat_userid, commit=True):
+        """
+        执行upsert并提交（commit为False时不提交，失败时由调用方回滚），返回用户ID
+
+        只按学号合并已有用户；企业微信用户ID与其他学号的用户冲突时各数据库都抛出 UserConflict
+        """
+        values = {'student_id': student_id, 'name': name, 'wechat_userid': wechat_userid}
+        dialect = db.session.get_bind().dialect
+
+        try:
+            if dialect.name == 'mysql':
+                # 冲突时令LAST_INSERT_ID返回已有行的ID，插入与查找都只需一次往返
+                stmt = mysql.insert(User).values(**values)
+                stmt = stmt.on_duplicate_key_update(id=func.last_insert_id(User.id))
+                user_id = db.session.execute(stmt).lastrowid
+                # ON DUPLICATE KEY对任一唯一键生效，企业微信用户ID冲突时返回的是其他学生的ID
+                owner = db.session.execute(select(User.student_id).where(User.id == user_id)).scalar()
+                if owner != student_id:
+                    raise UserConflict(f"企业微信用户 {wechat_userid} 已关联学号 {owner}")
+            elif dialect.name in ('sqlite', 'postgresql') and dialect.insert_returning:
+                # DO NOTHING时冲突行不会被RETURNING返回，用一次无实际变化的更新取回已有行的ID
+                module = sqlite if dialect.name == 'sqlite' else postgresql
+                stmt = module.insert(User).values(**values)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[User.student_id],
+                    set_={'student_id': stmt.excluded.student_id}
+                ).returning(User.id)
+                try:
+                    with db.session.begin_nested():
+                        user_id = db.session.execute(stmt).scalar_one()
+                except IntegrityError:
+                    UserService._raise_conflict(values)
+                    raise
+            else:
+                user_id = UserService._insert_or_select(values)
+            if commit:
+                db.session.commit()
+        except Exception:
+            if commit:
+                db.session.rollback()
+            raise
+        return user_id
+
+    @staticmethod
+    def _insert_or_select(values):
+        """不支持upsert语法的数据库：先查询，不存在时插入，唯一约束冲突时重新查询"""
+        query = select(User.id).where(User.student_id == values['student_id'])
+        user_id = db.session.execute(query).scalar()
+        if user_id is not None:
+            return user_id
+        try:
+            with db.session.begin_nested():
+                return db.session.execute(insert(User).values(**values)).inserted_primary_key[0]
+        except IntegrityError:
+            user_id = db.session.execute(query).scalar()
+            if user_id is None:
+                UserService._raise_conflict(values)
+                raise
+            return user_id
+
+    @staticmethod
+    def _raise_conflict(values):
+        """企业微信用户ID已由其他学号的用户使用时抛出 UserConflict"""
+        if not values.get('wechat_userid'):
+            return
+        owner = db.session.execute(
+            select(User.student_id).where(User.wechat_userid == values['wechat_userid'])
+        ).scalar()
+        if owner is not None and owner != values['student_id']:
+            raise UserConflict(f"企业微信用户 {values['wechat_userid']} 已关联学号 {owner}")
+
+    @staticmethod
+    def forget(student_id=None):
+        """从缓存中移除学生，为空时清空缓存（删除或合并用户后调用）"""
+        cache = UserService._get_cache()
+        if student_id is None:
+            cache.clear()
+        else:
+            cache.pop(student_id)
+
+    @staticmethod
+    def cache_stats():
+        """缓存命中统计"""
+        return UserService._get_cache().stats()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+地理距离计算工具，提供不同精度与开销的距离算法
+"""
+
+import math
+import numpy as np
+from geopy.distance import geodesic
+
+# 平均地球半径（米，IUGG）
+EARTH_RADIUS_METERS = 6371008.8
+
+# 默认距离算法
+DEFAULT_DISTANCE_STRATEGY = 'geodesic'
+
+
+def geodesic_distance(lat1, lon1, lat2, lon2):
+    """
+    WGS-84椭球测地线距离（Karney迭代算法，精度最高，开销最大）
+
+    Returns:
+        float: 距离（米）
+    """
+    return geodesic((lat1, lon1), (lat2, lon2)).meters
+
+
+def haversine_distance(lat1, lon1, lat2, lon2):
+    """
+    球面大圆距离（haversine公式）
+
+    Returns:
+        float: 距离（米）
+    """
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * math.asin(math.sqrt(min(1.0, a)))
+
+
+def equirectangular_distance(lat1, lon1, lat2, lon2):
+    """
+    局部等距圆柱投影距离，以两点平均纬度展开为平面，适用于短距离
+
+    Returns:
+        float: 距离（米）
+    """
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    x = math.radians(lon2 - lon1) * math.cos((phi1 + phi2) / 2)
+    y = phi2 - phi1
+    return EARTH_RADIUS_METERS * math.sqrt(x * x + y * y)
+
+
+def haversine_distance_matrix(latitudes, longitudes, target_latitudes, target_longitudes):
+    """
+    批量计算球面大圆距离，利用NumPy广播得到所有点对的距离
+
+    Args:
+        latitudes, longitudes: 点坐标数组，长度为 n
+        target_latitudes, target_longitudes: 目标坐标数组，长度为 m
+
+    Returns:
+        ndarray: 形状为 (n, m) 的距离矩阵（米）
+    """
+    phi1 = np.radians(np.asarray(latitudes, dtype=float))[:, np.newaxis]
+    lambda1 = np.radians(np.asarray(longitudes, dtype=float))[:, np.newaxis]
+    phi2 = np.radians(np.asarray(target_latitudes, dtype=float))[np.newaxis, :]
+    lambda2 = np.radians(np.asarray(target_longitudes, dtype=float))[np.newaxis, :]
+
+    a = np.sin((phi2 - phi1) / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin((lambda2 - lambda1) / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * np.arcsin(np.sqrt(np.minimum(1.0, a)))
+
+
+def equirectangular_distance_matrix(latitudes, longitudes, target_latitudes, target_longitudes):
+    """
+    批量计算局部等距圆柱投影距离，参数与返回值同 haversine_distance_matrix
+    """
+    phi1 = np.radians(np.asarray(latitudes, dtype=float))[:, np.newaxis]
+    lambda1 = np.radians(np.asarray(longitudes, dtype=float))[:, np.newaxis]
+    phi2 = np.radians(np.asarray(target_latitudes, dtype=float))[np.newaxis, :]
+    lambda2 = np.radians(np.asarray(target_longitudes, dtype=float))[np.newaxis, :]
+
+    x = (lambda2 - lambda1) * np.cos((phi1 + phi2) / 2)
+    y = phi2 - phi1
+    return EARTH_RADIUS_METERS * np.sqrt(x * x + y * y)
+
+
+DISTANCE_STRATEGIES = {
+    'geodesic': geodesic_distance,
+    'haversine': haversine_distance,
+    'equirectangular': equirectangular_distance
+}
+
+# 可向量化的距离算法；测地线没有闭式解，批量计算时需逐对精算
+DISTANCE_MATRIX_STRATEGIES = {
+    'haversine': haversine_distance_matrix,
+    'equirectangular': equirectangular_distance_matrix
+}
+
+
+def get_distance_strategy(strategy=None):
+    """
+    获取距离算法名称
+
+    Args:
+        strategy: 算法名称（geodesic/haversine/equirectangular），
+                  为空时读取应用配置 DISTANCE_STRATEGY
+
+    Returns:
+        str: 校验过的算法名称
+    """
+    if strategy is None:
+        try:
+            from flask import current_app
+            strategy = current_app.config.get('DISTANCE_STRATEGY', DEFAULT_DISTANCE_STRATEGY)
+        except RuntimeError:
+            # 在应用上下文外时使用默认算法
+            strategy = DEFAULT_DISTANCE_STRATEGY
+
+    if strategy not in DISTANCE_STRATEGIES:
+        raise ValueError(f"未知的距离算法: {strategy}，可选: {', '.join(DISTANCE_STRATEGIES)}")
+    return strategy
+
+
+def get_distance_function(strategy=None):
+    """
+    获取距离计算函数
+
+    Args:
+        strategy: 算法名称，为空时读取应用配置 DISTANCE_STRATEGY
+
+    Returns:
+        callable: distance(lat1, lon1, lat2, lon2) -> 米
+    """
+    return DISTANCE_STRATEGIES[get_distance_strategy(strategy)]
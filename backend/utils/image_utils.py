@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图片处理工具，按上传配置缩放、重新压缩照片并生成缩略图
+"""
+
+import io
+from PIL import Image, ImageOps, UnidentifiedImageError
+from config import UPLOAD_CONFIG
+
+
+def _to_jpeg(image, quality):
+    """编码为渐进式JPEG"""
+    output = io.BytesIO()
+    image.save(output, 'JPEG', quality=quality, optimize=True, progressive=True)
+    return output.getvalue()
+
+
+def process_photo(image_data, upload_config=None):
+    """
+    按上传配置处理照片：按EXIF方向摆正，等比缩小到最大宽高以内，重新压缩为JPEG，并生成缩略图
+
+    Args:
+        image_data: 原始图片字节或图片文件路径（从文件读取时不需要先把整个文件读入内存）
+        upload_config: 上传配置，默认使用 config.UPLOAD_CONFIG
+
+    Returns:
+        tuple: (照片JPEG字节, 缩略图JPEG字节)
+
+    Raises:
+        ValueError: 数据不是可识别的图片
+    """
+    upload_config = upload_config or UPLOAD_CONFIG
+    quality = upload_config.get('image_quality', 85)
+
+    source = image_data if isinstance(image_data, str) else io.BytesIO(image_data)
+    try:
+        with Image.open(source) as opened:
+            # 大图按JPEG缩放解码，减少内存与CPU开销
+            opened.draft('RGB', (upload_config['max_width'], upload_config['max_height']))
+            # 返回摆正后的副本，关闭文件后仍可使用
+            image = ImageOps.exif_transpose(opened)
+    except (UnidentifiedImageError, OSError) as e:
+        raise ValueError(f"无法识别的图片: {e}")
+
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    # thumbnail只会缩小，不会放大
+    image.thumbnail((upload_config['max_width'], upload_config['max_height']), Image.LANCZOS)
+    photo = _to_jpeg(image, quality)
+
+    image.thumbnail(tuple(upload_config['thumbnail_size']), Image.LANCZOS)
+    thumbnail = _to_jpeg(image, quality)
+    return photo, thumbnail
@@ -64,4 +64,18 @@ def get_status_text(is_valid, language='zh'):
     if language == 'en':
         return "Within range" if is_valid else "Out of range"
     else:
-        return "位置已知" if is_valid else "位置未知"
\ No newline at end of file
+        return "位置已知" if is_valid else "位置未知"
+
+def detect_location_language(location_text):
+    """
+    根据已生成的位置信息推断其语言，用于按原语言重新生成
+    
+    Args:
+        location_text: 位置信息文本
+    
+    Returns:
+        str: 语言代码 ('zh' 或 'en')
+    """
+    if location_text and location_text.isascii():
+        return 'en'
+    return 'zh'
\ No newline at end of file
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+跨进程版本戳文件，用于通知各工作进程刷新进程内缓存
+"""
+
+import os
+import uuid
+
+
+def read_stamp(path):
+    """
+    读取版本戳
+
+    Returns:
+        str: 版本戳，文件不存在或路径为空时返回None
+    """
+    if not path:
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def write_stamp(path):
+    """
+    原子地写入新的版本戳
+
+    Returns:
+        str: 新的版本戳
+    """
+    stamp = uuid.uuid4().hex
+    if path:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(stamp)
+        os.replace(temp_path, path)
+    return stamp
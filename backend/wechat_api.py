@@ -14,6 +14,8 @@ import random
 from datetime import datetime, timedelta
 from flask import current_app
 from functools import wraps
+from requests.adapters import HTTPAdapter
+from config import WECHAT_API_CONFIG
 
 class WeChatAPI:
     """企业微信API封装类"""
@@ -33,11 +35,16 @@ class WeChatAPI:
         self.token_expires_at = None
         self.jsapi_ticket = None
         self.ticket_expires_at = None
+        # 复用连接，照片处理线程并发下载媒体文件时不必每次重新建立TLS连接
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=WECHAT_API_CONFIG['pool_maxsize'])
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
     
     def _make_request(self, method, url, **kwargs):
         """统一的HTTP请求方法"""
         try:
-            response = requests.request(method, url, timeout=30, **kwargs)
+            response = self.session.request(method, url, timeout=WECHAT_API_CONFIG['timeout'], **kwargs)
             response.raise_for_status()
             return response.json()
         except requests.RequestException as e:
@@ -302,7 +309,32 @@ class WeChatAPI:
             raise
     
     def download_media(self, media_id):
-        """下载多媒体文件"""
+        """下载多媒体文件，返回文件内容（照片处理请使用 download_media_to 流式写入文件）"""
+        chunks = []
+
+        class _Collector:
+            def write(self, chunk):
+                chunks.append(chunk)
+
+        if not self.download_media_to(media_id, _Collector()):
+            return None
+        return b''.join(chunks)
+
+    def download_media_to(self, media_id, writer, max_size=None, deadline=None):
+        """
+        流式下载多媒体文件，按块写入writer
+
+        Args:
+            media_id: 媒体文件ID（serverId）
+            writer: 具有write方法的对象，可以在write中检查文件头或大小并抛出ValueError中止下载
+            max_size: 文件大小上限（字节），为空时不限制
+            deadline: 整个下载的时长上限（秒），默认 WECHAT_API_CONFIG['media_deadline']
+
+        Returns:
+            bool: 是否下载成功；失败时writer中可能已写入部分数据，由调用方丢弃
+        """
+        deadline = deadline or WECHAT_API_CONFIG['media_deadline']
+        expires_at = time.monotonic() + deadline
         access_token = self.get_access_token()
         
         url = f"{self.base_url}/media/get"
@@ -312,28 +344,44 @@ class WeChatAPI:
         }
         
         try:
-            response = requests.get(url, params=params, timeout=30)
-            response.raise_for_status()
+            # timeout只限制连接与两次读取之间的间隔，总时长由deadline控制
+            with self.session.get(url, params=params, stream=True, timeout=WECHAT_API_CONFIG['timeout']) as response:
+                response.raise_for_status()
+                
+                # 检查响应是否为图片数据
+                content_type = response.headers.get('content-type', '')
+                if not content_type.startswith('image/'):
+                    # 如果不是图片，可能是错误响应（JSON）
+                    try:
+                        error_data = json.loads(response.raw.read(64 * 1024, decode_content=True))
+                        error_msg = f"Failed to download media: {error_data.get('errmsg', 'Unknown error')}"
+                        current_app.logger.error(error_msg)
+                    except ValueError:
+                        current_app.logger.error(f"Failed to download media: Invalid response")
+                    return False
+                
+                content_length = response.headers.get('content-length')
+                if max_size is not None and content_length and int(content_length) > max_size:
+                    current_app.logger.error(f"Media too large: {media_id} ({content_length} bytes)")
+                    return False
+                
+                size = 0
+                for chunk in response.iter_content(WECHAT_API_CONFIG['media_chunk_size']):
+                    size += len(chunk)
+                    if max_size is not None and size > max_size:
+                        current_app.logger.error(f"Media too large: {media_id} (over {max_size} bytes)")
+                        return False
+                    if time.monotonic() > expires_at:
+                        current_app.logger.error(f"Media download exceeded {deadline}s: {media_id}")
+                        return False
+                    writer.write(chunk)
             
-            # 检查响应是否为图片数据
-            content_type = response.headers.get('content-type', '')
-            if content_type.startswith('image/'):
-                current_app.logger.info(f"Media downloaded successfully: {media_id}")
-                return response.content
-            else:
-                # 如果不是图片，可能是错误响应
-                try:
-                    error_data = response.json()
-                    error_msg = f"Failed to download media: {error_data.get('errmsg', 'Unknown error')}"
-                    current_app.logger.error(error_msg)
-                    return None
-                except:
-                    current_app.logger.error(f"Failed to download media: Invalid response")
-                    return None
+            current_app.logger.info(f"Media downloaded successfully: {media_id} ({size} bytes)")
+            return True
                     
         except Exception as e:
             current_app.logger.error(f"Error downloading media: {e}")
-            return None
+            return False
 
 # 全局实例 - 延迟初始化
 wechat_api = None
@@ -6,6 +6,7 @@ class SignInPage {
         this.currentLocation = null;
         this.timeInterval = null;
         this.isSigningIn = false;
+        this.signinRequestKey = null; // 本次签到的幂等键，网络重试时沿用，避免重复签到
         this.map = null;
         this.userMarker = null;
         this.buildingMarker = null;
@@ -1045,6 +1046,7 @@ class SignInPage {
     // 重置表单
     resetForm() {
         this.currentPhoto = null;
+        this.signinRequestKey = null;
         
         const photoUpload = document.getElementById('photoUpload');
         const courseInput = document.getElementById('courseName');
@@ -1126,6 +1128,7 @@ class SignInPage {
                             }
                             
                             this.currentPhoto = dataUrl;
+                            this.signinRequestKey = null; // 重新拍照视为新的签到
                             this.validateForm();
                             
                             Utils.hideLoading(loadingMessage);
@@ -1181,6 +1184,31 @@ class SignInPage {
         return isValid;
     }
     
+    // 以multipart提交签到，照片作为文件上传
+    async submitSigninForm(signinData, photoDataUrl) {
+        const photoBlob = await (await fetch(photoDataUrl)).blob();
+        const formData = new FormData();
+        Object.entries(signinData).forEach(([key, value]) => {
+            if (key !== 'photo' && value !== undefined && value !== null) {
+                formData.append(key, value);
+            }
+        });
+        formData.append('photo', photoBlob, 'signin.jpg');
+        
+        const response = await fetch(`${CONFIG.API_BASE_URL}/signin`, {
+            method: 'POST',
+            headers: {
+                'ngrok-skip-browser-warning': 'true'
+            },
+            body: formData
+        });
+        
+        if (!response.ok) {
+            throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+        }
+        return await response.json();
+    }
+    
     // 提交签到
     async submitSignin() {
         if (this.isSigningIn) {
@@ -1239,6 +1267,13 @@ class SignInPage {
                 }
             }
             
+            // 同一次签到的重试使用相同的幂等键，服务端会重放第一次的结果
+            if (!this.signinRequestKey) {
+                this.signinRequestKey = (window.crypto && crypto.randomUUID)
+                    ? crypto.randomUUID()
+                    : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+            }
+            
             // 准备签到数据
             const signinData = {
                 student_id: appState.userInfo?.student_id,
@@ -1251,20 +1286,27 @@ class SignInPage {
                 location_address: this.currentLocation?.address,
                 wechat_userid: appState.userInfo?.wechat_userid,
                 timestamp: new Date().toISOString(),
-                language: appState.currentLanguage // 添加当前界面语言
+                language: appState.currentLanguage, // 添加当前界面语言
+                request_key: this.signinRequestKey
             };
     
             console.log('提交签到数据:', signinData);
             
             // 位置验证功能已移除，直接进行签到
             
-            // 提交到后端
-            const result = await Utils.request('/signin', {
-                method: 'POST',
-                body: JSON.stringify(signinData)
-            });
+            // 提交到后端：拍摄的照片以文件上传（multipart），避免base64放大请求体
+            let result;
+            if (photoData && photoData.startsWith('data:image/')) {
+                result = await this.submitSigninForm(signinData, photoData);
+            } else {
+                result = await Utils.request('/signin', {
+                    method: 'POST',
+                    body: JSON.stringify(signinData)
+                });
+            }
             
             if (result.success) {
+                this.signinRequestKey = null;
                 Utils.hideLoading(loadingMessage);
                 Utils.showMessage(Utils.t('signin_success'), 'success', 3000);
                 this.hideSigninModal();
@@ -272,7 +272,8 @@ class RecordsPage {
                     location: record.location_address || record.classroom,
                     status: record.status,
                     time: record.signed_at,
-                    photo: record.photo_path ? `/api/uploads/${record.photo_path}` : null
+                    photo: record.photo_path ? `/api/uploads/${record.photo_path}` : null,
+                    thumbnail: record.thumbnail_url
                 }));
             } else {
                 // 如果API调用失败，显示空状态
@@ -560,7 +561,7 @@ class RecordsPage {
             }[record.status] || record.status;
             
             const photoCell = record.photo ? 
-                `<img src="${record.photo}" alt="签到照片" class="photo-thumbnail" onclick="window.showPhotoPreview('${record.photo}', '签到照片')" style="cursor: pointer;">` : 
+                `<img src="${record.thumbnail || record.photo}" alt="签到照片" class="photo-thumbnail" loading="lazy" onclick="window.showPhotoPreview('${record.photo}', '签到照片')" style="cursor: pointer;">` : 
                 '<span class="text-gray-400">-</span>';
             
             return `
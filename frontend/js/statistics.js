@@ -179,6 +179,7 @@ class StatisticsPage {
                         classroom: record.classroom || record.location_address,
                         status: record.status,
                         photo: record.photo_path ? `/api/uploads/${record.photo_path}` : null,
+                        thumbnail: record.thumbnail_url,
                         location_address: record.location_address, // 添加详细位置信息
                         location: {
                             latitude: record.latitude,
@@ -365,7 +366,7 @@ class StatisticsPage {
         
         // 处理照片显示
         const photoCell = record.photo ? 
-            `<img src="${record.photo}" alt="签到照片" class="detail-photo" onclick="window.showPhotoPreview('${record.photo}', '签到照片')" style="cursor: pointer; max-width: 100px; max-height: 100px; border-radius: 4px;">` : 
+            `<img src="${record.thumbnail || record.photo}" alt="签到照片" class="detail-photo" onclick="window.showPhotoPreview('${record.photo}', '签到照片')" style="cursor: pointer; max-width: 100px; max-height: 100px; border-radius: 4px;">` : 
             '<span class="text-gray-400">无照片</span>';
         
         // 导航按钮HTML